@@ -1,6 +1,4 @@
 
-import random
-import numpy as np
 from mesa import Agent
 
 from Tools import RelativeAgreement, SimplePayback
@@ -12,13 +10,14 @@ class BuildingAgent(Agent):
     """
     Creates a building owner agent.
     """    
-    def __init__(self, unique_id, model, block, el_demand, pv_potential, pv_sf, pv_sc, is_extremist = None, seed=None):
+    def __init__(self, unique_id, model, block, block_id, el_demand, pv_potential, pv_sf, pv_sc, is_extremist = None, seed=None):
         '''
         Initializes all the attributes of the building owner agent.
         Inputs:
             self : agent object
             model : model object
             block : string, building block unique identifier
+            block_id : integer, code of the community block (-1 if none)
             el_demand : integer, annual electricity demand [kWh]
             pv_sf : float, scaling factor of PV system size agent may buy [-]
             pv_sc : float, fraction of solar electricity self-consumed [-]
@@ -34,8 +33,8 @@ class BuildingAgent(Agent):
         # Currently, all agents take the same values defined for model
         self.block = block
 
-        # Defining a list of contacts for the given agent from a given network
-        self.connection_list = [n for n in model.net.neighbors(unique_id)]
+        # Contacts of the given agent, a slice of the CSR arrays of the network
+        self.connection_list = model.net_indices[model.net_indptr[unique_id]:model.net_indptr[unique_id+1]]
         
         # Initialize agent's profitability
         # Agent's payback period pbp and profit set to zero
@@ -55,11 +54,14 @@ class BuildingAgent(Agent):
         # Define agent's building block
         self.block = block
 
+        # Define agent's community block code, -1 if not in a community block
+        self.block_id = block_id
+
         # Define the agent's environmental awareness
         # Initializes a random value around the given mean awareness 
         # and clips it between 0 and 1
         if is_extremist == None:
-            self.awareness = np.random.beta(model.alpha, model.beta)
+            self.awareness = model.streams["awareness"].beta(model.alpha, model.beta)
             self.awareness_unc = 0.02 + self.awareness*(1 - self.awareness)
         elif is_extremist == "pos":
             self.awareness = 0.94
@@ -133,8 +135,8 @@ class BuildingAgent(Agent):
         creation of all agents
         '''
         # Counts the number of block neighbors a building has 
-        if self.block in self.model.community_idea_blocks:
-            self.total_neighbors = len(self.model.community_idea_blocks[self.block])-1
+        if self.block_id >= 0:
+            self.total_neighbors = self.model.block_size[self.block_id]-1
         else:
             self.total_neighbors = 0         
             
@@ -151,6 +153,12 @@ class BuildingAgent(Agent):
         Full paper (w/o referenced figure): Sigrin, Pless, Drury (2015)
         https://doi.org/10.1088/1748-9326/10/8/084001      
         '''
+        # Look up the profit if it was precomputed for the whole run
+        profit_table = self.model.profit_table
+        if profit_table is not None and self.model.month < len(profit_table):
+            self.profit = profit_table[self.model.month, self.unique_id]
+            return
+
         # Compute payback period with current prices
         self.pbp = SimplePayback.compute_pbp(self, 
                                              self.pv_sf,
@@ -168,7 +176,7 @@ class BuildingAgent(Agent):
         '''
         
         # Selects a connection randomly
-        sel_connection = np.random.choice(self.connection_list)
+        sel_connection = int(self.connection_list[self.model.streams["interactions"].integers(len(self.connection_list))])
 
         # initial opinion and uncertainty values of self
         opunc0 = (self.awareness,self.awareness_unc)
@@ -199,7 +207,7 @@ class BuildingAgent(Agent):
             
             # Calculate the number of buildings in the block with the idea
             # to form a solar community
-            neighbors_com = sum(self.model.community_idea_blocks[self.block].values())
+            neighbors_com = self.model.community_idea_count[self.block_id]
             
             # If this agent has the idea to join a community
             if self.community == True :
@@ -236,11 +244,10 @@ class BuildingAgent(Agent):
             self.idea = True
         # 5.b Developing the intention to install solar & join a community
         if self.utility >= self.model.threshold_high:
+            # Count the new idea in the community block
+            if self.community == False and self.block_id >= 0:
+                self.model.community_idea_count[self.block_id] += 1
             self.community = True
-            try:
-                self.model.community_idea_blocks[self.block].update({self.unique_id:True})
-            except:
-                pass
 
     def implement_pv(self):
         '''
@@ -280,12 +287,11 @@ class BuildingAgent(Agent):
         '''
         self.pv_alone = True
         
-        try:
-            # If there is more than 1 agent in the block with the idea
-            if(sum(self.model.community_idea_blocks[self.block].values())>1):
+        # If the agent lives in a community block with more than 1 agent with the idea
+        if self.block_id >= 0 and self.model.community_idea_count[self.block_id] > 1:
 
-                self.model.community_install_blocks[self.block].update({self.unique_id:True})
-                self.pv_community = True
-        except:
-            pass
+            # Count the new member of the community
+            if self.pv_community == False:
+                self.model.community_install_count[self.block_id] += 1
+            self.pv_community = True
 
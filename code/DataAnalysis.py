@@ -10,15 +10,20 @@ from Tools.VisualizationFunctions import AnimateColourMap
 from Tools.VisualizationFunctions import MultiLinePlot
 from Tools.VisualizationFunctions import MultipleSubplot
 from Tools.VisualizationFunctions import HistogramPlot
+from Tools.VisualizationFunctions import DensityPlot
 
 # Import Analysis Functions
 from Tools.AnalysisFunctions import CountVarsList
 from Tools.AnalysisFunctions import CountVarsMatrix
 from Tools.AnalysisFunctions import ReconstructBoolMatrix
 from Tools.AnalysisFunctions import AverageHFDataframe
+from Tools.AnalysisFunctions import OnlineMean
 
 # Import Datalogging Functions
-from Tools.DataloggingFunctions import ReadCSVBatch
+from Tools.DataloggingFunctions import LoadBatch
+
+# Import Rendering Functions
+from Tools.RenderPipeline import FigureQueue
 
 try:
     expt_name = sys.argv[1]
@@ -70,11 +75,29 @@ presentation_plots = expt_data["presentation_plots"]
 presentation_animations = True
 base_scenario = True
 
+# The trajectories of all agents are drawn within this distance (y units) of every logged value,
+# with fewer points
+line_tolerance = expt_data.get("line_tolerance", 0.001)
+# If >0, only this number of agents (representative of the quantiles of each variable) is drawn
+max_plot_lines = expt_data.get("max_plot_lines", 0)
+# Trajectories of all agents of a profile: "lines", or a density image ("histogram" or "sorted",
+# see DensityPlot) that is drawn as fast for any number of agents
+trajectory_plots = expt_data.get("trajectory_plots", "lines")
+
+# Saved plots are rendered at the end by a pool of workers (one per core by
+# default), unless they have to be shown
+render_workers = expt_data.get("render_workers", None)
+
+if not show:
+    figures = FigureQueue(render_workers)
+    MultiLinePlot, MultipleSubplot, HistogramPlot, DensityPlot, ColourMap, AnimateColourMap = [figures.deferred(f) for f in (MultiLinePlot, MultipleSubplot, HistogramPlot, DensityPlot, ColourMap, AnimateColourMap)]
+
 #%%
 
 # Read a profile to initialize n_runs, n_steps and n_agents
+# (LoadBatch caches the parsed logs, so reading a profile again is almost free)
 profile = 1 
-HF_data,MF_data,x_coord,y_coord,n_runs,n_steps,n_agents,input_dict,seeds = ReadCSVBatch (expt_name, profile,"profile_")
+HF_data,MF_data,x_coord,y_coord,n_runs,n_steps,n_agents,input_dict,seeds,MF_events = LoadBatch (expt_name, profile,"profile_",columns=[])
 
 #%%
 
@@ -84,54 +107,61 @@ Extract data from CSV
 ***********************
 '''
 
-# Initialize continuous data matrices
-Utility_space = np.zeros((n_profiles,n_runs,n_steps,n_agents))
-Opinion_space = np.zeros((n_profiles,n_runs,n_steps,n_agents))
-Uncertainty_space = np.zeros((n_profiles,n_runs,n_steps,n_agents))
+# Continuous variables of the HF logs. They are read one profile and one run at a time, and
+# only reduced with online statistics, so memory does not grow with the number of runs
+cont_vars = ['Utility','Opinion','Uncertainty','Profit','Neighbor']
+
+run_2_analyze = 6   # Same run with same seed for all run analysis
+
+# Slices of the run of interest: {var: (n_profiles,n_steps,n_agents)}
+Run_space = {var:np.zeros((n_profiles,n_steps,n_agents)) for var in cont_vars}
 
-Profit_space = np.zeros((n_profiles,n_runs,n_steps,n_agents))
-Neighbor_space = np.zeros((n_profiles,n_runs,n_steps,n_agents))
+# Mean over runs of the agent average of every step, per profile: {var: [OnlineMean of (n_steps) per profile]}
+Avg_stats = {var:[OnlineMean() for p in range(n_profiles)] for var in cont_vars}
+
+# Opinion of the "normal" population (not polarized at the end), accumulated over runs
+Opinion_normal_avg = np.zeros((n_profiles,n_steps))
+Nonpol_number = np.zeros(n_profiles)
 
 # Initialize counter matrices
 Com_Idea_space = np.zeros((n_profiles,n_runs,n_steps))
 PValone_space = np.zeros((n_profiles,n_runs,n_steps))
 PVcom_space = np.zeros((n_profiles,n_runs,n_steps))
 
-# Read CSV data and distribute it to the corresponding matrix positions
+# Read CSV data and reduce it run by run
 for curr_profile in range(0,n_profiles):
 
-    HF_data,MF_data,x_coord,y_coord,n_runs,n_steps,n_agents,input_dict,seeds = ReadCSVBatch (expt_name, curr_profile,"profile_")
+    HF_data,MF_data,x_coord,y_coord,n_runs,n_steps,n_agents,input_dict,seeds,MF_events = LoadBatch (expt_name, curr_profile,"profile_",columns=cont_vars)
+
+    # Views (n_runs,n_steps,n_agents) of the columns, memory-mapped for binary logs
+    HF_runs = {var:np.reshape(np.asarray(HF_data[var]),(n_runs,n_steps,n_agents)) for var in cont_vars}
+
+    for run in range(0,n_runs):
 
-    Utility_space[curr_profile,:,:,:] = np.reshape(HF_data['Utility'].to_numpy(),(n_runs,n_steps,n_agents))
-    Opinion_space[curr_profile,:,:,:] = np.reshape(HF_data['Opinion'].to_numpy(),(n_runs,n_steps,n_agents))
-    Uncertainty_space[curr_profile,:,:,:] = np.reshape(HF_data['Uncertainty'].to_numpy(),(n_runs,n_steps,n_agents))
+        for var in cont_vars:
+            Avg_stats[var][curr_profile].update(np.mean(np.asarray(HF_runs[var][run],dtype=float),axis=1))
 
-    Profit_space[curr_profile,:,:,:] = np.reshape(HF_data['Profit'].to_numpy(),(n_runs,n_steps,n_agents))
-    Neighbor_space[curr_profile,:,:,:] = np.reshape(HF_data['Neighbor'].to_numpy(),(n_runs,n_steps,n_agents))
+        # FILTER OUT EXTREMISTS AND AVERAGE ONLY THE "NORMAL" POPULATION
+        Opinion_onrun = np.asarray(HF_runs['Opinion'][run],dtype=float)
+        avg_idx = np.logical_and(Opinion_onrun[n_steps-1]>0.1,Opinion_onrun[n_steps-1]<0.90)
+
+        #Average over agents and accumulate to average over run
+        Opinion_normal_avg[curr_profile] += np.mean(Opinion_onrun[:,avg_idx],axis=1)
+        Nonpol_number[curr_profile] += np.count_nonzero(avg_idx)
+
+    # Keep the run of interest
+    for var in cont_vars:
+        Run_space[var][curr_profile] = HF_runs[var][run_2_analyze]
 
     Com_Idea_space[curr_profile,:,:] = CountVarsMatrix(MF_data,'Com_Idea_cnt',n_runs,n_steps)
     PValone_space[curr_profile,:,:] = CountVarsMatrix(MF_data,'PV_alone_cnt',n_runs,n_steps)
     PVcom_space[curr_profile,:,:] = CountVarsMatrix(MF_data,'PV_com_cnt',n_runs,n_steps)
 
-# GET RUNS OF INTEREST
-# Average over all runs
-Utility_avg_r = np.mean(Utility_space,axis=1)
-Opinion_avg_r = np.mean(Opinion_space,axis=1)
-Uncertainty_avg_r = np.mean(Uncertainty_space,axis=1)
-Profit_avg_r = np.mean(Profit_space,axis=1)
-Neighbor_avg_r = np.mean(Neighbor_space,axis=1)
-
-# Sum of Square Deviations wrto Run
-Utility_diff = np.zeros((n_profiles,n_runs,n_steps,n_agents))
-for r in range(0,n_runs):
-    Utility_diff[:,r,:,:] = (Utility_space[:,r,:,:] - Utility_avg_r)**2
+    # Free the logs of the profile before reading the next one
+    del HF_data, MF_data, MF_events, HF_runs
 
-Utility_diff = np.sum(np.sum(Utility_diff,axis=3),axis=2)
-Utility_interest_runs = np.argmin(Utility_diff,axis=1)      # Runs of interest -> The ones with smallest sum of square deviations wrto Run
-run_2_analyze = Utility_interest_runs[0]
-#print(Utility_interest_runs)
-
-run_2_analyze = 6   # Same run with same seed for all run analysis
+# Average over all runs and agents: {var: (n_profiles,n_steps)}
+Avg_space = {var:np.array([stats.mean for stats in Avg_stats[var]]) for var in cont_vars}
 
 '''
 ***********************
@@ -147,11 +177,11 @@ if(batch_comparison==1):
     # CONTINUOUS VARIABLES
 
     # Average the values over the agents
-    Utility_avg = np.mean(Utility_avg_r,axis=2)
-    Opinion_avg = np.mean(Opinion_avg_r,axis=2)
-    Uncertainty_avg = np.mean(Uncertainty_avg_r,axis=2)
-    Profit_avg = np.mean(Profit_avg_r,axis=2)
-    Neighbor_avg = np.mean(Neighbor_avg_r,axis=2)
+    Utility_avg = Avg_space['Utility']
+    Opinion_avg = Avg_space['Opinion']
+    Uncertainty_avg = Avg_space['Uncertainty']
+    Profit_avg = Avg_space['Profit']
+    Neighbor_avg = Avg_space['Neighbor']
 
     # Swap axes to have (n_steps, n_profiles)
     Utility_avg = Utility_avg.transpose()
@@ -172,12 +202,12 @@ if(batch_comparison==1):
     Utility_Mult_Subplot = np.zeros((n_profiles,n_steps,n_agents))
     Opinion_Mult_Subplot = np.zeros((n_profiles,n_steps,n_agents))
     for p in range(0,n_profiles):
-        idx = np.argsort(Opinion_space[p,run_2_analyze,0])
-        Utility_Mult_Subplot[p] = Utility_space[p,run_2_analyze,:,idx].transpose()
-        Opinion_Mult_Subplot[p] = Opinion_space[p,run_2_analyze,:,idx].transpose()
+        idx = np.argsort(Run_space['Opinion'][p,0])
+        Utility_Mult_Subplot[p] = Run_space['Utility'][p,:,idx].transpose()
+        Opinion_Mult_Subplot[p] = Run_space['Opinion'][p,:,idx].transpose()
 
-    MultipleSubplot(Utility_Mult_Subplot, n_agents, x_axis=[], stepshape=0, show=show, x_label="Time", x_ax_lim = [], y_label="Utility", y_ax_lim = [0,1], alpha=0.2, cmap='RdYlGn', title="Utility evolution comparison on each profile, for all agents", size=figsize, save=1, filename="Visualization/res/C_Sub_Cont_Utility.svg")
-    MultipleSubplot(Opinion_Mult_Subplot, n_agents, x_axis=[], stepshape=0, show=show, x_label="Time", x_ax_lim = [], y_label="Opinion", y_ax_lim = [0,1], alpha=0.2, cmap='RdYlGn', title="Opinion evolution comparison on each profile, for all agents", size=figsize, save=1, filename="Visualization/res/C_Sub_Cont_Opinion.svg")
+    MultipleSubplot(Utility_Mult_Subplot, n_agents, x_axis=[], stepshape=0, tolerance=line_tolerance, max_lines=max_plot_lines, show=show, x_label="Time", x_ax_lim = [], y_label="Utility", y_ax_lim = [0,1], alpha=0.2, cmap='RdYlGn', title="Utility evolution comparison on each profile, for all agents", size=figsize, save=1, filename="Visualization/res/C_Sub_Cont_Utility.svg")
+    MultipleSubplot(Opinion_Mult_Subplot, n_agents, x_axis=[], stepshape=0, tolerance=line_tolerance, max_lines=max_plot_lines, show=show, x_label="Time", x_ax_lim = [], y_label="Opinion", y_ax_lim = [0,1], alpha=0.2, cmap='RdYlGn', title="Opinion evolution comparison on each profile, for all agents", size=figsize, save=1, filename="Visualization/res/C_Sub_Cont_Opinion.svg")
 
     # DISCRETE STATE VARIABLES
 
@@ -211,12 +241,12 @@ if(single_batch==1):
 
     # READ DATAFRAME FROM BATCH TO ANALYZE
 
-    HF_data,MF_data,x_coord,y_coord,n_runs,n_steps,n_agents,input_dict,seeds = ReadCSVBatch (expt_name, batch_2_analyze,"profile_")
+    HF_data,MF_data,x_coord,y_coord,n_runs,n_steps,n_agents,input_dict,seeds,MF_events = LoadBatch (expt_name, batch_2_analyze,"profile_",columns=[])
 
     # Reconstruct the Boolean State Matrices
-    Com_Idea_M = ReconstructBoolMatrix(MF_data,'Com_Idea_cnt','Com_Idea_chg',run_2_analyze, n_steps, n_agents)
-    IndPV_M = ReconstructBoolMatrix(MF_data,'PV_alone_cnt','PV_alone_chg',run_2_analyze, n_steps, n_agents)
-    ComPV_M = ReconstructBoolMatrix(MF_data,'PV_com_cnt','PV_com_chg',run_2_analyze, n_steps, n_agents)
+    Com_Idea_M = ReconstructBoolMatrix(MF_events,'community',run_2_analyze, n_steps, n_agents)
+    IndPV_M = ReconstructBoolMatrix(MF_events,'pv_alone',run_2_analyze, n_steps, n_agents)
+    ComPV_M = ReconstructBoolMatrix(MF_events,'pv_community',run_2_analyze, n_steps, n_agents)
 
     # PV Installation Matrix: {0-> No PV, 1-> Individual, 2-> Community}
     Total_PV_M = IndPV_M + Com_Idea_M +ComPV_M
@@ -228,16 +258,25 @@ if(single_batch==1):
     # CONTINUOUS VARIABLES
     if(continuous==1):
 
-        idx = np.argsort(Opinion_space[batch_2_analyze,run_2_analyze,0])
+        # One line per agent
+        if(trajectory_plots=="lines"):
+
+            idx = np.argsort(Run_space['Opinion'][batch_2_analyze,0])
 
-        # Utility
-        MultiLinePlot(Utility_space[batch_2_analyze,run_2_analyze,:,idx].transpose(), n_agents, x_axis=[], y_ax_lim=[0,1], stepshape=0, show=show, x_label="Time", y_label="Utility Value", legendlabel='Agent', legend=0, alpha=0.2,  cmap='RdYlGn', title=("Evolution of Average Utility for different Agents on profile "+str(batch_2_analyze)), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Multi_Cont_Utility.svg")
+            # Utility
+            MultiLinePlot(Run_space['Utility'][batch_2_analyze,:,idx].transpose(), n_agents, x_axis=[], y_ax_lim=[0,1], stepshape=0, tolerance=line_tolerance, max_lines=max_plot_lines, show=show, x_label="Time", y_label="Utility Value", legendlabel='Agent', legend=0, alpha=0.2,  cmap='RdYlGn', title=("Evolution of Average Utility for different Agents on profile "+str(batch_2_analyze)), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Multi_Cont_Utility.svg")
 
-        # Opinion
-        MultiLinePlot(Opinion_space[batch_2_analyze,run_2_analyze,:,idx].transpose(), n_agents, x_axis=[], y_ax_lim=[0,1], stepshape=0, show=show, x_label="Time", y_label="Opinion Value", legendlabel='Agent', legend=0, alpha=0.2, cmap='RdYlGn', title=("Evolution of Average Opinion for different Agents on profile "+str(batch_2_analyze)), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Multi_Cont_Opinion.svg")
+            # Opinion
+            MultiLinePlot(Run_space['Opinion'][batch_2_analyze,:,idx].transpose(), n_agents, x_axis=[], y_ax_lim=[0,1], stepshape=0, tolerance=line_tolerance, max_lines=max_plot_lines, show=show, x_label="Time", y_label="Opinion Value", legendlabel='Agent', legend=0, alpha=0.2, cmap='RdYlGn', title=("Evolution of Average Opinion for different Agents on profile "+str(batch_2_analyze)), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Multi_Cont_Opinion.svg")
 
-        # Uncertainty
-        MultiLinePlot(Uncertainty_space[batch_2_analyze,run_2_analyze,:,idx].transpose(), n_agents, x_axis=[], y_ax_lim=[0,0.4], stepshape=0, show=show, x_label="Time", y_label="Uncertainty Value", legendlabel='Agent', legend=0, alpha=0.2, cmap='RdYlGn', title=("Evolution of Average Uncertainty for different Agents on profile "+str(batch_2_analyze)), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Multi_Cont_Uncertainty.svg")
+            # Uncertainty
+            MultiLinePlot(Run_space['Uncertainty'][batch_2_analyze,:,idx].transpose(), n_agents, x_axis=[], y_ax_lim=[0,0.4], stepshape=0, tolerance=line_tolerance, max_lines=max_plot_lines, show=show, x_label="Time", y_label="Uncertainty Value", legendlabel='Agent', legend=0, alpha=0.2, cmap='RdYlGn', title=("Evolution of Average Uncertainty for different Agents on profile "+str(batch_2_analyze)), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Multi_Cont_Uncertainty.svg")
+
+        # Density image of all agents ("histogram" or "sorted")
+        else:
+            DensityPlot(Run_space['Utility'][batch_2_analyze], mode=trajectory_plots, y_ax_lim=[0,1], show=show, x_label="Time", y_label="Utility Value", cmap='RdYlGn' if trajectory_plots=="sorted" else 'viridis', title=("Evolution of Utility for different Agents on profile "+str(batch_2_analyze)), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Multi_Cont_Utility.svg")
+            DensityPlot(Run_space['Opinion'][batch_2_analyze], mode=trajectory_plots, y_ax_lim=[0,1], show=show, x_label="Time", y_label="Opinion Value", cmap='RdYlGn' if trajectory_plots=="sorted" else 'viridis', title=("Evolution of Opinion for different Agents on profile "+str(batch_2_analyze)), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Multi_Cont_Opinion.svg")
+            DensityPlot(Run_space['Uncertainty'][batch_2_analyze], mode=trajectory_plots, y_ax_lim=[0,0.4], show=show, x_label="Time", y_label="Uncertainty Value", cmap='RdYlGn' if trajectory_plots=="sorted" else 'viridis', title=("Evolution of Uncertainty for different Agents on profile "+str(batch_2_analyze)), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Multi_Cont_Uncertainty.svg")
 
     # DISCRETE STATE VARIABLES
     if(states==1):
@@ -260,10 +299,10 @@ if(single_batch==1):
     if(histograms==1):
 
         # Initial Opinion Histogram
-        HistogramPlot(Opinion_space[batch_2_analyze,run_2_analyze,0], x_ax_lim=[0,1], n_bins=50, show=show, x_label="Opinion value", y_label="Frequency", cmap='RdYlGn', title=("Initial Opinion Histogram on profile "+str(batch_2_analyze)), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Hist_Opinion_Initial.svg")
+        HistogramPlot(Run_space['Opinion'][batch_2_analyze,0], x_ax_lim=[0,1], n_bins=50, show=show, x_label="Opinion value", y_label="Frequency", cmap='RdYlGn', title=("Initial Opinion Histogram on profile "+str(batch_2_analyze)), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Hist_Opinion_Initial.svg")
 
         # Final Opinion Histogram
-        HistogramPlot(Opinion_space[batch_2_analyze,run_2_analyze,n_steps-1], x_ax_lim=[0,1], n_bins=50, show=show, x_label="Opinion value", y_label="Frequency", cmap='RdYlGn', title=("Final Opinion Histogram on profile "+str(batch_2_analyze)), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Hist_Opinion_Final.svg")
+        HistogramPlot(Run_space['Opinion'][batch_2_analyze,n_steps-1], x_ax_lim=[0,1], n_bins=50, show=show, x_label="Opinion value", y_label="Frequency", cmap='RdYlGn', title=("Final Opinion Histogram on profile "+str(batch_2_analyze)), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Hist_Opinion_Final.svg")
 
     # ----------------------------
     # COLORMAPS
@@ -275,13 +314,13 @@ if(single_batch==1):
         y_coord = y_coord - np.min(y_coord)
 
         # Final Utility Color Map
-        ColourMap(x_coord, y_coord, Opinion_space[batch_2_analyze,run_2_analyze,n_steps-1], col_range=(0,1), x_label="x coordinate", y_label="y coordinate", colorbar=1, Nlegend=2, color_label=['Low (0)','', 'High (1)'],title=("Final utility distribution on profile "+str(batch_2_analyze)),size=mapsize,cmap='RdYlGn',markersize=20,save=save,show=show,filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Map_Utility_Final.svg")
+        ColourMap(x_coord, y_coord, Run_space['Opinion'][batch_2_analyze,n_steps-1], col_range=(0,1), x_label="x coordinate", y_label="y coordinate", colorbar=1, Nlegend=2, color_label=['Low (0)','', 'High (1)'],title=("Final utility distribution on profile "+str(batch_2_analyze)),size=mapsize,cmap='RdYlGn',markersize=20,save=save,show=show,filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Map_Utility_Final.svg")
 
         # Initial Opinion Color Map
-        ColourMap(x_coord, y_coord, Opinion_space[batch_2_analyze,run_2_analyze,0], col_range=(0,1), x_label="x coordinate", y_label="y coordinate", colorbar=1, Nlegend=2, color_label=['Low (0)','', 'High (1)'],title=("Initial Opinion distribution on profile "+str(batch_2_analyze)),size=mapsize,cmap='RdYlGn',markersize=20,save=save,show=show,filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Map_Opinion_Initial.svg")
+        ColourMap(x_coord, y_coord, Run_space['Opinion'][batch_2_analyze,0], col_range=(0,1), x_label="x coordinate", y_label="y coordinate", colorbar=1, Nlegend=2, color_label=['Low (0)','', 'High (1)'],title=("Initial Opinion distribution on profile "+str(batch_2_analyze)),size=mapsize,cmap='RdYlGn',markersize=20,save=save,show=show,filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Map_Opinion_Initial.svg")
 
         # Final Opinion Color Map
-        ColourMap(x_coord, y_coord, Utility_space[batch_2_analyze,run_2_analyze,n_steps-1], col_range=(0,1), x_label="x coordinate", y_label="y coordinate", colorbar=1, Nlegend=2, color_label=['Low (0)','', 'High (1)'],title=("Final Opinion distribution on profile "+str(batch_2_analyze)),size=mapsize,cmap='RdYlGn',markersize=20,save=save,show=show,filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Map_Opinion_Final.svg")
+        ColourMap(x_coord, y_coord, Run_space['Utility'][batch_2_analyze,n_steps-1], col_range=(0,1), x_label="x coordinate", y_label="y coordinate", colorbar=1, Nlegend=2, color_label=['Low (0)','', 'High (1)'],title=("Final Opinion distribution on profile "+str(batch_2_analyze)),size=mapsize,cmap='RdYlGn',markersize=20,save=save,show=show,filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Map_Opinion_Final.svg")
 
         # Final PV Installations Color Map
         ColourMap(x_coord, y_coord, Total_PV_M[n_steps-1], col_range=(0,3), x_label="x coordinate", y_label="y coordinate", colorbar=0, Nlegend=4, color_label=['No PV', 'Ind. PV', 'Comm. Idea','PV Comm.'],title=("Final PV distribution on profile "+str(batch_2_analyze)),size=mapsize,cmap='RdYlGn',markersize=20,save=save,show=show,filename="Visualization/res/B_Profile_"+str(batch_2_analyze)+"_Run_"+str(run_2_analyze)+"_Map_PV_Final.svg")
@@ -317,18 +356,18 @@ if(presentation_plots):
     for batch in range(0,n_profiles):
         run = run_2_analyze
 
-        HF_data,MF_data,x_coord,y_coord,n_runs,n_steps,n_agents,input_dict,seeds = ReadCSVBatch  (expt_name, batch,"profile_")
+        HF_data,MF_data,x_coord,y_coord,n_runs,n_steps,n_agents,input_dict,seeds,MF_events = LoadBatch (expt_name, batch,"profile_",columns=[])
 
         # Reconstruct the Boolean State Matrices
-        Com_Idea_M = ReconstructBoolMatrix(MF_data,'Com_Idea_cnt','Com_Idea_chg',run, n_steps, n_agents)
-        IndPV_M = ReconstructBoolMatrix(MF_data,'PV_alone_cnt','PV_alone_chg',run, n_steps, n_agents)
-        ComPV_M = ReconstructBoolMatrix(MF_data,'PV_com_cnt','PV_com_chg',run, n_steps, n_agents)
+        Com_Idea_M = ReconstructBoolMatrix(MF_events,'community',run, n_steps, n_agents)
+        IndPV_M = ReconstructBoolMatrix(MF_events,'pv_alone',run, n_steps, n_agents)
+        ComPV_M = ReconstructBoolMatrix(MF_events,'pv_community',run, n_steps, n_agents)
 
         # PV Installation Matrix: {0-> No PV, 1-> Individual, 2-> Community idea, 3-> Community}
         Total_PV_M = IndPV_M + ComPV_M + Com_Idea_M
 
-        HistogramPlot(Opinion_space[batch,run,0], x_ax_lim=[0,1], n_bins=50, show=show, x_label="Opinion value", y_label="Frequency", y_ax_lim = [0,35], cmap='RdYlGn', title=("Initial Opinion with "+label_list[batch]), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch)+"_Hist_Opinion_Initial_PRESENTATION.svg")
-        HistogramPlot(Opinion_space[batch,run,n_steps-1], x_ax_lim=[0,1], n_bins=50, show=show, x_label="Opinion value", y_label="Frequency", cmap='RdYlGn', title=("Final Opinion with "+label_list[batch]), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch)+"_Hist_Opinion_Final_PRESENTATION.svg")
+        HistogramPlot(Run_space['Opinion'][batch,0], x_ax_lim=[0,1], n_bins=50, show=show, x_label="Opinion value", y_label="Frequency", y_ax_lim = [0,35], cmap='RdYlGn', title=("Initial Opinion with "+label_list[batch]), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch)+"_Hist_Opinion_Initial_PRESENTATION.svg")
+        HistogramPlot(Run_space['Opinion'][batch,n_steps-1], x_ax_lim=[0,1], n_bins=50, show=show, x_label="Opinion value", y_label="Frequency", cmap='RdYlGn', title=("Final Opinion with "+label_list[batch]), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(batch)+"_Hist_Opinion_Final_PRESENTATION.svg")
         
         ColourMap(x_coord, y_coord, Total_PV_M[n_steps-1], col_range=(0,3), x_label="x coordinate", y_label="y coordinate", colorbar=0, Nlegend=4, color_label=['No PV', 'Ind. PV', 'Comm. Idea','PV Comm.'],title=("Final PV landscape with "+label_list[batch]),size=mapsize,cmap='RdYlGn',markersize=20,save=save,show=show,filename="Visualization/res/B_Profile_"+str(batch)+"_Map_PV_Final_PRESENTATION.svg")
         
@@ -349,12 +388,12 @@ if(presentation_plots):
     Opinion_Mult_Subplot = np.zeros((n_profiles,n_steps,n_agents))
 
     for p in range(0,n_profiles):
-        idx = np.argsort(Opinion_space[p,run_2_analyze,0])
-        Utility_Mult_Subplot[p] = Utility_space[p,run_2_analyze,:,idx].transpose()
-        Opinion_Mult_Subplot[p] = Opinion_space[p,run_2_analyze,:,idx].transpose()
+        idx = np.argsort(Run_space['Opinion'][p,0])
+        Utility_Mult_Subplot[p] = Run_space['Utility'][p,:,idx].transpose()
+        Opinion_Mult_Subplot[p] = Run_space['Opinion'][p,:,idx].transpose()
 
-    MultipleSubplot(Utility_Mult_Subplot, n_agents, testvar=5, x_axis=[], stepshape=0, show=show, subtitles=label_list, x_label="Time", x_ax_lim = [], y_label="Utility", y_ax_lim = [0,1], cmap='RdYlGn', title="", size=(17,4), save=1, alpha=0.2, filename="Visualization/res/C_Sub_Cont_Utility_PRESENTATION.svg")
-    MultipleSubplot(Opinion_Mult_Subplot, n_agents, testvar=5, x_axis=[], stepshape=0, show=show, subtitles=label_list, x_label="Time", x_ax_lim = [], y_label="Opinion", y_ax_lim = [0,1], cmap='RdYlGn', title="", size=(17,4), save=1, alpha=0.2, filename="Visualization/res/C_Sub_Cont_Opinion_PRESENTATION.svg")
+    MultipleSubplot(Utility_Mult_Subplot, n_agents, testvar=5, x_axis=[], stepshape=0, tolerance=line_tolerance, max_lines=max_plot_lines, show=show, subtitles=label_list, x_label="Time", x_ax_lim = [], y_label="Utility", y_ax_lim = [0,1], cmap='RdYlGn', title="", size=(17,4), save=1, alpha=0.2, filename="Visualization/res/C_Sub_Cont_Utility_PRESENTATION.svg")
+    MultipleSubplot(Opinion_Mult_Subplot, n_agents, testvar=5, x_axis=[], stepshape=0, tolerance=line_tolerance, max_lines=max_plot_lines, show=show, subtitles=label_list, x_label="Time", x_ax_lim = [], y_label="Opinion", y_ax_lim = [0,1], cmap='RdYlGn', title="", size=(17,4), save=1, alpha=0.2, filename="Visualization/res/C_Sub_Cont_Opinion_PRESENTATION.svg")
 
     # -------------------------------------------------
     # Average behaviour subplots:
@@ -364,8 +403,8 @@ if(presentation_plots):
     #       Average # of Agents with PV Community
 
     # Average the values over the agents
-    Utility_avg = np.mean(Utility_avg_r,axis=2)
-    Opinion_avg = np.mean(Opinion_avg_r,axis=2)
+    Utility_avg = Avg_space['Utility']
+    Opinion_avg = Avg_space['Opinion']
     # Average over all runs
     Avg_PValone_matrix = np.mean(PValone_space,axis=1)
     Avg_Com_Idea_matrix = np.mean(Com_Idea_space,axis=1)
@@ -384,17 +423,7 @@ if(presentation_plots):
     MultiLinePlot(Opinion_avg, n_profiles, x_axis=[], y_ax_lim=[0,1], stepshape=0, show=show, custom_labels=label_list, x_label="Time", y_label="Opinion Value", legend=1, cmap='brg', title="Average Opinion Signal", size=figsize, save=save, filename="Visualization/res/C_Multi_Cont_Opinion_PRESENTATION.svg")
 
     # FILTER OUT EXTREMISTS AND AVERAGE ONLY THE "NORMAL" POPULATION
-
-    Opinion_normal_avg = np.zeros((n_profiles,n_steps))
-    Nonpol_number = np.zeros(n_profiles)
-
-    for batch in range(0,n_profiles):
-        for run in range(0,n_runs):
-            avg_idx = np.logical_and(Opinion_space[batch,run,n_steps-1]>0.1,Opinion_space[batch,run,n_steps-1]<0.90)
-
-            #Average over agents and accumulate to average over run
-            Opinion_normal_avg[batch] += np.mean(Opinion_space[batch,run,:,avg_idx],axis=0)
-            Nonpol_number[batch] += Opinion_space[batch,run,:,avg_idx].shape[0]
+    # (accumulated over runs while reading the data)
 
     # Average over run
     Opinion_normal_avg = Opinion_normal_avg/n_runs
@@ -418,31 +447,31 @@ if(presentation_plots):
     if(base_scenario and expt_name=="dual_extremism"):
 
         # Average the values over the agents
-        Profit_avg = np.mean(Profit_avg_r,axis=2)
-        Neighbor_avg = np.mean(Neighbor_avg_r,axis=2)
+        Profit_avg = Avg_space['Profit']
+        Neighbor_avg = Avg_space['Neighbor']
 
         # Swap axes to have (n_steps, n_profiles)
         Profit_avg = Profit_avg.transpose()
         Neighbor_avg = Neighbor_avg.transpose()
 
-        HF_data,MF_data,x_coord,y_coord,n_runs,n_steps,n_agents,input_dict,seeds = ReadCSVBatch  (expt_name, 0, "profile_")
+        HF_data,MF_data,x_coord,y_coord,n_runs,n_steps,n_agents,input_dict,seeds,MF_events = LoadBatch (expt_name, 0,"profile_",columns=[])
 
         #Normalize coordinates
         x_coord = x_coord - np.min(x_coord)
         y_coord = y_coord - np.min(y_coord)
 
         # Reconstruct the Boolean State Matrices
-        Com_Idea_M = ReconstructBoolMatrix(MF_data,'Com_Idea_cnt','Com_Idea_chg',run_2_analyze, n_steps, n_agents)
-        IndPV_M = ReconstructBoolMatrix(MF_data,'PV_alone_cnt','PV_alone_chg',run_2_analyze, n_steps, n_agents)
-        ComPV_M = ReconstructBoolMatrix(MF_data,'PV_com_cnt','PV_com_chg',run_2_analyze, n_steps, n_agents)
+        Com_Idea_M = ReconstructBoolMatrix(MF_events,'community',run_2_analyze, n_steps, n_agents)
+        IndPV_M = ReconstructBoolMatrix(MF_events,'pv_alone',run_2_analyze, n_steps, n_agents)
+        ComPV_M = ReconstructBoolMatrix(MF_events,'pv_community',run_2_analyze, n_steps, n_agents)
 
         # PV Installation Matrix: {0-> No PV, 1-> Individual, 2-> Community}
         Total_PV_M = IndPV_M + ComPV_M + Com_Idea_M
 
-        idx = np.argsort(Opinion_space[0,run_2_analyze,0])
+        idx = np.argsort(Run_space['Opinion'][0,0])
 
-        MultipleSubplot(np.array([Opinion_space[0,run_2_analyze,:,idx].transpose(),Profit_space[0,run_2_analyze,:,idx].transpose(),Neighbor_space[0,run_2_analyze,:,idx].transpose()]), n_agents, testvar=3, x_axis=[], stepshape=0, show=show, subtitles=["Opinion","Profit","Neighbor"], x_label="Time", x_ax_lim = [], y_label="Value", y_ax_lim = [0,1], cmap='RdYlGn', title="", size=(10,4), save=1, alpha=0.2, filename="Visualization/res/C_Sub_Cont_All_Base_PRESENTATION.svg")
-        MultiLinePlot(Utility_space[0,run_2_analyze,:,idx].transpose(), n_agents, x_axis=[], y_ax_lim=[0,1], stepshape=0, show=show, custom_labels=label_list, x_label="Time", y_label="Utility Value", legend=0, cmap='RdYlGn', title="Utility Signal for all Agents", alpha=0.2, size=figsize, save=save, filename="Visualization/res/C_Single_Cont_Utility_Base_PRESENTATION.svg")
+        MultipleSubplot(np.array([Run_space['Opinion'][0,:,idx].transpose(),Run_space['Profit'][0,:,idx].transpose(),Run_space['Neighbor'][0,:,idx].transpose()]), n_agents, testvar=3, x_axis=[], stepshape=0, tolerance=line_tolerance, max_lines=max_plot_lines, show=show, subtitles=["Opinion","Profit","Neighbor"], x_label="Time", x_ax_lim = [], y_label="Value", y_ax_lim = [0,1], cmap='RdYlGn', title="", size=(10,4), save=1, alpha=0.2, filename="Visualization/res/C_Sub_Cont_All_Base_PRESENTATION.svg")
+        MultiLinePlot(Run_space['Utility'][0,:,idx].transpose(), n_agents, x_axis=[], y_ax_lim=[0,1], stepshape=0, tolerance=line_tolerance, max_lines=max_plot_lines, show=show, custom_labels=label_list, x_label="Time", y_label="Utility Value", legend=0, cmap='RdYlGn', title="Utility Signal for all Agents", alpha=0.2, size=figsize, save=save, filename="Visualization/res/C_Single_Cont_Utility_Base_PRESENTATION.svg")
 
         MultipleSubplot(np.array([Opinion_avg,Profit_avg,Neighbor_avg]), 1, testvar=3, x_axis=[], stepshape=0, show=show, subtitles=["Opinion","Profit","Neighbor"], x_label="Time", x_ax_lim = [], y_label="Value", y_ax_lim = [0,1], cmap='brg', title="", size=(10,4), save=1, alpha=1, filename="Visualization/res/C_Sub_Cont_Avg_Base_PRESENTATION.svg")
         MultiLinePlot(Utility_avg, 1, x_axis=[], y_ax_lim=[0,1], stepshape=0, show=show, custom_labels=label_list, x_label="Time", y_label="Utility Value", legend=0, cmap='RdBu', title="Average Utility Signal", size=figsize, alpha=1, save=save, filename="Visualization/res/C_Single_Cont_AvgUtility_Base_PRESENTATION.svg")
@@ -453,7 +482,14 @@ if(presentation_plots):
 
         MultipleSubplot(np.array([Avg_PValone_matrix,Avg_PVcom_matrix]), 1, testvar=2, x_axis=[], stepshape=0, show=show, subtitles=["Ind. PV","Comm. PV"], x_label="Time", x_ax_lim = [], y_label="# Agents", y_ax_lim = [0,550], cmap='brg', title="", size=(10,4), save=1, alpha=1, filename="Visualization/res/C_Sub_States_All_Base_PRESENTATION.svg")
 
-        HistogramPlot(Opinion_space[0,run_2_analyze,0], x_ax_lim=[0,1], n_bins=50, show=show, x_label="Opinion value", y_label="Frequency", cmap='RdYlGn', title=("Initial Opinion of a representative run"), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(0)+"_Hist_Opinion_Initial_Base_PRESENTATION.svg")
-        HistogramPlot(Opinion_space[0,run_2_analyze,n_steps-1], x_ax_lim=[0,1], n_bins=50, show=show, x_label="Opinion value", y_label="Frequency", cmap='RdYlGn', title=("Final Opinion of a representative run"), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(0)+"_Hist_Opinion_Final_Base_PRESENTATION.svg")
+        HistogramPlot(Run_space['Opinion'][0,0], x_ax_lim=[0,1], n_bins=50, show=show, x_label="Opinion value", y_label="Frequency", cmap='RdYlGn', title=("Initial Opinion of a representative run"), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(0)+"_Hist_Opinion_Initial_Base_PRESENTATION.svg")
+        HistogramPlot(Run_space['Opinion'][0,n_steps-1], x_ax_lim=[0,1], n_bins=50, show=show, x_label="Opinion value", y_label="Frequency", cmap='RdYlGn', title=("Final Opinion of a representative run"), size=figsize, save=save, filename="Visualization/res/B_Profile_"+str(0)+"_Hist_Opinion_Final_Base_PRESENTATION.svg")
 
         ColourMap(x_coord, y_coord, Total_PV_M[n_steps-1], col_range=(0,3), x_label="x coordinate", y_label="y coordinate", colorbar=0, Nlegend=4, color_label=['No PV', 'Ind. PV', 'Comm. Idea','PV Comm.'],title=("Final PV landscape of a representative run"),size=mapsize,cmap='RdYlGn',markersize=20,save=save,show=show,filename="Visualization/res/B_Profile_"+str(0)+"_Map_PV_Final_Base_PRESENTATION.svg")
+
+#%%
+# -----------------------------------------
+# Render the deferred plots
+# -----------------------------------------
+if not show:
+    figures.render()
@@ -3,25 +3,28 @@ from mesa import Model
 
 ### Import our agent from /Agent/BuildingAgent.py - NOT NEEDED ANYMORE!
 
-# Import NetworkX Library
-import networkx as nx
-
 # Import numpy
 import numpy as np
 
+# Import standard random generator, used by the mesa scheduler
+import random
+
 # Import random agent activator
 from mesa.time import RandomActivation
 
 # Import space package
 from mesa.space import MultiGrid, ContinuousSpace 
 
-# Import data collector object class
-from mesa.datacollection import DataCollector
+# Import columnar recorder of the agent variables
+from Tools.DataloggingFunctions import AgentRecorder
+
+# Import random streams of the runs and the small world generator
+from Tools import RandomStreams, SmallWorld
 
 class BuildingModel(Model):
     """A model with some number of agents."""
     
-    def __init__(self, agent, b_data, n_agents, data_dict, seed=None):
+    def __init__(self, agent, b_data, n_agents, data_dict, seed=None, profit_table=None, n_steps=None, recorder=None):
         '''
         This method initializes the instantiation of the model class.
         Inputs:
@@ -30,17 +33,39 @@ class BuildingModel(Model):
             n_agents    > number of building owners populating the model
             data_dict   > meta data of the data file containing properties
                         like min_x, max_x, ...
+            seed        > seed of the run (None for a random run)
+            profit_table> (optional) precomputed profit of every agent at
+                        every step, see SimplePayback.profit_table
+            n_steps     > (optional) number of steps to preallocate in the
+                        recorder of agent variables
+            recorder    > (optional) recorder object, AgentRecorder by default
         '''                
         # 1. Define the number of agents in the model
         self.num_agents = n_agents
 
         self.myseed = seed
 
-        # Initialize a dictionary of community blocks (block has more than 2 buildings)
-        self.community_idea_blocks = { block_id:{} for block_id in data_dict["comm_blocks"]}
-        self.community_install_blocks = { block_id:{} for block_id in data_dict["comm_blocks"]}
-        # - community idea blocks    -> Dictionary of dictionaries containing agent id and corresponding community value for developed ideas
-        # - community install blocks -> Dictionary of dictionaries containing agent id and corresponding community value for installations
+        # Independent random streams of the run (network, awareness,
+        # activation, interactions), see Tools/RandomStreams.py
+        self.streams = RandomStreams.run_streams(seed)
+
+        # The mesa scheduler shuffles the agents with the model's random
+        # generator, seeded from the activation stream
+        self.random = random.Random(int(self.streams["activation"].integers(2**63)))
+
+        # Integer codes of the community blocks (block has more than 2 buildings)
+        self.block_codes = { block_id:i for i, block_id in enumerate(data_dict["comm_blocks"])}
+        n_blocks = len(self.block_codes)
+
+        # Number of buildings of every community block
+        agent_blocks = [self.block_codes.get(block, -1) for block in b_data["building_block"][:n_agents]]
+        self.block_size = np.bincount([b for b in agent_blocks if b >= 0], minlength=n_blocks)
+
+        # Counters per community block, updated by the agents when their state flips
+        self.community_idea_count = np.zeros(n_blocks, dtype=int)
+        self.community_install_count = np.zeros(n_blocks, dtype=int)
+        # - community idea count    -> Number of agents in the block that developed the community idea
+        # - community install count -> Number of agents in the block that joined a solar community
 
         self.space = ContinuousSpace(data_dict["max_x"],
                                      data_dict["max_y"],
@@ -102,6 +127,13 @@ class BuildingModel(Model):
         # Change of electricity prices every month [as fraction of prior]
         self.el_price_mom = (1 + data_dict["el_price_yoy"])**(1/12) - 1
 
+        # Profits are the same for all runs of a profile, so they can be
+        # computed once and looked up by the agents (None -> computed by agents)
+        self.profit_table = profit_table
+
+        # Number of model steps (months) executed
+        self.month = 0
+
         self.idea_phase = True
         # Flag for switching between phase steps
         
@@ -113,13 +145,11 @@ class BuildingModel(Model):
         # Create Small World Network between agents (Done before agents)
         self.num_neighbors_wsg = data_dict["swn_k"]
         self.rewire_prob_wsg = data_dict["swn_p"]
-        self.net = self.init_small_world()
+        self.net_indptr, self.net_indices = self.init_small_world()
 
         pos_extremists = data_dict["pos_extremists"]
         neg_extremists = data_dict["neg_extremists"]
         pos_ext_list, neg_ext_list = self.make_extremists(pos_extremists, neg_extremists)
-        
-        np.random.seed(self.myseed)
 
         # Create agents
         for i in range(self.num_agents):
@@ -134,14 +164,6 @@ class BuildingModel(Model):
 
             # Retrieve agent's block ID
             block = b_data.at[i, "building_block"]
-
-            # Add agent to the community block initialized with False
-            # Only possible if the agent lives in a block - so just attempt blindly. 
-            try:
-                self.community_idea_blocks[block].update({i:False})
-                self.community_install_blocks[block].update({i:False})
-            except KeyError:
-                pass    
             
             # Retrieve agent's electricity demand from data [kWh/year]
             el_demand = float(b_data.at[i, "demand_kwh"])
@@ -171,7 +193,8 @@ class BuildingModel(Model):
                 pv_sf = 1
             
             # Create agent
-            a = agent(i, self, block, el_demand, pv_potential, pv_sf, pv_sc,
+            a = agent(i, self, block, self.block_codes.get(block, -1),
+                    el_demand, pv_potential, pv_sf, pv_sc,
                     is_extremist = "pos" if i in pos_ext_list else ("neg" if i in neg_ext_list else None),
                     seed = self.myseed)
             
@@ -181,26 +204,14 @@ class BuildingModel(Model):
             # Locate agent in the map
             self.space.place_agent(a,(x,y))
             
-            # Define collector data
-            self.datacollector = DataCollector(
-                model_reporters ={
-                    "Awareness" : "awareness"},
-                agent_reporters ={
-                    "Utility" : "utility",
-                    "Opinion" : "awareness",
-                    "Uncertainty" : "awareness_unc",
-                    "Neighbor":"neighbor",
-                    "Profit":"profit",
-                    "pv_alone" : "pv_alone",
-                    "community" : "community",
-                    "pv_community": "pv_community"}       
-                )
+        # Define recorder of agent variables (Utility, Opinion, ...)
+        self.recorder = recorder if recorder is not None else AgentRecorder(self.num_agents, n_steps or 1)
 
         pass
                
     def step(self):
         '''Advance the model by one step.'''
-        self.datacollector.collect(self)
+        self.recorder.collect(self)
 
         # Agents are randomly activated to develop the idea
         self.idea_phase = True
@@ -215,12 +226,19 @@ class BuildingModel(Model):
         # = 2 Agent steps - one idea and one 
 
         self.update_global_prices()   
+        self.month += 1
         #print("==")
 
+    def get_agent_values(self, attr):
+        '''
+        Returns an array with the given attribute of all agents, by agent id.
+        '''
+        return np.array([getattr(a, attr) for a in self.schedule.agents])
+
     def make_extremists(self, pos_extremists, neg_extremists):
         if pos_extremists + neg_extremists != 0:
-            rlist = self.random.sample(range(self.num_agents), pos_extremists + neg_extremists)
-            return rlist[:pos_extremists], rlist[pos_extremists:]
+            rlist = self.streams["awareness"].choice(self.num_agents, pos_extremists + neg_extremists, replace=False)
+            return list(rlist[:pos_extremists]), list(rlist[pos_extremists:])
         else:
             return [],[]
         # Returns a list of positive and negative extremists resp
@@ -240,10 +258,12 @@ class BuildingModel(Model):
 
     def init_small_world(self):
         '''
-        This method creates a small world network for the agent.
+        This method creates (or reads from the network cache) a small world
+        network for the agents and returns it as CSR arrays (indptr, indices).
         '''
         
-        return nx.generators.random_graphs.watts_strogatz_graph(self.num_agents,
-                                                                self.num_neighbors_wsg,
-                                                                self.rewire_prob_wsg,
-                                                                seed=self.myseed)
\ No newline at end of file
+        return SmallWorld.cached_watts_strogatz(self.num_agents,
+                                                self.num_neighbors_wsg,
+                                                self.rewire_prob_wsg,
+                                                self.myseed,
+                                                self.streams["network"])
\ No newline at end of file
@@ -0,0 +1,339 @@
+# Vectorized (struct-of-arrays) version of BuildingModel + BuildingAgent.
+# All agent attributes live in numpy arrays indexed by (scenario, run, agent id)
+# and both phases of BuildingAgent.step are applied to the whole population
+# of every price scenario and every run of a batch at once.
+
+# Import numpy
+import numpy as np
+
+from Tools import RelativeAgreement, SimplePayback, RandomStreams, SmallWorld
+from Tools.DataloggingFunctions import AgentRecorder
+## The above only works because they're called from the main script
+## Ignore the linting
+
+
+class VectorModel():
+    """Array based model of building owners, alternative to BuildingModel."""
+
+    def __init__(self, b_data, n_agents, data_dict, seed=None, profit_table=None, prices=None, n_steps=None, recorder=None):
+        '''
+        This method initializes the instantiation of the model class.
+        Inputs:
+            b_data      > csv file with data about buildings
+            n_agents    > number of building owners populating the model
+            data_dict   > meta data of the data file containing properties
+                        like min_x, max_x, ...
+            seed        > seed of the run (None for a random run), or list
+                        with the seeds of a batch of runs that are
+                        simulated together, each one with its own network
+                        and random stream
+            profit_table> (optional) precomputed profit of every agent at
+                        every step, see SimplePayback.profit_table. A 3D
+                        table (n_scenarios, n_steps, n_agents) simulates
+                        all price scenarios at once
+            prices      > (optional) tuple of (n_scenarios x n_steps) PV and
+                        electricity price matrices, used to compute the
+                        profit table if it is not given
+            n_steps     > (optional) number of steps to preallocate in the
+                        recorder of agent variables
+            recorder    > (optional) recorder object, AgentRecorder of the
+                        (n_scenarios, n_agents) arrays by default, or of the
+                        (n_scenarios, n_runs, n_agents) arrays for a batch
+        '''
+        # 1. Define the number of agents in the model
+        self.num_agents = n_agents
+
+        # Independent random streams of every run of the batch
+        self.batched = np.ndim(seed) > 0
+        self.myseed = seed
+        self.seeds = list(seed) if self.batched else [seed]
+        self.n_runs = len(self.seeds)
+        self.streams = [RandomStreams.run_streams(s) for s in self.seeds]
+
+        # Setup Global Variables (see BuildingModel)
+        self.awareness_mean = data_dict["awareness"]
+        self.awareness_var = data_dict["awareness_var"]
+
+        self.alpha = (self.awareness_mean**2)*(((1-self.awareness_mean)/(self.awareness_var**2))-(1/self.awareness_mean))
+        self.beta = self.alpha*((1/self.awareness_mean)-1)
+
+        if((self.alpha<1)or((self.beta<1))):
+            print("WARNING: degenerate Beta for Awareness! Maybe awareness variance is too large?")
+
+        self.ra_gain = data_dict["ra_gain"]
+
+        self.profit_weight = data_dict["profit_weight"]
+        self.awareness_weight = data_dict["awareness_weight"]
+        self.neighbor_weight = data_dict["neighbor_weight"]
+
+        self.threshold_low = data_dict["threshold_low"]
+        self.threshold_high = data_dict["threshold_high"]
+
+        self.max_pbp = data_dict["max_pbp"]
+        self.pv_price = data_dict["pv_price"]
+        self.el_price = data_dict["el_price"]
+        self.pv_price_mom = (1 + data_dict["pv_price_yoy"])**(1/12) - 1
+        self.el_price_mom = (1 + data_dict["el_price_yoy"])**(1/12) - 1
+
+        # Building data, one entry per agent
+        b_data = b_data.iloc[:n_agents]
+        self.x_coord = b_data["building_coord_x"].to_numpy()
+        self.y_coord = b_data["building_coord_y"].to_numpy()
+
+        # Size, self-consumption and potential of the PV systems
+        self.pv_sf, self.pv_sc, self.pv_potential = SimplePayback.pv_system_parameters(b_data)
+
+        # Profits shared by all runs of a profile, looked up every step
+        if profit_table is None and prices is not None:
+            profit_table = SimplePayback.profit_table(self.pv_sf, self.pv_sc, self.pv_potential,
+                                                      prices[0], prices[1], self.max_pbp)
+        self.profit_table = profit_table
+        self.month = 0
+
+        # All price scenarios share the random numbers of the run, so their
+        # differences only come from the prices
+        self.n_scenarios = profit_table.shape[0] if profit_table is not None and profit_table.ndim == 3 else 1
+
+        # Agent arrays are (n_scenarios, n_runs, n_agents) internally, the
+        # run axis is dropped in get_agent_values for a single run
+        self.shape = (self.n_scenarios,) + ((self.n_runs,) if self.batched else ()) + (n_agents,)
+        shape = (self.n_scenarios, self.n_runs, n_agents)
+
+        # Integer coded community blocks: index in comm_blocks, 0 for the agents
+        # in no block (in_block False). There is at least one (empty) block, so
+        # that the block of every agent is a valid index of the block counts
+        block_codes = {block_id:i for i, block_id in enumerate(data_dict["comm_blocks"])}
+        block = np.array([block_codes.get(b, -1) for b in b_data["building_block"]])
+        self.in_block = block >= 0
+        self.block = block.clip(0)
+        self.n_blocks = max(len(block_codes), 1)
+
+        # Number of block neighbors of every agent (set_fixed_vars)
+        block_size = np.bincount(self.block[self.in_block], minlength=self.n_blocks)
+        self.total_neighbors = np.where(self.in_block, block_size[self.block] - 1, 0)
+
+        # Create Small World Network of every run, stored as one block
+        # diagonal CSR matrix over the (run, agent) flat indices
+        self.num_neighbors_wsg = data_dict["swn_k"]
+        self.rewire_prob_wsg = data_dict["swn_p"]
+        networks = [self.init_small_world(s, streams["network"]) for s, streams in zip(self.seeds, self.streams)]
+        n_edges = np.cumsum([0] + [len(indices) for indptr, indices in networks])
+        self.net_indptr = np.concatenate([[0]] + [indptr[1:] + n_edges[r] for r, (indptr, indices) in enumerate(networks)])
+        self.net_indices = np.concatenate([indices.astype(np.int64) + r*n_agents for r, (indptr, indices) in enumerate(networks)])
+        self.degree = np.diff(self.net_indptr)
+
+        self.awareness = np.zeros(shape)
+        self.awareness_unc = np.zeros(shape)
+        for r, streams in enumerate(self.streams):
+            rng = streams["awareness"]
+
+            # Initial awareness drawn from the Beta distribution
+            self.awareness[:, r] = rng.beta(self.alpha, self.beta, size=n_agents)
+            self.awareness_unc[:, r] = 0.02 + self.awareness[:, r]*(1 - self.awareness[:, r])
+
+            # Extremists have fixed opinions with low uncertainty
+            pos_ext, neg_ext = self.make_extremists(data_dict["pos_extremists"], data_dict["neg_extremists"], rng)
+            self.awareness[:, r, pos_ext] = 0.94
+            self.awareness[:, r, neg_ext] = 0.06
+            self.awareness_unc[:, r, pos_ext] = 0.03
+            self.awareness_unc[:, r, neg_ext] = 0.03
+
+        # Decision variables
+        self.profit = np.zeros(shape)
+        self.neighbor = np.zeros(shape)
+        self.utility = np.zeros(shape)
+
+        # States of the adoption process
+        self.idea = np.zeros(shape, dtype=bool)
+        self.community = np.zeros(shape, dtype=bool)
+        self.pv_alone = np.zeros(shape, dtype=bool)
+        self.pv_community = np.zeros(shape, dtype=bool)
+
+        self.recorder = recorder if recorder is not None else AgentRecorder(self.shape, n_steps or 1)
+
+    def step(self):
+        '''
+        Advance the model by one step (= 1 MONTH), applying the idea phase
+        and the implementation phase to all agents at once.
+        '''
+        self.recorder.collect(self)
+
+        self.idea_step()
+        self.implement_step()
+
+        self.update_global_prices()
+        self.month += 1
+
+    def idea_step(self):
+        '''
+        Idea phase of BuildingAgent.step for the whole population.
+
+        Within a phase every agent sees the state of the others at the
+        beginning of the phase, instead of the state left by the agents
+        randomly activated before it.
+        '''
+        self.update_profit()
+        self.update_awareness()
+        self.update_neighbors()
+
+        # Agents already in a solar community keep their utility and ideas
+        active = ~self.pv_community
+
+        # Utility from the weighted decision factors (get_idea)
+        utility = np.minimum(self.profit * self.profit_weight
+                             + self.awareness * self.awareness_weight
+                             + self.neighbor * self.neighbor_weight, 1)
+        self.utility = np.where(active, utility, self.utility)
+
+        self.idea |= active & (self.utility >= self.threshold_low)
+        self.community |= active & (self.utility >= self.threshold_high)
+
+    def implement_step(self):
+        '''
+        Implementation phase of BuildingAgent.step for the whole population.
+        '''
+        implementing = ~self.pv_community & self.idea
+
+        # Every implementing agent ends up with PV on its rooftop
+        joining = implementing & self.community
+        self.pv_alone |= implementing
+
+        # A community is possible if more than 1 agent in the block has the idea
+        com_ideas = self.block_counts(self.community)
+        self.pv_community |= joining & self.in_block & (com_ideas[..., self.block] > 1)
+
+    def update_profit(self):
+        '''
+        Update profit of all agents with the current prices
+        (see BuildingAgent.update_profit).
+        '''
+        if self.profit_table is not None and self.month < self.profit_table.shape[-2]:
+            profit = self.profit_table[..., self.month, np.newaxis, :]
+        elif self.n_scenarios > 1:
+            raise ValueError("Price scenarios only cover " + str(self.profit_table.shape[-2]) + " steps")
+        else:
+            pbp = SimplePayback.compute_pbp_array(self.pv_sf, self.pv_sc, self.pv_potential,
+                                                  self.pv_price, self.el_price, self.max_pbp)
+            profit = 1 - (pbp / self.max_pbp)
+
+        self.profit = np.broadcast_to(profit, self.awareness.shape)
+
+    def update_awareness(self):
+        '''
+        Every agent, in random order, interacts with a randomly selected
+        connection of its social network (see BuildingAgent.update_awareness).
+        '''
+        # Activation order and partners of every run, as (run, agent) flat indices
+        order = np.concatenate([streams["activation"].permutation(self.num_agents) + r*self.num_agents
+                                for r, streams in enumerate(self.streams)])
+        partners = np.concatenate([self.select_partners(order[r*self.num_agents:(r+1)*self.num_agents], streams["interactions"])
+                                   for r, streams in enumerate(self.streams)])
+
+        # Interactions applied in activation order, in conflict-free rounds,
+        # to all price scenarios at once. Runs never share agents, so their
+        # pairs go through the same rounds
+        has_partner = partners >= 0
+        flat_shape = (self.n_scenarios, self.n_runs*self.num_agents)
+        RelativeAgreement.interact_pairs(self.awareness.reshape(flat_shape),
+                                         self.awareness_unc.reshape(flat_shape),
+                                         order[has_partner], partners[has_partner],
+                                         self.ra_gain)
+
+    def select_partners(self, agents, rng):
+        '''
+        Picks a random connection for each of the given agents straight from
+        the CSR slices of the network. Agents without connections get -1.
+        '''
+        degree = self.degree[agents]
+        offset = (rng.random(len(agents)) * degree).astype(np.int64)
+        partners = self.net_indices[np.minimum(self.net_indptr[agents] + offset, len(self.net_indices) - 1)]
+        return np.where(degree > 0, partners, -1)
+
+    def update_neighbors(self):
+        '''
+        Share of block neighbors with the idea to form a solar community
+        (see BuildingAgent.update_neighbors).
+        '''
+        com_ideas = self.block_counts(self.community)
+        has_neighbors = self.total_neighbors != 0
+
+        # Exclude the agent itself if it has the idea
+        neighbors_com = com_ideas[..., self.block] - (self.community & self.in_block)
+        self.neighbor = np.where(has_neighbors,
+                                 neighbors_com / np.maximum(self.total_neighbors, 1),
+                                 self.neighbor)
+
+    def block_counts(self, state):
+        '''
+        Number of agents per scenario, run and community block with the given
+        boolean state, as an (n_scenarios x n_runs x n_blocks) array.
+        '''
+        n_rows = self.n_scenarios*self.n_runs
+        keys = self.block[self.in_block] + self.n_blocks*np.arange(n_rows)[:, np.newaxis]
+        counts = np.bincount(keys.ravel(), weights=state[..., self.in_block].ravel(),
+                             minlength=n_rows*self.n_blocks)
+        return counts.reshape(self.n_scenarios, self.n_runs, self.n_blocks)
+
+    def get_agent_values(self, attr):
+        '''
+        Returns the (n_scenarios, n_agents) array of the given attribute, or
+        the (n_scenarios, n_runs, n_agents) array for a batch of runs.
+        '''
+        return getattr(self, attr).reshape(self.shape)
+
+    def make_extremists(self, pos_extremists, neg_extremists, rng):
+        '''
+        Returns arrays of positive and negative extremists resp.
+        '''
+        rlist = rng.choice(self.num_agents, pos_extremists + neg_extremists, replace=False)
+        return rlist[:pos_extremists], rlist[pos_extremists:]
+
+    def update_global_prices(self):
+        '''
+        This method updates the prices of solar PV and electricity use for the
+        computation of the payback periods of the agents.
+        '''
+        self.pv_price = self.pv_price * (1 - self.pv_price_mom)
+        self.el_price = self.el_price * (1 - self.el_price_mom)
+
+    def init_small_world(self, seed, rng):
+        '''
+        This method creates (or reads from the network cache) the small world
+        network for the agents of a run, rewired with the given random
+        generator, and returns it as CSR arrays (indptr, indices).
+        '''
+        return SmallWorld.cached_watts_strogatz(self.num_agents,
+                                                self.num_neighbors_wsg,
+                                                self.rewire_prob_wsg,
+                                                seed, rng)
+
+
+class ScenarioRecorder(AgentRecorder):
+    """
+    Records population aggregates of every price scenario (and run) of a
+    VectorModel every step, instead of the full agent variables (see
+    AgentRecorder).
+    """
+
+    # Aggregates: column name -> (model attribute, reducer over agents)
+    reporters = {
+        "PV_alone_cnt" : ("pv_alone", np.sum),
+        "PV_com_cnt" : ("pv_community", np.sum),
+        "Com_Idea_cnt" : ("community", np.sum),
+        "Utility" : ("utility", np.mean),
+        "Opinion" : ("awareness", np.mean),
+        "Profit" : ("profit", np.mean)}
+
+    def __init__(self, shape, n_steps=1):
+        self.agents_shape = tuple(np.atleast_1d(shape))
+        self.n_steps = 0
+        self.arrays = {name:np.zeros((max(n_steps,1),)+self.agents_shape) for name in self.reporters}
+
+    def collect(self, model):
+        if self.n_steps == len(self.arrays["Utility"]):
+            self.arrays = {name:np.concatenate((array,np.zeros_like(array))) for name, array in self.arrays.items()}
+
+        for name, (attr, reducer) in self.reporters.items():
+            self.arrays[name][self.n_steps] = reducer(model.get_agent_values(attr), axis=-1)
+
+        self.n_steps += 1
@@ -0,0 +1,50 @@
+import pandas as pd
+import json, sys
+
+# Import Sensitivity Functions
+from Tools import Sensitivity
+
+try:
+    expt_name = sys.argv[1]
+except:
+    print("Need to enter the experiment name")
+    print("Example - sweep_morris, sweep_sobol,.. ")
+    sys.exit()
+
+#%%
+# -----------------------------------------
+# Analysis options imported from experiment json
+# -----------------------------------------
+
+# Import configuration from json
+expt_file = "Data/Experiments/" + expt_name + ".json"
+with open(expt_file) as myjson:
+    expt_data = json.loads(myjson.read())
+
+sweep = expt_data["sweep"]
+
+# Outputs to analyze, all summaries of the sweep by default
+outputs = sweep.get("outputs", None)
+
+# Bootstrap resamples and level of the confidence intervals
+n_bootstrap = sweep.get("bootstrap", 1000)
+confidence = sweep.get("confidence", 0.95)
+
+#%%
+# -----------------------------------------
+# Sensitivity indices
+# -----------------------------------------
+
+log_dir = "Datalogs/Logs/" + expt_data["experiment_name"]
+results = pd.read_csv(log_dir + "/Sweep.csv", sep=';', index_col=['Point','Run'])
+
+if outputs is None:
+    outputs = [col for col in results.columns if col != 'Seed' and col not in sweep["parameters"]]
+
+indices = Sensitivity.analyze(sweep, results, outputs, n_bootstrap, confidence, sweep.get("seed"))
+
+with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200, 'display.float_format', '{:.4f}'.format):
+    print(indices)
+
+indices.to_csv(log_dir + "/Sensitivity.csv", sep=';')
+print("Indices saved to " + log_dir + "/Sensitivity.csv")
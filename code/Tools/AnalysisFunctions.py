@@ -45,6 +45,44 @@ def AverageHFDataframe(dataframe,prev_average_dataframe,curr_run,n_runs,n_steps,
 
 #%%
 
+# --------------------------
+# ONLINE MEAN CLASS
+# --------------------------
+#
+# DESCRIPTION: accumulates the element-wise mean of a series of equally shaped samples
+#              (e.g. the data of one run at a time) without storing them.
+#
+# INPUT ARGUMENTS (update)
+#
+# -sample   -> array with the next sample
+#
+# ATTRIBUTES
+#
+# -count    -> number of samples accumulated
+# -mean     -> element-wise mean of the samples
+#
+
+class OnlineMean():
+
+    def __init__(self):
+
+        self.count = 0
+        self.mean = None
+
+    def update(self, sample):
+
+        sample = np.asarray(sample, dtype=float)
+        self.count += 1
+
+        # First sample initializes the accumulator
+        if self.count == 1:
+            self.mean = sample.copy()
+            return
+
+        self.mean += (sample - self.mean)/self.count
+
+#%%
+
 # --------------------------
 # COUNT VARS AVERAGE FUNCTION
 # --------------------------
@@ -66,34 +104,22 @@ def AverageHFDataframe(dataframe,prev_average_dataframe,curr_run,n_runs,n_steps,
 
 def CountVarsMatrix(dataframe,col_to_analyze,n_runs,n_steps):
 
-    Count_Matrix = np.zeros((n_runs,n_steps))       # Matrix will all counting values per Step, per Run
-
-    # For all the wanted runs
-    for run in range(0,n_runs):
+    # Times and count values of all runs, in (Run, Step) order
+    Data = dataframe[col_to_analyze].dropna()
+    Runs = Data.index.get_level_values('Run').to_numpy()
+    Change_t = (Data.index.get_level_values('Step').to_numpy()/2).astype(int)      # Correct scale factor - Collector counts 2 steps!
+    Count = Data.to_numpy(dtype=float)
 
-        # Take the data on that run
-        Data_onrun = dataframe[dataframe.index.get_level_values('Run') == run].droplevel('Run')
+    # Changes of the wanted runs, at steps >0 (values are assumed 0 at step 0)
+    valid = (Runs < n_runs) & (Change_t > 0) & (Change_t < n_steps)
 
-        # Extract arrays: time and count values
-        Change_t = Data_onrun[[col_to_analyze]].dropna().index.to_numpy()/2       # Correct scale factor - Collector counts 2 steps!
-        Count = Data_onrun[[col_to_analyze]].dropna().to_numpy().transpose()
-        Count = np.reshape(Count,np.size(Count))
+    # Scatter the position of every change, and carry the last one forward over the steps without changes
+    Change_idx = np.full((n_runs,n_steps), -1)
+    Change_idx[Runs[valid],Change_t[valid]] = np.flatnonzero(valid)
+    Change_idx = np.maximum.accumulate(Change_idx,axis=1)
 
-        # Fill in Full Count Array, of n_steps dimension
-        for step in range(0,n_steps):
-
-            # For all steps >0 (otherwise assume values=0)
-            if(step>0):
-
-                # Copy values from last step
-                Count_Matrix[run,step] = Count_Matrix[run,step-1]
-
-                # If current step is in list of changes
-                if(step in Change_t):
-
-                    # Get index of current step and get count value at that index
-                    idx = np.where(Change_t == step)[0][0]
-                    Count_Matrix[run,step] = Count[idx]
+    # Matrix will all counting values per Step, per Run
+    Count_Matrix = np.where(Change_idx >= 0, Count[Change_idx], 0.)
 
     return Count_Matrix
 
@@ -123,107 +149,67 @@ def CountVarsMatrix(dataframe,col_to_analyze,n_runs,n_steps):
 
 def CountVarsList(dataframe,col_to_analyze,runs_to_analyze,n_steps):
 
-    # Init lists
-    Change_time_list = []
-    Count_list = []
-
-    # For all the wanted runs
-    for run in range(0,runs_to_analyze):
+    # Times and count values of all runs, in (Run, Step) order
+    Data = dataframe[col_to_analyze].dropna()
+    Runs = Data.index.get_level_values('Run').to_numpy()
+    Change_t = Data.index.get_level_values('Step').to_numpy()/2       # Correct scale factor - Collector counts 2 steps!
+    Count = Data.to_numpy(dtype=float)
 
-        # Take the data on that run
-        Data_onrun = dataframe[dataframe.index.get_level_values('Run') == run].droplevel('Run')
+    # Limits of the data of every run
+    bounds = np.searchsorted(Runs, np.arange(runs_to_analyze+1))
 
-        # Extract arrays: time and count values
-        Change_t = Data_onrun[[col_to_analyze]].dropna().index.to_numpy()/2       # Correct scale factor - Collector counts 2 steps!
-        Count = Data_onrun[[col_to_analyze]].dropna().to_numpy().transpose()
-        Count = np.reshape(Count,np.size(Count))
-
-        # Add last state - Otherwise step plot looks like garbage
-        Change_t = np.append(Change_t,n_steps)
-        Count = np.append(Count,Count[np.size(Count)-1])
-
-        # Append run data arrays to the lists
-        Change_time_list.append(Change_t)
-        Count_list.append(Count)
+    # Add last state to every run - Otherwise step plot looks like garbage
+    Change_time_list = [np.append(Change_t[start:end],n_steps) for start, end in zip(bounds[:-1],bounds[1:])]
+    Count_list = [np.append(Count[start:end],Count[end-1]) for start, end in zip(bounds[:-1],bounds[1:])]
     
     return Change_time_list, Count_list
 
 #%%
 
 # --------------------------------------
-# RECONSTRUCT BOOLEAN MATRIX FUNCTION
+# RECONSTRUCT BOOLEAN MATRIX FUNCTIONS
 # --------------------------------------
 #
-# DESCRIPTION: from a MF Dataframe, reconstructs the complete State Matrix for a
-#              specific run of the model.
+# DESCRIPTION: from the MF events of a batch (see LoadBatch and ReadMFEvents), reconstructs the complete
+#              State Matrix for a specific run of the model (ReconstructBoolMatrix). The (step, agent)
+#              events of the run are scattered on the matrix and accumulated over the steps: the state
+#              of an agent flips at every one of its changes, starting from all states 0 (or all 1 if
+#              every agent is 'True' at Step=0). EventsBoolMatrices does the same for the first n_runs
+#              runs at once.
 #
 # INPUT ARGUMENTS
 #
-# -dataframe        -> MF Dataframe
-# -countername      -> string with the name of the counter column
-# -changelistname   -> string with the name of the change list column
+# -MF_events        -> dictionary of state -> (events, offsets) of all runs (see LoadBatch)
+# -state            -> state variable to reconstruct ('pv_alone', 'pv_community' or 'community')
 # -run              -> run to analyze
 # -n_steps          -> total number of steps
 # -n_agents         -> total number of agents
+# -events, offsets  -> (step, agent) events of all runs and position of every run in them (see ReadMFEvents)
+# -n_runs           -> number of runs to reconstruct (EventsBoolMatrices)
 #
 # OUTPUT ARGUMENTS
 #
 # -Matrix           -> Matrix that contains the state values with dimensions: (n_steps, n_agents)
+# -Matrices         -> boolean array with the state values of all runs: (n_runs, n_steps, n_agents)
 #
 
-def ReconstructBoolMatrix(dataframe,countername,changelistname,run,n_steps,n_agents):
+def EventsBoolMatrices(events,offsets,n_runs,n_steps,n_agents):
 
-    # Extract the data corresponding to the required run, and drop the 'Run' index
-    dataframe = dataframe[dataframe.index.get_level_values('Run') == run].droplevel('Run')
+    events = np.asarray(events[:offsets[n_runs]])
+    Runs = np.repeat(np.arange(n_runs), np.diff(offsets[:n_runs+1]))
 
-    # Extract the array of times of change
-    Change_t = dataframe[[countername]].dropna().index.to_numpy()/2       # Correct scale factor - Collector counts 2 steps!
-    
-    # Extract the array of counts
-    Counts = dataframe[[countername]].dropna().to_numpy().transpose()
-    Counts = np.reshape(Counts,np.size(Counts))
-    
-    # Extract the array of change lists
-    Changes = dataframe[[changelistname]].dropna().to_numpy().transpose()
-    Changes = np.reshape(Changes,np.size(Changes))
+    # Number of changes of every agent on every step, accumulated over the steps: odd -> 'True'
+    # (uint8 overflows keep the parity)
+    Matrices = np.zeros((n_runs,n_steps,n_agents), dtype=np.uint8)
+    np.add.at(Matrices, (Runs,events[:,0],events[:,1]), 1)
+    np.cumsum(Matrices, axis=1, out=Matrices)
 
-    # Initialize the matris to zeros
-    Matrix = np.zeros((n_steps,n_agents))
+    return (Matrices & 1).astype(bool)
 
-    # If there is any change at all (otherwise the matrix stays 0)
-    if len(Change_t)>1:
+def ReconstructBoolMatrix(MF_events,state,run,n_steps,n_agents):
 
-        Change_list = []
+    # Only the events of the required run are scattered
+    events, offsets = MF_events[state]
+    Matrix = EventsBoolMatrices(events[offsets[run]:offsets[run+1]],[0,offsets[run+1]-offsets[run]],1,n_steps,n_agents)[0]
 
-        # Convert the lists of changes into integer values
-        for j in range(0,len(Changes)):
-
-            # Split the initial string into an array of strings wrto the commas
-            Curr_vect = Changes[j][1:len(Changes[j])-1].split(',')
-
-            #Convert the String values of the array into Integers and append the new array to the list
-            Curr_vect = [int(i) for i in Curr_vect]
-            Change_list.append(Curr_vect)
-
-        # Iterate for all steps
-        for step in range(0,n_steps):
-                
-                # For steps bigger than 0 (we suppose that all values are 0 at Step=0)
-                if(step>0):
-
-                    # Copy the values from the previous step
-                    Matrix[step,:]=Matrix[step-1,:]
-
-                    # If the current step is in the list of times of change
-                    if(step in Change_t):
-
-                        # Get the index of the current step
-                        idx = np.where(Change_t == step)[0][0]
-
-                        # Iterate over all changing agents
-                        for pos in range(0,len(Change_list[idx])):
-
-                            # Set agent state to True
-                            Matrix[step,Change_list[idx][pos]]=True
-    
-    return Matrix
\ No newline at end of file
+    return Matrix.astype(float)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Files of the on-disk caches.
+
+The caches of networks (Tools/SmallWorld.py), of batches of logs
+(Tools/DataloggingFunctions.py) and of runs (Tools/RunCache.py) are folders
+of files shared by processes running in parallel. Every file is written to a
+temporary file and renamed, so that it is never read partially written, and
+the least recently used files are deleted when a cache grows beyond its cap.
+"""
+
+import os, time, uuid
+
+# Suffix of the files being written to a cache, and age (in seconds) after
+# which such a file was left behind by a killed process and is deleted
+TMP_SUFFIX = ".tmp"
+TMP_MAX_AGE = 24*3600
+
+def save_atomic(filename, write):
+    '''
+    This method writes a cache file with write(out_file) to a temporary file
+    and renames it. The temporary file is always deleted, also if write
+    fails.
+    '''
+    tmp_file = filename + "." + uuid.uuid4().hex + TMP_SUFFIX
+    try:
+        with open(tmp_file, "wb") as out_file:
+            write(out_file)
+        os.replace(tmp_file, filename)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+def evict(cache_dir, max_bytes, suffixes=(".npy",)):
+    '''
+    Deletes the least recently used files of the cache until its size is
+    below max_bytes. Only the files ending with one of the suffixes are
+    considered, so temporary files being written are never deleted; those
+    left behind by a killed process are deleted after TMP_MAX_AGE seconds.
+    '''
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(TMP_SUFFIX):
+            try:
+                if time.time() - entry.stat().st_mtime > TMP_MAX_AGE:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        elif entry.name.endswith(suffixes):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for mtime, size, path in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
@@ -1,7 +1,9 @@
 
 import numpy as np
 import pandas as pd
-import json
+import json, copy, os, queue, threading, collections, hashlib
+
+from Tools import CacheFiles, Reducers
 
 #%%
 
@@ -35,34 +37,571 @@ def ChangeCount(bool_mat):
     change_mat = bool_mat[1:bool_mat.shape[0]]^bool_mat[0:bool_mat.shape[0]-1]
     change_mat = np.insert(change_mat,0,1,axis=0)   # Consider time 0 as everyone changing to initial state.
 
-    # Vector with the total number of changes on each timestep
-    count_change = change_mat.sum(axis=1)
+    # Timesteps and Agents of all the changes, sorted by timestep
+    steps, agents = np.nonzero(change_mat)
+    change_steps = np.unique(steps)
+
+    changers_list = [a_list.tolist() for a_list in np.split(agents, np.flatnonzero(np.diff(steps))+1)]    # Agents changing at each timestep
+    time_changes_list = (change_steps*2).tolist()   # Timesteps of changes (x2 CORRECTION -> Each step is counted as 2 by collector)
+    count_list = list(count_v[change_steps])        # Number of agents with 'True' after each change
+
+    return time_changes_list, count_list, changers_list
 
-    changers_list = []          # List that will contain the Agents that have changed
-    count_list = []             # List that will contain the number of 'True' states after the change
-    time_changes_list = []      # List with the timesteps of each change
+#%%
 
-    # Iterate over the change vector
-    for i in range(0,count_change.size):
+# --------------------------
+# CHANGE EVENTS FUNCTION
+# --------------------------
+#
+# DESCRIPTION: Integer encoding of the changes of a boolean state matrix, used by the binary MF logs.
+#              Every change is an event (step, agent) in which the state of the agent flips, starting from
+#              all states 'False' before step 0, so the matrix is recovered by accumulating the events.
+#
+# INPUT ARGUMENTS
+#
+# -bool_mat    -> boolean matrix (n_steps, n_agents) under analysis
+# -start_step  -> step of the first row of the matrix
+# -previous    -> state of the agents before the first row (all 'False' by default)
+#
+# OUTPUT ARGUMENTS
+#
+# -events      -> int32 array (n_events, 2) with the (step, agent) of every change, sorted by step
+#
 
-        # If there are any changes at timestep i
-        if(count_change[i]>0):
+def ChangeEvents(bool_mat,start_step=0,previous=None):
 
-            a_list = []
+    if previous is None:
+        previous = np.zeros(bool_mat.shape[1], dtype=bool)
 
-            # Iterate over the Agents of timestep i
-            for j in range(0,change_mat.shape[1]):
+    change_mat = bool_mat ^ np.concatenate((previous[np.newaxis], bool_mat[:-1]))
+    steps, agents = np.nonzero(change_mat)
 
-                # If Agent j on timestep i has changed
-                if(change_mat[i][j]):
+    return np.stack((steps + start_step, agents), axis=1).astype(np.int32)
 
-                    a_list.append(j)        # Add Agent j to list of agents
-            
-            changers_list.append(a_list)    # Add list of agents to changers_list
-            time_changes_list.append(i*2)   # Add time to list (x2 CORRECTION -> Each step is counted as 2 by collector)
-            count_list.append(count_v[i])   # Add number of agents with 'True' to list
+#%%
 
-    return time_changes_list, count_list, changers_list
+# --------------------------
+# CHANGE TRACKER CLASS
+# --------------------------
+#
+# DESCRIPTION: Incremental version of ChangeCount and ChangeEvents. The rows of the boolean matrix are given
+#              block by block as the simulation advances, and only the last row is kept to detect the next
+#              changes.
+#
+# INPUT ARGUMENTS (update)
+#
+# -bool_mat    -> boolean matrix (n_block_steps, n_agents) with the next rows of the matrix under analysis
+# -start_step  -> step of the first row of the block
+#
+# ATTRIBUTES
+#
+# -events      -> int32 array (n_events, 2) of the changes, as returned by ChangeEvents
+# -changes     -> (time_changes_list, count_list, changers_list) as returned by ChangeCount
+#
+
+class ChangeTracker():
+
+    def __init__(self):
+
+        self.last_row = None
+        self.event_blocks = []
+        self.changes = ([], [], [])
+
+    def update(self, bool_mat, start_step):
+
+        self.event_blocks.append(ChangeEvents(bool_mat,start_step,self.last_row))
+
+        # Consider time 0 as everyone changing to initial state (see ChangeCount)
+        previous = ~bool_mat[0] if self.last_row is None else self.last_row
+        time_changes_list, count_list, changers_list = ChangeCount(np.concatenate((previous[np.newaxis], bool_mat)))
+
+        # First row of ChangeCount is the previous state, skipped
+        for t, count, changers in zip(time_changes_list, count_list, changers_list):
+            if t > 0:
+                self.changes[0].append((start_step - 1)*2 + t)
+                self.changes[1].append(count)
+                self.changes[2].append(changers)
+
+        self.last_row = bool_mat[-1].copy()
+
+    @property
+    def events(self):
+        return np.concatenate(self.event_blocks) if self.event_blocks else np.zeros((0,2), dtype=np.int32)
+
+#%%
+
+# --------------------------
+# WRITE / READ MF EVENTS FUNCTIONS
+# --------------------------
+#
+# DESCRIPTION: Binary MF log of a profile: a directory with, for every state variable, the events of all
+#              runs concatenated in run order (<state>_events.npy, int32 (n_events, 2) with (step, agent))
+#              and the offsets of every run in them (<state>_offsets.npy, int64 (n_runs+1)), plus a JSON
+#              header. The events of run r are events[offsets[r]:offsets[r+1]].
+#              MFEventsFromDataFrame converts a MF DataFrame read from a CSV log into the same encoding. The CSV log
+#              lists every agent as changing at step 0, so (as in ReconstructBoolMatrix) the initial states are
+#              taken as all 'False', or all 'True' if the count of step 0 is the number of agents.
+#
+# INPUT ARGUMENTS
+#
+# -dirname      -> name of the log directory
+# -run_events   -> dictionary of state -> list with the events array of every run, in run order
+# -n_steps      -> number of steps of every run
+# -n_agents     -> number of agents in the model
+# -seeds        -> list with the seeds of all runs, in order (None if not seeded)
+# -states       -> (MFEventsFromDataFrame) dictionary of state -> (count column, change list column) to convert
+#
+# OUTPUT ARGUMENTS (ReadMFEvents, MFEventsFromDataFrame)
+#
+# -mf_events    -> dictionary of state -> (events, offsets)
+# -header       -> dictionary with the JSON header of the log
+#
+
+# MF state variables -> (count column, change list column) of the MF DataFrame
+MF_STATES = {"pv_alone": ("PV_alone_cnt","PV_alone_chg"),
+             "pv_community": ("PV_com_cnt","PV_com_chg"),
+             "community": ("Com_Idea_cnt","Com_Idea_chg")}
+
+def WriteMFEvents (dirname,run_events,n_steps,n_agents,seeds=None):
+
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+
+    n_runs = len(next(iter(run_events.values())))
+    header = {"format": "events",
+              "n_runs": n_runs,
+              "n_steps": n_steps,
+              "n_agents": n_agents,
+              "step_scale": 2,      # Steps counted x2 as in the CSV logs
+              "states": list(run_events),
+              "seeds": seeds}
+
+    for state, events_list in run_events.items():
+        offsets = np.zeros(n_runs+1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(events) for events in events_list])
+        np.save(dirname + "/" + state + "_events.npy", np.concatenate(events_list).astype(np.int32).reshape(-1,2))
+        np.save(dirname + "/" + state + "_offsets.npy", offsets)
+
+    with open(dirname + "/header.json", 'w') as myjson:
+        json.dump(header, myjson, indent=4)
+
+    return
+
+def ReadMFEvents (dirname):
+
+    with open(dirname + "/header.json") as myjson:
+        header = json.loads(myjson.read())
+
+    mf_events = {state:(np.load(dirname + "/" + state + "_events.npy", mmap_mode='r'),
+                        np.load(dirname + "/" + state + "_offsets.npy"))
+                 for state in header["states"]}
+
+    return mf_events, header
+
+def MFEventsFromDataFrame (dataframe,n_runs,states=MF_STATES):
+
+    mf_events = {}
+    runs = dataframe.index.get_level_values('Run').to_numpy()
+    steps = (dataframe.index.get_level_values('Step').to_numpy()/2).astype(np.int32)     # Correct scale factor
+
+    for state, (countername, changelistname) in states.items():
+
+        valid = dataframe[countername].notna().to_numpy()
+        counts = dataframe[countername].to_numpy()[valid]
+        changes = dataframe[changelistname].to_numpy()[valid]
+
+        # Parse all the change lists at once
+        n_changes = np.array([change.count(',')+1 for change in changes], dtype=np.int64)
+        agents = np.array(','.join(change[1:-1] for change in changes).split(','), dtype=np.int32) if len(changes) else np.zeros(0, dtype=np.int32)
+
+        # Step 0 lists every agent (see ChangeCount): only keep it if all of them start as 'True'
+        keep = np.repeat((steps[valid] > 0) | (counts == n_changes), n_changes)
+
+        event_runs = np.repeat(runs[valid], n_changes)[keep]
+        events = np.stack((np.repeat(steps[valid], n_changes)[keep], agents[keep]), axis=1)
+
+        offsets = np.searchsorted(event_runs, np.arange(n_runs+1)).astype(np.int64)
+        mf_events[state] = (events, offsets)
+
+    return mf_events
+
+#%%
+
+# --------------------------
+# CHANGES FROM EVENTS FUNCTION
+# --------------------------
+#
+# DESCRIPTION: Inverse of ChangeEvents for one run, giving the (time_changes_list, count_list, changers_list)
+#              lists of ChangeCount, so that the MF DataFrame of a run can be built with MFDataFrameFromChanges.
+#
+# INPUT ARGUMENTS
+#
+# -events      -> int32 array (n_events, 2) with the (step, agent) of every change of the run
+# -n_agents    -> number of agents in the model
+#
+
+def ChangesFromEvents(events,n_agents):
+
+    steps = np.asarray(events[:,0], dtype=np.int64)
+    agents = np.asarray(events[:,1], dtype=np.int64)
+
+    # Every event flips the state: the k-th event of an agent sets it to 'True' if k is even
+    order = np.lexsort((steps, agents))
+    rank = np.arange(len(order)) - np.searchsorted(agents[order], agents[order])
+    delta = np.empty(len(order), dtype=np.int64)
+    delta[order] = np.where(rank % 2 == 0, 1, -1)
+
+    # Number of agents with 'True' after each step with changes
+    change_steps, first = np.unique(steps, return_index=True)
+    count_v = np.cumsum(delta)[np.append(first[1:], len(steps)) - 1] if len(steps) else np.zeros(0, dtype=np.int64)
+    changers = np.split(agents, first[1:]) if len(steps) else []
+
+    # Time 0 is considered as everyone changing to initial state (see ChangeCount)
+    if len(change_steps) == 0 or change_steps[0] > 0:
+        change_steps = np.insert(change_steps, 0, 0)
+        count_v = np.insert(count_v, 0, 0)
+        changers.insert(0, agents[:0])
+    changers[0] = np.arange(n_agents)
+
+    return (change_steps*2).tolist(), list(count_v), [a_list.tolist() for a_list in changers]
+
+#%%
+
+# --------------------------
+# MF DATAFRAME FUNCTION
+# --------------------------
+#
+# DESCRIPTION: Builds the Medium Frequency DataFrame of a run from its boolean state matrices, with the
+#              counts and the changing agents of every state at the steps where it changes (see ChangeCount).
+#
+# INPUT ARGUMENTS
+#
+# -pv_alone_mat  -> boolean matrix (n_steps, n_agents) of agents with individual PV
+# -pv_com_mat    -> boolean matrix (n_steps, n_agents) of agents in a solar community
+# -Com_Idea_mat  -> boolean matrix (n_steps, n_agents) of agents with the community idea
+# -run           -> model run# in the context of a batch
+#
+# OUTPUT ARGUMENTS
+#
+# -joint_dataframe -> MF DataFrame of the run, indexed by Step
+#
+# MFDataFrameFromChanges builds the same DataFrame from the (time_changes_list, count_list, changers_list)
+# tuples of the three states, as returned by ChangeCount or tracked step by step by a ChangeTracker.
+#
+
+def MFDataFrame(pv_alone_mat,pv_com_mat,Com_Idea_mat,run):
+
+    return MFDataFrameFromChanges(ChangeCount(pv_alone_mat),ChangeCount(pv_com_mat),ChangeCount(Com_Idea_mat),run)
+
+def MFDataFrameFromChanges(pv_alone_changes,pv_com_changes,Com_Idea_changes,run):
+
+    # Lists of the PV_alone Matrix (see CHANGE COUNT Function)
+    pv_alone_t, pv_alone_cnt, pv_alone_chg = pv_alone_changes
+
+    # Create dataframe from obtained lists
+    dataframe_pv_alone = pd.DataFrame(list(zip(pv_alone_cnt,pv_alone_chg)),index=pv_alone_t,columns=['PV_alone_cnt','PV_alone_chg'])
+    dataframe_pv_alone.index.name = 'Step'
+
+    # Lists of the PV_community Matrix
+    pv_com_t, pv_com_cnt, pv_com_chg = pv_com_changes
+
+    # Create dataframe from obtained lists
+    dataframe_pv_com = pd.DataFrame(list(zip(pv_com_cnt,pv_com_chg)),index=pv_com_t,columns=['PV_com_cnt','PV_com_chg'])
+    dataframe_pv_com.index.name = 'Step'
+    
+    # Lists of the Idea Matrix
+    Com_Idea_t, Com_Idea_cnt, Com_Idea_chg = Com_Idea_changes
+
+    # Create dataframe from obtained lists
+    dataframe_com_idea = pd.DataFrame(list(zip(Com_Idea_cnt,Com_Idea_chg)),index=Com_Idea_t,columns=['Com_Idea_cnt','Com_Idea_chg'])
+    dataframe_com_idea.index.name = 'Step'
+
+    # Merge the dataframes with the join function. Values on one DataFrame that don't exist on the other are replaced by NaN
+    joint_dataframe = dataframe_pv_alone.join(dataframe_pv_com,how='outer')
+    joint_dataframe = joint_dataframe.join(dataframe_com_idea,how='outer')
+
+    # Add current run to Run column
+    joint_dataframe.insert(0,"Run",np.full(len(joint_dataframe.index),run))
+
+    return joint_dataframe
+
+#%%
+
+# --------------------------
+# AGENT RECORDER CLASS
+# --------------------------
+#
+# DESCRIPTION: Columnar recorder of the agent variables, replacing mesa's DataCollector. Every variable
+#              is stored in a preallocated typed array of shape (n_steps, agents_shape) that is filled by
+#              slice assignment once per step. The arrays are used directly by Write2CSV and by analysis.
+#
+# INPUT ARGUMENTS
+#
+# -agents_shape -> number of agents, or shape of the agent arrays of the model (e.g. (n_scenarios,n_agents))
+# -n_steps      -> number of steps to preallocate (the arrays grow if more steps are recorded)
+#
+# ATTRIBUTES
+#
+# -recorder[name] -> array (n_steps, agents_shape) of column name, only the recorded steps
+# -n_steps        -> number of steps recorded
+#
+# recorder.view(index) returns a recorder over a slice of the agent arrays without copying them,
+# e.g. view((0,run)) gives the (n_steps, n_agents) arrays of one run of a batched VectorModel.
+#
+# The model must provide get_agent_values(attribute), returning the array of an agent attribute.
+#
+
+class AgentRecorder():
+
+    # Agent reporters: column name -> (agent attribute, dtype)
+    reporters = {
+        "Utility" : ("utility", np.float32),
+        "Opinion" : ("awareness", np.float32),
+        "Uncertainty" : ("awareness_unc", np.float32),
+        "Neighbor" : ("neighbor", np.float32),
+        "Profit" : ("profit", np.float32),
+        "pv_alone" : ("pv_alone", np.bool_),
+        "community" : ("community", np.bool_),
+        "pv_community" : ("pv_community", np.bool_)}
+
+    def __init__(self, agents_shape, n_steps=1):
+
+        self.agents_shape = tuple(np.atleast_1d(agents_shape))
+        self.n_steps = 0
+        self.arrays = {name:np.zeros((max(n_steps,1),)+self.agents_shape, dtype=dtype)
+                       for name, (attr, dtype) in self.reporters.items()}
+
+    def collect(self, model):
+
+        # Double the capacity if the preallocated steps are exhausted
+        if self.n_steps == len(self.arrays["Utility"]):
+            self.arrays = {name:np.concatenate((array,np.zeros_like(array))) for name, array in self.arrays.items()}
+
+        # Slice assignment of the current step
+        for name, (attr, dtype) in self.reporters.items():
+            self.arrays[name][self.n_steps] = model.get_agent_values(attr)
+
+        self.n_steps += 1
+
+    def __getitem__(self, name):
+        return self.arrays[name][:self.n_steps]
+
+    def view(self, index):
+
+        view = copy.copy(self)
+        view.arrays = {name:array[(slice(None),)+tuple(index)] for name, array in self.arrays.items()}
+        view.agents_shape = view.arrays["Utility"].shape[1:]
+
+        return view
+
+#%%
+
+# --------------------------
+# STREAMING RECORDER CLASS
+# --------------------------
+#
+# DESCRIPTION: Recorder with the same interface as AgentRecorder that keeps only a bounded buffer of
+#              block_steps steps. Full blocks are handed to a background thread that writes them to the logs
+#              of every run while the simulation goes on, so the memory used does not grow with n_steps.
+#              The queue between both holds one block, so at most three blocks exist at a time.
+#
+# INPUT ARGUMENTS
+#
+# -writers      -> list of (index, writer) pairs, one per run recorded: index selects the run in the agent
+#                  arrays of the model (as in AgentRecorder.view) and writer is a CSVLogWriter or NPYLogWriter
+# -block_steps  -> number of steps buffered before writing
+#
+# close() must be called after the last step: it writes the remaining steps, waits for the writer thread
+# and closes the writers.
+#
+
+class StreamingRecorder(AgentRecorder):
+
+    def __init__(self, writers, block_steps=16):
+
+        self.writers = writers
+        self.block_steps = max(block_steps,1)
+        self.n_steps = 0
+        self.block_start = 0
+        self.arrays = None      # Allocated at the first step, with the shape of the agent arrays
+
+        self.error = None
+        self.queue = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self.write_blocks, daemon=True)
+        self.thread.start()
+
+    def collect(self, model):
+
+        values = {name:model.get_agent_values(attr) for name, (attr, dtype) in self.reporters.items()}
+        if self.arrays is None:
+            self.agents_shape = np.shape(values["Utility"])
+            self.arrays = self.new_block()
+
+        for name, value in values.items():
+            self.arrays[name][self.n_steps - self.block_start] = value
+
+        self.n_steps += 1
+        if self.n_steps - self.block_start == self.block_steps:
+            self.flush()
+
+    def new_block(self):
+        return {name:np.zeros((self.block_steps,)+self.agents_shape, dtype=dtype) for name, (attr, dtype) in self.reporters.items()}
+
+    def flush(self):
+
+        if self.n_steps > self.block_start:
+
+            # The writer thread owns the full block, the simulation continues on a new one
+            block = {name:array[:self.n_steps - self.block_start] for name, array in self.arrays.items()}
+            self.queue.put((self.block_start, block))
+            self.arrays = self.new_block()
+            self.block_start = self.n_steps
+
+    def write_blocks(self):
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue
+
+            start_step, block = item
+            try:
+                for index, writer in self.writers:
+                    writer.write_block({name:array[(slice(None),)+tuple(index)] for name, array in block.items()}, start_step)
+            except Exception as error:
+                self.error = error      # Raised by close() in the simulation thread
+
+    def close(self):
+
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+        for index, writer in self.writers:
+            writer.close()
+
+    def __getitem__(self, name):
+        raise KeyError("Streamed variables are written to the logs, not kept in memory: " + str(name))
+
+#%%
+
+# --------------------------
+# LOG WRITER CLASSES
+# --------------------------
+#
+# DESCRIPTION: Writers of the logs of a run, fed block by block by a StreamingRecorder.
+#              CSVLogWriter appends the HF rows to a CSV file and tracks the MF changes incrementally, writing the
+#              MF rows when closed. NPYLogWriter writes the blocks to the run's slice of binary HF logs (see Write2NPY)
+#              and tracks the MF change events, returned by events() to be written with WriteMFEvents.
+#              SummaryLogWriter applies the reducers of Tools/Reducers.py to every block and appends the per-step
+#              summary rows to a CSV file. SummaryCollector only keeps the summary of the last step in memory
+#              (final, a dictionary of summary column -> value), for parameter sweeps.
+#
+# INPUT ARGUMENTS
+#
+# -HF_file, MF_file   -> CSV files of the run, truncated when the writer is created (CSVLogWriter). The HF log is
+#                        not written if HF_file is None
+# -HF_dir             -> binary HF log directory, created with InitializeNPY (NPYLogWriter), None to skip it
+# -HF_columns         -> list of HF columns to write
+# -MF_states          -> (NPYLogWriter) list of state variables tracked for the MF log
+# -Summary_file       -> (SummaryLogWriter) CSV file of the run, truncated when the writer is created
+# -reducers           -> (SummaryLogWriter, SummaryCollector) dictionary of reducer name -> arguments (see
+#                        Reducers.reduce_block)
+# -run                -> model run# in the context of a batch
+#
+
+class CSVLogWriter():
+
+    # Recorded state variables of the MF log
+    states = ("pv_alone", "pv_community", "community")
+
+    def __init__(self, HF_file, MF_file, HF_columns, run):
+
+        self.HF_file = HF_file
+        self.MF_file = MF_file
+        self.HF_columns = HF_columns
+        self.run = run
+        self.trackers = {state:ChangeTracker() for state in self.states}
+
+        for filename in (HF_file, MF_file):
+            if filename is not None:
+                open(filename, 'w').close()
+
+    def write_block(self, block, start_step):
+
+        if self.HF_file is not None:
+            n_steps, n_agents = block["Utility"].shape
+            Write2CSV(self.HF_file,self.HF_columns,block,self.run,n_steps,n_agents,df_type='HF',start_step=start_step)
+
+        for state, tracker in self.trackers.items():
+            tracker.update(block[state], start_step)
+
+    def close(self):
+
+        joint_dataframe = MFDataFrameFromChanges(*[self.trackers[state].changes for state in self.states],self.run)
+        joint_dataframe.to_csv(self.MF_file, sep=';', mode='a', header=False)
+
+class NPYLogWriter():
+
+    def __init__(self, HF_dir, HF_columns, MF_states, run):
+
+        self.HF_dir = HF_dir
+        self.HF_columns = HF_columns
+        self.run = run
+        self.trackers = {state:ChangeTracker() for state in MF_states}
+
+    def write_block(self, block, start_step):
+
+        if self.HF_dir is not None:
+            Write2NPY(self.HF_dir,self.HF_columns,block,self.run,start_step)
+
+        for state, tracker in self.trackers.items():
+            tracker.update(block[state], start_step)
+
+    def close(self):
+        pass
+
+    def events(self):
+        return {state:tracker.events for state, tracker in self.trackers.items()}
+
+class SummaryLogWriter():
+
+    def __init__(self, Summary_file, reducers, run):
+
+        self.Summary_file = Summary_file
+        self.reducers = reducers
+        self.run = run
+
+        open(Summary_file, 'w').close()
+
+    def write_block(self, block, start_step):
+
+        summary = Reducers.reduce_block(block, self.reducers)
+        n_steps = len(block["Utility"])
+        Write2CSV(self.Summary_file,["Run"]+list(summary),summary,self.run,n_steps,0,df_type='SU',start_step=start_step)
+
+    def close(self):
+        pass
+
+class SummaryCollector():
+
+    def __init__(self, reducers):
+
+        self.reducers = reducers
+        self.final = {}
+
+    def write_block(self, block, start_step):
+
+        summary = Reducers.reduce_block({name:values[-1:] for name, values in block.items()}, self.reducers)
+        self.final = {col:values[0].item() for col, values in summary.items()}
+
+    def close(self):
+        pass
 
 #%%
 
@@ -97,70 +636,70 @@ def InitializeCSV (filename,columns,indexes):
 #
 # DESCRIPTION: Writes logging data to a previously initialized csv file in one of the two dataframe types
 #              used: either HF (High Frequency) DataFrame or MF (Medium Frequency) DataFrame. It does not
-#              overwrite existing data, so it can be applied iteratively.
+#              overwrite existing data, so it can be applied iteratively. Price scenario ensembles write
+#              their per-scenario aggregates as an SC (Scenario) DataFrame, and the reducers of a run their
+#              per-step summaries as an SU (Summary) DataFrame.
 #
 # INPUT ARGUMENTS
 #
-# -filename             -> name of the csv file to write to
+# -filename             -> name of the csv file to write to (or text buffer, e.g. io.StringIO)
 # -columns              -> list of desired column indexes
-# -collector_dataframe  -> complete dataframe from the model's data collector
+# -recorder             -> AgentRecorder of the run (HF, MF), ScenarioRecorder of the run (SC), or dictionary of
+#                          summary columns of a block of steps (SU)
 # -run                  -> model run# in the context of a batch
 # -n_steps              -> number of steps executed
 # -n_agents             -> number of agents in the model
 # -seed                 -> seed of current run
-# -df_type              -> type of DataFrame (either ='MF' or ='HF', otherwise it will give an error)
+# -df_type              -> type of DataFrame (either ='MF', ='HF', ='SC' or ='SU', otherwise it will give an error)
+# -start_step           -> (HF, SU only) step of the first recorded row, to write a run block by block
 #
 # OUTPUT ARGUMENTS
 #
 # -err                  -> returns 1 if has detected an error
 #
 
-def Write2CSV (filename,columns,collector_dataframe,run,n_steps,n_agents,df_type='HF'):
+def Write2CSV (filename,columns,recorder,run,n_steps,n_agents,df_type='HF',start_step=0):
 
     err=0   # If nothing bad happens, err remanins at 0
 
     # If we want to write a High Frequency DataFrame
     if df_type == "HF":
-                
-        collector_dataframe.insert(0,"Run",np.full(len(collector_dataframe.index),run)) # Insert Run column
-        dataframe_truncated = collector_dataframe[columns]  # Truncate the complete dataframe only with the columns we want
-        dataframe_truncated.to_csv(filename, sep=';', mode='a', header=False)   # Write data to CSV, without header and in append mode
 
-    # If we want to write a Medium Frequency DataFrame
-    elif df_type == "MF":
-        
-        # Create data Matrices from the input DataFrame in order to analyze them
-        pv_alone_mat = np.reshape(collector_dataframe.pv_alone.to_numpy(),(n_steps,n_agents))
-        pv_com_mat = np.reshape(collector_dataframe.pv_community.to_numpy(),(n_steps,n_agents))
-        Com_Idea_mat = np.reshape(collector_dataframe.community.to_numpy(),(n_steps,n_agents))
+        # Index columns (Step counted x2 as the mesa collector did) and data columns
+        data = {"Step": np.repeat(np.arange(start_step,start_step+n_steps)*2,n_agents), "AgentID": np.tile(np.arange(n_agents),n_steps)}
+        data.update({col: (np.full(n_steps*n_agents,run) if col == "Run" else recorder[col].reshape(-1)) for col in columns})
 
-        # Analyze the PV_alone Matrix with CHANGE COUNT Function to get the corresponding set of lists
-        pv_alone_t, pv_alone_cnt, pv_alone_chg = ChangeCount(pv_alone_mat)
+        pd.DataFrame(data).to_csv(filename, sep=';', mode='a', header=False, index=False)   # Write data to CSV, without header and in append mode
 
-        # Create dataframe from obtained lists
-        dataframe_pv_alone = pd.DataFrame(list(zip(pv_alone_cnt,pv_alone_chg)),index=pv_alone_t,columns=['PV_alone_cnt','PV_alone_chg'])
-        dataframe_pv_alone.index.name = 'Step'
+    # If we want to write a Scenario DataFrame (same as HF, indexed by Scenario and Step)
+    elif df_type == "SC":
 
-        # Analyze the PV_community Matrix with CHANGE COUNT Function to get the corresponding set of lists
-        pv_com_t, pv_com_cnt, pv_com_chg = ChangeCount(pv_com_mat)
+        n_scenarios = recorder['Utility'].shape[1]
 
-        # Create dataframe from obtained lists
-        dataframe_pv_com = pd.DataFrame(list(zip(pv_com_cnt,pv_com_chg)),index=pv_com_t,columns=['PV_com_cnt','PV_com_chg'])
-        dataframe_pv_com.index.name = 'Step'
-        
-        # Analyze the Idea Matrix with CHANGE COUNT Function to get the corresponding set of lists
-        Com_Idea_t, Com_Idea_cnt, Com_Idea_chg = ChangeCount(Com_Idea_mat)
+        # Index columns (Step counted x2 as in HF) and data columns, scenario by scenario
+        data = {"Scenario": np.repeat(np.arange(n_scenarios),n_steps), "Step": np.tile(np.arange(n_steps)*2,n_scenarios)}
+        data.update({col: (np.full(n_steps*n_scenarios,run) if col == "Run" else recorder[col].T.reshape(-1)) for col in columns})
 
-        # Create dataframe from obtained lists
-        dataframe_com_idea = pd.DataFrame(list(zip(Com_Idea_cnt,Com_Idea_chg)),index=Com_Idea_t,columns=['Com_Idea_cnt','Com_Idea_chg'])
-        dataframe_com_idea.index.name = 'Step'
+        pd.DataFrame(data).to_csv(filename, sep=';', mode='a', header=False, index=False)   # Write data to CSV, without header and in append mode
 
-        # Merge the dataframes with the join function. Values on one DataFrame that don't exist on the other are replaced by NaN
-        joint_dataframe = dataframe_pv_alone.join(dataframe_pv_com,how='outer')
-        joint_dataframe = joint_dataframe.join(dataframe_com_idea,how='outer')
+    # If we want to write a Summary DataFrame (per-step summary columns of the reducers, indexed by Step)
+    elif df_type == "SU":
+
+        data = {"Step": np.arange(start_step,start_step+n_steps)*2}
+        data.update({col: (np.full(n_steps,run) if col == "Run" else recorder[col]) for col in columns})
+
+        pd.DataFrame(data).to_csv(filename, sep=';', mode='a', header=False, index=False)   # Write data to CSV, without header and in append mode
+
+    # If we want to write a Medium Frequency DataFrame
+    elif df_type == "MF":
+        
+        # Take the state Matrices from the recorder in order to analyze them
+        pv_alone_mat = np.reshape(recorder['pv_alone'],(n_steps,n_agents))
+        pv_com_mat = np.reshape(recorder['pv_community'],(n_steps,n_agents))
+        Com_Idea_mat = np.reshape(recorder['community'],(n_steps,n_agents))
 
-        # Add current run to Run column
-        joint_dataframe.insert(0,"Run",np.full(len(joint_dataframe.index),run))
+        # Changes and counts of the three state matrices
+        joint_dataframe = MFDataFrame(pv_alone_mat,pv_com_mat,Com_Idea_mat,run)
 
         # Write to CSV
         joint_dataframe.to_csv(filename, sep=';', mode='a', header=False) # Write data to CSV, without header and in append mode
@@ -172,6 +711,103 @@ def Write2CSV (filename,columns,collector_dataframe,run,n_steps,n_agents,df_type
 
     return(err)
 
+#%%
+
+# --------------------------
+# INITIALIZE NPY FUNCTION
+# --------------------------
+#
+# DESCRIPTION: Creates (or resets, if existant) a binary columnar log: a directory with one .npy file per
+#              column, of shape (n_runs, n_steps, n_agents), and a JSON header with the dimensions. Runs are
+#              written in place with Write2NPY, so they can be written in any order and by any process.
+#
+# INPUT ARGUMENTS
+#
+# -dirname    -> name of the log directory to create/initialize
+# -columns    -> dictionary of column name -> dtype
+# -n_runs     -> number of runs of the batch
+# -n_steps    -> number of steps of every run
+# -n_agents   -> number of agents in the model
+# -seeds      -> list with the seeds of all runs, in order (None if not seeded)
+#
+
+def InitializeNPY (dirname,columns,n_runs,n_steps,n_agents,seeds=None):
+
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+
+    shape = (n_runs,n_steps,n_agents)
+
+    header = {"dims": ["Run","Step","AgentID"],
+              "shape": list(shape),
+              "step_scale": 2,      # Steps counted x2 as in the CSV logs
+              "columns": {col:np.dtype(dtype).name for col, dtype in columns.items()},
+              "seeds": seeds}
+
+    with open(dirname + "/header.json", 'w') as myjson:
+        json.dump(header, myjson, indent=4)
+
+    # Preallocated column files (written lazily by the file system)
+    for col, dtype in columns.items():
+        np.lib.format.open_memmap(dirname + "/" + col + ".npy", mode='w+', dtype=dtype, shape=shape).flush()
+
+    return
+
+#%%
+
+# --------------------------
+# WRITE TO NPY FUNCTION
+# --------------------------
+#
+# DESCRIPTION: Writes the recorded variables of a run to its slice of the column files of a binary log
+#              created with InitializeNPY. Processes writing different runs never overlap.
+#
+# INPUT ARGUMENTS
+#
+# -dirname    -> name of the log directory to write to
+# -columns    -> list of columns to write (names of the recorder variables)
+# -recorder   -> AgentRecorder of the run
+# -run        -> model run# in the context of a batch
+# -start_step -> step of the first recorded row, to write a run block by block
+#
+
+def Write2NPY (dirname,columns,recorder,run,start_step=0):
+
+    for col in columns:
+        column = np.load(dirname + "/" + col + ".npy", mmap_mode='r+')
+        column[run,start_step:start_step+len(recorder[col])] = recorder[col]
+        column.flush()
+        del column
+
+    return
+
+#%%
+
+# --------------------------
+# READ NPY LOG
+# --------------------------
+#
+# DESCRIPTION: Opens a binary log created with InitializeNPY, memory-mapping its columns without reading them.
+#
+# INPUT ARGUMENTS
+#
+# -dirname    -> name of the log directory
+#
+# OUTPUT ARGUMENTS
+#
+# -columns    -> dictionary of column name -> read-only memory-mapped array (n_runs, n_steps, n_agents)
+# -header     -> dictionary with the JSON header of the log
+#
+
+def ReadNPY (dirname):
+
+    with open(dirname + "/header.json") as myjson:
+        header = json.loads(myjson.read())
+
+    columns = {col:np.load(dirname + "/" + col + ".npy", mmap_mode='r') for col in header["columns"]}
+
+    return columns, header
+
 
 #%%
 
@@ -180,6 +816,10 @@ def Write2CSV (filename,columns,collector_dataframe,run,n_steps,n_agents,df_type
 # --------------------------
 #
 # DESCRIPTION: Reads a CSV batch, including input and output data and returns all useful variables.
+#              Binary logs (see InitializeNPY) are memory-mapped instead: HF_data is then a dictionary
+#              of (n_runs, n_steps, n_agents) arrays, and MF_data is rebuilt from the change events.
+#              BatchFiles gives the names of the input and log files of a batch, and ReadMFDataFrame
+#              rebuilds the MF DataFrame of a binary MF log, with the change lists as lists of agents.
 #
 # INPUT ARGUMENTS
 #
@@ -188,7 +828,7 @@ def Write2CSV (filename,columns,collector_dataframe,run,n_steps,n_agents,df_type
 #   
 # OUTPUT ARGUMENTS
 #
-# -HF_data      -> High Frequency Dataframe
+# -HF_data      -> High Frequency Dataframe (or dictionary of memory-mapped arrays for binary logs)
 # -MF_data      -> Medium Frequency Dataframe
 # -x_coord      -> Array with building x-coordinates
 # -y_coord      -> Array with building y-coordinates
@@ -200,34 +840,67 @@ def Write2CSV (filename,columns,collector_dataframe,run,n_steps,n_agents,df_type
 #
 # HF_data,MF_data,x_coord,y_coord,n_runs,n_steps,n_agents,input_dict,seeds
 
-def ReadCSVBatch (expt_name,curr_profile,profile_suffix):
+def BatchFiles (expt_name,curr_profile,profile_suffix):
 
-    # Systematical naming for input and output files                                
+    # Systematical naming for input and output files
     curr_profile_name = profile_suffix+str(curr_profile)     # Current Profile name
-    m_prof_file = "Data/Experiments/" + expt_name + "/" + curr_profile_name + ".json"         # Current input profile
-    m_data_file = "Data/buildings_meta.json"
+    log_name = "Datalogs/Logs/" + expt_name + "/" + curr_profile_name
+
+    return {"profile": "Data/Experiments/" + expt_name + "/" + curr_profile_name + ".json",         # Current input profile
+            "meta": "Data/buildings_meta.json",
+            "HF": log_name + "_HF.csv",
+            "MF": log_name + "_MF.csv",
+            "HF_dir": log_name + "_HF",
+            "MF_dir": log_name + "_MF",
+            "Coordinates": log_name + "_Coordinates.csv"}
+
+def ReadMFDataFrame (dirname):
+
+    MF_events, header = ReadMFEvents(dirname)
+    (n_runs, n_agents) = (header["n_runs"], header["n_agents"])
 
-    # Datalogging files
-    HF_data_file = "Datalogs/Logs/" + expt_name + "/" + curr_profile_name + "_HF.csv"
-    MF_data_file = "Datalogs/Logs/" + expt_name + "/" + curr_profile_name + "_MF.csv"
-    Coord_file = "Datalogs/Logs/" + expt_name + "/" + curr_profile_name + "_Coordinates.csv"
+    # MF DataFrame of every run, built from the events without a text round-trip
+    # (the change columns hold lists of agents instead of their text)
+    run_frames = []
+    for run in range(n_runs):
+        run_changes = [ChangesFromEvents(events[offsets[run]:offsets[run+1]],n_agents) for events, offsets in (MF_events[state] for state in MF_STATES)]
+        run_frames.append(MFDataFrameFromChanges(*run_changes,run))
+
+    return pd.concat(run_frames).set_index('Run', append=True).reorder_levels(['Run','Step'])
+
+def ReadCSVBatch (expt_name,curr_profile,profile_suffix):
+
+    files = BatchFiles(expt_name,curr_profile,profile_suffix)
 
     # Input JSON File
-    with open(m_data_file) as myjson:
+    with open(files["meta"]) as myjson:
         input_dict = json.loads(myjson.read())
 
-    with open(m_prof_file) as myjson:
+    with open(files["profile"]) as myjson:
         input_dict.update(json.loads(myjson.read()))
 
-    # Read data from the CSV
-    MF_data = pd.read_csv(MF_data_file, sep=';', index_col=['Run','Step'])
-    HF_data = pd.read_csv(HF_data_file, sep=';', index_col=['Run','Step','AgentID'])
-    Coords = pd.read_csv(Coord_file, sep=';', index_col=['AgentID'])
+    Coords = pd.read_csv(files["Coordinates"], sep=';', index_col=['AgentID'])
 
     # Extract Coordinate Arrays
     x_coord = Coords['x'].to_numpy()
     y_coord = Coords['y'].to_numpy()
 
+    # Binary logs: memory-mapped columns, dimensions from the header
+    if os.path.isdir(files["HF_dir"]):
+
+        HF_data, header = ReadNPY(files["HF_dir"])
+        (n_runs, n_steps, n_agents) = header["shape"]
+
+        MF_data = ReadMFDataFrame(files["MF_dir"])
+
+        seeds = np.array([seed for seed in (header["seeds"] or []) if seed is not None])
+
+        return HF_data,MF_data,x_coord,y_coord,n_runs,n_steps,n_agents,input_dict,seeds
+
+    # Read data from the CSV
+    MF_data = pd.read_csv(files["MF"], sep=';', index_col=['Run','Step'])
+    HF_data = pd.read_csv(files["HF"], sep=';', index_col=['Run','Step','AgentID'])
+
     # Extract Seeds
     seeds = MF_data['Seed'].dropna().to_numpy()
 
@@ -239,3 +912,180 @@ def ReadCSVBatch (expt_name,curr_profile,profile_suffix):
     n_agents +=1
 
     return HF_data,MF_data,x_coord,y_coord,n_runs,n_steps,n_agents,input_dict,seeds
+
+#%%
+
+# --------------------------
+# LOAD BATCH (CACHED)
+# --------------------------
+#
+# DESCRIPTION: Same as ReadCSVBatch, with HF_data as a dictionary of (n_runs, n_steps, n_agents) arrays of
+#              the requested columns only, and two levels of cache so that repeated reads are almost free:
+#              - an in-process LRU cache of the last BATCH_LRU_SIZE batches read
+#              - an on-disk cache in BATCH_CACHE_DIR with the parsed HF columns of CSV logs (memory-mapped
+#                .npy files, each column parsed the first time it is requested) and the MF DataFrame
+#              Both are keyed on the path, modification time and size of every input and log file of the
+#              batch, so a new simulation or a changed profile is never served stale data. The least recently
+#              used files are deleted when the on-disk cache grows beyond BATCH_CACHE_MAX_BYTES.
+#              The MF changes are also returned as (step, agent) events, the arrays of a binary MF log (see
+#              ReadMFEvents), so that the state matrices are rebuilt without parsing the change lists.
+#
+# INPUT ARGUMENTS
+#
+# -curr_profile     -> number of batch to read
+# -profile_suffix   -> string with the suffix used for data storage, eg "profile_"
+# -columns          -> list of HF columns to return (None -> all, [] -> only dimensions and MF data)
+# -cache_dir        -> directory of the on-disk cache (None -> no on-disk cache)
+#
+# OUTPUT ARGUMENTS
+#
+# -> see ReadCSVBatch, with HF_data as a dictionary of arrays, and
+# -MF_events    -> dictionary of state -> (events, offsets) of all runs (see ReadMFEvents)
+#
+# The arrays are shared with the in-process cache and read-only, copy them to modify them. MF_data is a copy
+# of the cached DataFrame (its change lists are shared, they must not be modified in place).
+#
+# HF_data,MF_data,x_coord,y_coord,n_runs,n_steps,n_agents,input_dict,seeds,MF_events
+#
+
+# Directory, size cap (in bytes) and version of the on-disk cache, and size of the in-process cache
+BATCH_CACHE_DIR = "Datalogs/Cache/Batches"
+BATCH_CACHE_MAX_BYTES = 2**32
+BATCH_CACHE_VERSION = 2
+BATCH_LRU_SIZE = 8
+
+batch_lru = collections.OrderedDict()
+
+def LoadBatch (expt_name,curr_profile,profile_suffix,columns=None,cache_dir=BATCH_CACHE_DIR):
+
+    files = BatchFiles(expt_name,curr_profile,profile_suffix)
+    binary = os.path.isdir(files["HF_dir"])
+
+    # Cache key: every input and log file of the batch with its modification time and size
+    if binary:
+        sources = [files["meta"], files["profile"], files["Coordinates"]] + sorted(entry.path for log_dir in (files["HF_dir"], files["MF_dir"]) for entry in os.scandir(log_dir))
+    else:
+        sources = [files["meta"], files["profile"], files["Coordinates"], files["HF"], files["MF"]]
+    stats = [(os.path.abspath(f), stat.st_mtime_ns, stat.st_size) for f, stat in ((f, os.stat(f)) for f in sources)]
+    key = hashlib.sha1(repr((BATCH_CACHE_VERSION, stats)).encode()).hexdigest()
+
+    lru_key = (key, None if columns is None else tuple(columns))
+    if lru_key in batch_lru:
+        batch_lru.move_to_end(lru_key)
+        HF_data,MF_data,x_coord,y_coord,n_runs,n_steps,n_agents,input_dict,seeds,MF_events = batch_lru[lru_key]
+        return dict(HF_data),MF_data.copy(),x_coord,y_coord,n_runs,n_steps,n_agents,copy.deepcopy(input_dict),seeds,dict(MF_events)
+
+    # Input JSON File
+    with open(files["meta"]) as myjson:
+        input_dict = json.loads(myjson.read())
+
+    with open(files["profile"]) as myjson:
+        input_dict.update(json.loads(myjson.read()))
+
+    Coords = pd.read_csv(files["Coordinates"], sep=';', index_col=['AgentID'])
+
+    # Extract Coordinate Arrays
+    x_coord = Coords['x'].to_numpy()
+    y_coord = Coords['y'].to_numpy()
+
+    if binary:
+
+        HF_columns, header = ReadNPY(files["HF_dir"])
+        (n_runs, n_steps, n_agents) = header["shape"]
+        HF_data = {col:HF_columns[col] for col in (header["columns"] if columns is None else columns)}
+
+        MF_data = CachedMFDataFrame(key, cache_dir, lambda: ReadMFDataFrame(files["MF_dir"]))
+        MF_events = ReadMFEvents(files["MF_dir"])[0]
+        seeds = np.array([seed for seed in (header["seeds"] or []) if seed is not None])
+
+    else:
+
+        # Extract number of Steps and Number of Agents -> Last run, last step, last agents (see ReadCSVBatch)
+        with open(files["HF"]) as HF_file:
+            HF_header = HF_file.readline().strip().split(';')
+        last_row = dict(zip(HF_header, LastCSVRow(files["HF"])))
+        (n_runs, n_steps, n_agents) = [int(float(last_row[index])) for index in ('Run','Step','AgentID')]
+        n_steps = int((n_steps/2)+1)    # Correct to actual number (length value = last+1), steps re-scaled
+        n_runs +=1
+        n_agents +=1
+
+        if columns is None:
+            columns = [col for col in HF_header if col not in ('Run','Step','AgentID')]
+        HF_data = CachedHFColumns(key, cache_dir, files["HF"], columns, (n_runs, n_steps, n_agents))
+
+        MF_data = CachedMFDataFrame(key, cache_dir, lambda: pd.read_csv(files["MF"], sep=';', index_col=['Run','Step']))
+        MF_events = MFEventsFromDataFrame(MF_data,n_runs)
+        seeds = MF_data['Seed'].dropna().to_numpy()
+
+    if cache_dir is not None and os.path.isdir(cache_dir):
+        CacheFiles.evict(cache_dir, BATCH_CACHE_MAX_BYTES, suffixes=(".npy", ".pkl"))
+
+    # The arrays returned are read-only views, so that no caller modifies the cached batch
+    HF_data = {col:ReadOnly(HF_data[col]) for col in HF_data}
+    MF_events = {state:(ReadOnly(events), ReadOnly(offsets)) for state, (events, offsets) in MF_events.items()}
+    x_coord, y_coord, seeds = ReadOnly(x_coord), ReadOnly(y_coord), ReadOnly(seeds)
+
+    batch_lru[lru_key] = (HF_data,MF_data,x_coord,y_coord,n_runs,n_steps,n_agents,input_dict,seeds,MF_events)
+    while len(batch_lru) > BATCH_LRU_SIZE:
+        batch_lru.popitem(last=False)
+
+    return dict(HF_data),MF_data.copy(),x_coord,y_coord,n_runs,n_steps,n_agents,copy.deepcopy(input_dict),seeds,dict(MF_events)
+
+# Read-only view of an array
+def ReadOnly (array):
+
+    view = np.asarray(array).view()
+    view.flags.writeable = False
+
+    return view
+
+# Last row of a CSV file, read from its end
+def LastCSVRow (filename):
+
+    with open(filename, 'rb') as csv_file:
+        csv_file.seek(0, os.SEEK_END)
+        size = csv_file.tell()
+        csv_file.seek(max(size - 4096, 0))
+        lines = csv_file.read().splitlines()
+
+    return lines[-1].decode().split(';')
+
+# HF columns of a CSV log from the on-disk cache, parsing the missing ones in a single pass
+def CachedHFColumns (key, cache_dir, HF_file, columns, shape):
+
+    if cache_dir is None:
+        HF_data = pd.read_csv(HF_file, sep=';', usecols=columns)
+        return {col:np.reshape(HF_data[col].to_numpy(),shape) for col in columns}
+
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_files = {col:os.path.join(cache_dir, key + "_HF_" + col + ".npy") for col in columns}
+
+    missing = [col for col in columns if not os.path.exists(cache_files[col])]
+    if missing:
+        HF_data = pd.read_csv(HF_file, sep=';', usecols=missing)
+        for col in missing:
+            CacheFiles.save_atomic(cache_files[col], lambda out_file: np.save(out_file, np.reshape(HF_data[col].to_numpy(),shape)))
+
+    # Mark the columns as recently used
+    for col in columns:
+        os.utime(cache_files[col])
+
+    return {col:np.load(cache_files[col], mmap_mode='r') for col in columns}
+
+# MF DataFrame from the on-disk cache, read with read_MF on a miss
+def CachedMFDataFrame (key, cache_dir, read_MF):
+
+    if cache_dir is None:
+        return read_MF()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = os.path.join(cache_dir, key + "_MF.pkl")
+
+    try:
+        MF_data = pd.read_pickle(cache_file)
+        os.utime(cache_file)
+    except (FileNotFoundError, EOFError):
+        MF_data = read_MF()
+        CacheFiles.save_atomic(cache_file, MF_data.to_pickle)
+
+    return MF_data
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Parameter sweeps over the keys of a profile.
+
+Instead of a directory of hand-written profiles, a sweep is described by the
+"sweep" key of the experiment JSON, e.g.
+
+    "sweep": {"base_profile": 0,
+              "method": "lhs",
+              "n_points": 200,
+              "seed": 1,
+              "parameters": {"ra_gain": {"range": [0.1, 0.9]},
+                             "swn_k": {"range": [2, 12], "integer": true},
+                             "neg_extremists": {"values": [0, 55, 110]}}}
+
+Every point of the sweep is the base profile with the swept keys replaced,
+built in memory and simulated for every seed of the experiment. The final
+values of the reducers (see Tools/Reducers.py) of every point and run are
+written as rows of a single results table.
+
+Methods:
+    grid     : every combination of the "values" of the parameters (a "range"
+               is split in "n" equal steps, 5 by default)
+    lhs      : n_points of a Latin hypercube
+    sobol    : n_points of a scrambled Sobol sequence (needs scipy)
+    morris   : n_trajectories one-at-a-time trajectories on a grid of "levels"
+               (4 by default), for Morris elementary effects
+    saltelli : the n_points * (parameters + 2) points needed to estimate the
+               Sobol indices from n_points base samples (needs scipy)
+
+Except for grid, a parameter with a "range" is sampled uniformly in it
+(only on integers if "integer" is true), and a parameter with "values"
+takes one of them with equal probability. The sobol, morris and saltelli
+designs only grow at the end when n_points or n_trajectories are increased
+with the same seed, so the points already simulated can be reused (see
+load_evaluations) and the sensitivity indices (Tools/Sensitivity.py) refined.
+"""
+
+import numpy as np
+import pandas as pd
+import copy, itertools, json, os
+
+from Tools import CacheFiles, RunCache
+
+try:
+    from scipy.stats import qmc
+except ImportError:     # Latin hypercubes are then sampled with numpy, Sobol sequences are unavailable
+    qmc = None
+
+# Population summaries reported for every point when the experiment has no reducers
+SWEEP_REDUCERS = {"mean": ["Utility", "Opinion", "Profit"],
+                  "counts": ["pv_alone", "pv_community", "community"]}
+
+def grid_values(spec):
+    '''
+    Values of a parameter in a grid sweep.
+    '''
+    if "values" in spec:
+        return list(spec["values"])
+
+    lower, upper = spec["range"]
+    values = np.linspace(lower, upper, spec.get("n", 5))
+    if spec.get("integer", False):
+        values = np.unique(np.round(values).astype(int))
+
+    return [value.item() for value in values]
+
+def scaled_values(spec, u):
+    '''
+    Values of a parameter for the samples u (n,) of the unit interval.
+    '''
+    if "values" in spec:
+        values = list(spec["values"])
+        return [values[i] for i in np.minimum((u * len(values)).astype(int), len(values) - 1)]
+
+    lower, upper = spec["range"]
+    if spec.get("integer", False):
+        return [int(value) for value in np.minimum(np.floor(lower + u * (upper - lower + 1)), upper)]
+
+    return [float(value) for value in lower + u * (upper - lower)]
+
+def unit_samples(method, n_points, n_dims, seed=None):
+    '''
+    This method gives n_points samples (n_points, n_dims) of the unit
+    hypercube for a Latin hypercube ("lhs") or a Sobol ("sobol") design.
+    '''
+    if method == "lhs":
+        if qmc is not None:
+            return qmc.LatinHypercube(d=n_dims, seed=seed).random(n_points)
+
+        # One sample in every of the n_points strata of each dimension
+        rng = np.random.default_rng(seed)
+        strata = np.argsort(rng.random((n_points, n_dims)), axis=0)
+        return (strata + rng.random((n_points, n_dims))) / n_points
+
+    elif method == "sobol":
+        if qmc is None:
+            raise ImportError("Sobol sweeps need scipy (scipy.stats.qmc)")
+        sampler = qmc.Sobol(d=n_dims, scramble=True, seed=seed)
+        if n_points & (n_points - 1) == 0:
+            return sampler.random_base2(int(np.log2(n_points)))
+        return sampler.random(n_points)
+
+    raise ValueError("Unknown sweep method: " + str(method))
+
+def morris_samples(n_params, n_trajectories, levels=4, seed=None):
+    '''
+    This method gives the unit samples (n_trajectories * (n_params + 1),
+    n_params) of Morris trajectories. Every trajectory starts at a random
+    point of the grid of levels and moves one parameter at a time, in random
+    order, by levels / (2 * (levels - 1)). Each trajectory has its own random
+    stream, so that adding trajectories does not change the first ones.
+    '''
+    delta = levels / (2 * (levels - 1))
+    samples = []
+    for trajectory in range(n_trajectories):
+        rng = np.random.default_rng(None if seed is None else [seed, trajectory])
+        x = rng.integers(0, levels, n_params) / (levels - 1)
+        steps = np.where(x + delta <= 1 + 1e-12, delta, -delta)
+
+        samples.append(x.copy())
+        for i in rng.permutation(n_params):
+            x[i] = min(max(x[i] + steps[i], 0), 1)
+            samples.append(x.copy())
+
+    return np.array(samples).reshape(-1, n_params)
+
+def saltelli_samples(n_params, n_points, seed=None):
+    '''
+    This method gives the unit samples (n_points * (n_params + 2), n_params)
+    to estimate Sobol indices. The base samples A and B are the two halves of
+    a Sobol sequence of 2 * n_params dimensions, and AB_i is A with the
+    parameter i of B. The points of every base sample are consecutive, in the
+    order A, B, AB_1, ..., AB_n_params.
+    '''
+    base = unit_samples("sobol", n_points, 2 * n_params, seed)
+    A, B = base[:, :n_params], base[:, n_params:]
+    blocks = [A, B] + [np.where(np.arange(n_params) == i, B, A) for i in range(n_params)]
+
+    return np.stack(blocks, axis=1).reshape(-1, n_params)
+
+def unit_design(sweep):
+    '''
+    This method gives the samples (n, parameters) of the unit hypercube of a
+    sweep that is not a grid.
+    '''
+    method = sweep.get("method", "grid")
+    n_params = len(sweep["parameters"])
+
+    if method == "morris":
+        return morris_samples(n_params, sweep["n_trajectories"], sweep.get("levels", 4), sweep.get("seed"))
+    elif method == "saltelli":
+        return saltelli_samples(n_params, sweep["n_points"], sweep.get("seed"))
+
+    return unit_samples(method, sweep["n_points"], n_params, sweep.get("seed"))
+
+def sweep_points(sweep):
+    '''
+    This method expands a sweep specification into its points.
+    Inputs:
+        sweep : dictionary, the "sweep" key of the experiment JSON
+    Outputs:
+        names : list, swept parameters
+        points : list of dictionaries, parameter -> value
+    '''
+    parameters = sweep["parameters"]
+    names = list(parameters)
+    method = sweep.get("method", "grid")
+
+    if method == "grid":
+        values = itertools.product(*[grid_values(parameters[name]) for name in names])
+    else:
+        u = unit_design(sweep)
+        values = zip(*[scaled_values(parameters[name], u[:, i]) for i, name in enumerate(names)])
+
+    return names, [dict(zip(names, point)) for point in values]
+
+def point_profile(base_dict, point):
+    '''
+    This method gives the input data of a point: the base profile with the
+    swept keys replaced.
+    '''
+    data_dict = copy.deepcopy(base_dict)
+    for name, value in point.items():
+        if name not in data_dict:
+            raise KeyError("Swept parameter not in the profile: " + str(name))
+        data_dict[name] = value
+
+    return data_dict
+
+def evaluation_key(point, seed):
+    '''
+    Key of the evaluation of a point with a seed, equal for the values read
+    back from the results table.
+    '''
+    values = tuple(float(value) if isinstance(value, (int, float, np.number)) else value for value in point.values())
+
+    return values + (seed,)
+
+def write_meta(meta_file, meta, results_file=None):
+    '''
+    This method writes the settings of a sweep next to its results table.
+    The hash of the table is added once it is complete, so that a table that
+    does not match its settings file is never reused.
+    '''
+    content = {"meta": meta, "results": None if results_file is None else RunCache.files_hash([results_file])}
+    CacheFiles.save_atomic(meta_file, lambda out_file: out_file.write(json.dumps(content).encode()))
+
+def load_evaluations(tables, meta, names, columns):
+    '''
+    This method reads the evaluations of previous sweeps that can be reused.
+    Inputs:
+        tables : list of (results table, settings file) pairs, see
+                 write_meta (missing ones are skipped)
+        meta : dictionary, settings of this sweep (base profile, steps,
+               engine, reducers, model version); a table is only reused
+               if they did not change
+        names : list, swept parameters
+        columns : list, summary columns needed
+    Outputs:
+        evaluations : dictionary, evaluation_key -> {column: value}
+    '''
+    evaluations = {}
+    for results_file, meta_file in tables:
+        try:
+            with open(meta_file) as myjson:
+                content = json.loads(myjson.read())
+        except (OSError, ValueError):
+            continue
+
+        if not isinstance(content, dict) or content.get("meta") != meta or not os.path.exists(results_file):
+            continue
+        if content.get("results") is not None and content["results"] != RunCache.files_hash([results_file]):
+            continue
+
+        results = pd.read_csv(results_file, sep=';', float_precision='round_trip')
+        if not set(names + columns + ['Seed']) <= set(results.columns):
+            continue
+
+        # Runs without a seed are random, and never reused
+        results = results[results['Seed'].notna()]
+        for row in results.to_dict('records'):
+            point = {name:row[name] for name in names}
+            evaluations[evaluation_key(point, int(row['Seed']))] = {col:row[col] for col in columns}
+
+    return evaluations
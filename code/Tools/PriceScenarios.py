@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Price scenario ensembles for the payback computation.
+
+Every function returns two (n_scenarios x n_steps) matrices with the price
+of solar PV systems [CHF/kW] and of electricity [CHF/kWh] seen by the agents
+at every step. They can be passed to SimplePayback.profit_table to evaluate
+the profits of all scenarios and agents in one broadcasted computation.
+"""
+
+import numpy as np
+import pandas as pd
+import hashlib, json
+
+from Tools import SimplePayback
+
+def monthly_factor(yoy):
+    '''
+    Factor applied to the prices every month for a given yearly change,
+    following the convention of BuildingModel.update_global_prices.
+    '''
+    return 1 - ((1 + np.asarray(yoy, dtype=float))**(1/12) - 1)
+
+def accumulate(initial_price, factors):
+    '''
+    Builds price paths from the initial prices (n_scenarios) and the factors
+    applied at every step (n_scenarios x n_steps-1).
+    '''
+    initial_price = np.broadcast_to(np.asarray(initial_price, dtype=float), (factors.shape[0],))
+    return np.cumprod(np.concatenate((initial_price[:, np.newaxis], factors), axis=1), axis=1)
+
+def constant_paths(data_dict, n_steps):
+    '''
+    Single scenario with the constant yearly changes of the profile
+    (pv_price_yoy, el_price_yoy), as simulated by the model.
+    '''
+    pv_prices, el_prices = SimplePayback.price_paths(data_dict, n_steps)
+    return pv_prices[np.newaxis, :], el_prices[np.newaxis, :]
+
+def stochastic_paths(data_dict, n_steps, n_scenarios, pv_volatility=0.1, el_volatility=0.05, seed=None):
+    '''
+    Geometric random walks around the yearly changes of the profile.
+    Inputs:
+        data_dict : dictionary, profile data (pv_price, el_price, *_yoy)
+        n_steps : integer, number of steps of a run
+        n_scenarios : integer, number of price paths
+        pv_volatility : float, yearly volatility of the PV price [-]
+        el_volatility : float, yearly volatility of the electricity price [-]
+        seed : integer, seed of the random walks (None -> not reproducible)
+    '''
+    rng = np.random.default_rng(seed)
+    shape = (n_scenarios, n_steps - 1)
+
+    paths = []
+    for price, yoy, volatility in ((data_dict["pv_price"], data_dict["pv_price_yoy"], pv_volatility),
+                                   (data_dict["el_price"], data_dict["el_price_yoy"], el_volatility)):
+        # Log-normal monthly shocks with the drift of the profile
+        sigma = volatility / np.sqrt(12)
+        shocks = np.exp(sigma * rng.standard_normal(shape) - sigma**2 / 2)
+        paths.append(accumulate(price, monthly_factor(yoy) * shocks))
+
+    return paths[0], paths[1]
+
+def scenario_seed(spec):
+    '''
+    Seed of a stochastic ensemble without a "seed": a hash of its spec, so
+    that every process and run of the profile draws the same paths (and
+    profiles with the same spec share them).
+    '''
+    text = json.dumps(spec, sort_keys=True)
+    return int(hashlib.sha1(text.encode()).hexdigest()[:16], 16)
+
+def piecewise_paths(data_dict, n_steps, scenarios):
+    '''
+    Paths with yearly changes that are constant by segments.
+    Inputs:
+        data_dict : dictionary, profile data (pv_price, el_price, *_yoy)
+        n_steps : integer, number of steps of a run
+        scenarios : list with one dictionary per scenario, with the keys
+                    "pv_price_yoy" and/or "el_price_yoy" given as lists of
+                    [start_step, yoy] segments. Missing keys keep the value
+                    of the profile.
+    '''
+    steps = np.arange(n_steps - 1)
+    pv_factors = np.empty((len(scenarios), n_steps - 1))
+    el_factors = np.empty((len(scenarios), n_steps - 1))
+
+    for s, scenario in enumerate(scenarios):
+        for factors, key in ((pv_factors, "pv_price_yoy"), (el_factors, "el_price_yoy")):
+            segments = sorted(scenario.get(key, [[0, data_dict[key]]]))
+            starts = np.array([segment[0] for segment in segments])
+            yoys = np.array([segment[1] for segment in segments], dtype=float)
+
+            # Yearly change of the segment each step belongs to (profile before the first)
+            yoy = np.where(steps < starts[0], data_dict[key], yoys[np.maximum(np.searchsorted(starts, steps, side='right') - 1, 0)])
+            factors[s] = monthly_factor(yoy)
+
+    return accumulate(data_dict["pv_price"], pv_factors), accumulate(data_dict["el_price"], el_factors)
+
+def file_paths(filename, n_steps):
+    '''
+    Historical or externally generated tariffs read from a CSV file with the
+    columns Scenario;Step;pv_price;el_price. Missing steps of a scenario
+    keep the last price given, and every scenario must start at step 0.
+    '''
+    prices = pd.read_csv(filename, sep=';')
+    scenarios = np.unique(prices["Scenario"].to_numpy())
+    rows = np.searchsorted(scenarios, prices["Scenario"].to_numpy())
+    steps = prices["Step"].to_numpy()
+    valid = steps < n_steps
+
+    paths = []
+    for column in ("pv_price", "el_price"):
+        path = np.full((len(scenarios), n_steps), np.nan)
+        path[rows[valid], steps[valid]] = prices[column].to_numpy()[valid]
+
+        # Forward fill the missing steps of every scenario
+        if np.isnan(path[:, 0]).any():
+            raise ValueError("Price scenarios without a " + column + " at step 0 in " + str(filename) + ": " + str(scenarios[np.isnan(path[:, 0])].tolist()))
+        filled = np.where(np.isnan(path), 0, np.arange(n_steps))
+        np.maximum.accumulate(filled, axis=1, out=filled)
+        path = np.take_along_axis(path, filled, axis=1)
+        if np.isnan(path).any():
+            raise ValueError("Missing " + column + " values in " + str(filename))
+        paths.append(path)
+
+    return paths[0], paths[1]
+
+def load_price_scenarios(data_dict, n_steps):
+    '''
+    Returns the price matrices of the profile, as described by its optional
+    "price_scenarios" key:
+        {"type": "stochastic", "n_scenarios": 200, "pv_volatility": 0.1,
+         "el_volatility": 0.05, "seed": 1}   (seed derived from the spec if missing)
+        {"type": "piecewise", "scenarios": [{"pv_price_yoy": [[0, 0.04], [60, 0.0]]}, ...]}
+        {"type": "file", "file": "Data/Prices/tariffs.csv"}
+    Profiles without the key get a single scenario with constant changes.
+    '''
+    try:
+        spec = data_dict["price_scenarios"]
+    except KeyError:
+        return constant_paths(data_dict, n_steps)
+
+    if spec["type"] == "stochastic":
+        return stochastic_paths(data_dict, n_steps, spec["n_scenarios"],
+                                pv_volatility=spec.get("pv_volatility", 0.1),
+                                el_volatility=spec.get("el_volatility", 0.05),
+                                seed=spec.get("seed", scenario_seed(spec)))
+    elif spec["type"] == "piecewise":
+        return piecewise_paths(data_dict, n_steps, spec["scenarios"])
+    elif spec["type"] == "file":
+        return file_paths(spec["file"], n_steps)
+    else:
+        raise ValueError("Unknown price scenario type: " + str(spec["type"]))
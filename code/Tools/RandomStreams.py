@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Independent random streams of a run.
+
+Every run derives its random number generators from a numpy SeedSequence
+built from its seed (an entry of batch_seeds), with one child stream per
+source of randomness. Runs never share a stream, so they give the same
+results whether they are simulated serially, in a pool of processes or
+batched together in a VectorModel.
+"""
+
+import numpy as np
+
+# Child streams of every run, in spawn order
+STREAMS = ("network", "awareness", "activation", "interactions")
+
+def run_streams(seed):
+    '''
+    This method creates the random number generators of a run.
+    Inputs:
+        seed : integer, seed of the run (None for fresh entropy)
+    Outputs:
+        streams : dictionary, numpy Generator of every stream in STREAMS
+            network      > rewiring of the small world network
+            awareness    > initial awareness and choice of extremists
+            activation   > random activation order of the agents
+            interactions > choice of the connection an agent interacts with
+    '''
+    children = np.random.SeedSequence(seed).spawn(len(STREAMS))
+
+    return {name:np.random.default_rng(child) for name, child in zip(STREAMS, children)}
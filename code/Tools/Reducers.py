@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Population summaries computed while the model runs.
+
+A reducer turns a block of recorded steps of one run (a dictionary of
+arrays (n_steps, n_agents), see StreamingRecorder) into a few columns with
+one value per step. They are configured with the "reducers" key of the
+experiment JSON, e.g.
+
+    "reducers": {"mean": ["Utility", "Opinion"],
+                 "std": ["Opinion"],
+                 "histogram": {"column": "Opinion", "bins": 10},
+                 "counts": ["pv_alone", "pv_community", "community"]}
+
+and their columns are written to the Summary log of every profile, which
+is orders of magnitude smaller than the HF log.
+"""
+
+import numpy as np
+
+def mean(block, columns):
+    '''
+    Population mean of every step of the columns.
+    '''
+    return {col + "_mean": block[col].mean(axis=1, dtype=np.float64) for col in columns}
+
+def std(block, columns):
+    '''
+    Population standard deviation of every step of the columns.
+    '''
+    return {col + "_std": block[col].std(axis=1, dtype=np.float64) for col in columns}
+
+def histogram(block, column, bins=10, range=(0, 1)):
+    '''
+    Number of agents in every bin of the column on every step.
+    Inputs:
+        column : string, recorded variable
+        bins : integer, number of equal bins
+        range : (lower, upper) limits of the bins, values outside are
+                counted in the first or last bin
+    '''
+    values = block[column]
+    n_steps = len(values)
+    lower, upper = range
+
+    # Bin of every value, and count of every (step, bin) pair at once
+    idx = np.clip(np.floor((values - lower) / (upper - lower) * bins), 0, bins - 1).astype(np.int64)
+    counts = np.bincount((np.arange(n_steps)[:, np.newaxis] * bins + idx).reshape(-1), minlength=n_steps * bins)
+    counts = counts.reshape(n_steps, bins)
+
+    return {column + "_hist" + str(i): counts[:, i] for i in np.arange(bins)}
+
+def counts(block, columns):
+    '''
+    Number of agents in each boolean state (e.g. adoption) on every step.
+    '''
+    return {col + "_cnt": np.count_nonzero(block[col], axis=1) for col in columns}
+
+# Reducers by name, as used in the experiment JSON
+REDUCERS = {"mean": mean, "std": std, "histogram": histogram, "counts": counts}
+
+def reduce_block(block, reducers):
+    '''
+    This method applies the reducers to a block of steps of a run.
+    Inputs:
+        block : dictionary, recorded variable -> array (n_steps, n_agents)
+        reducers : dictionary, reducer name -> list of columns, or
+                   dictionary of arguments
+    Outputs:
+        summary : dictionary, summary column -> array (n_steps)
+    '''
+    summary = {}
+    for name, args in reducers.items():
+        try:
+            reducer = REDUCERS[name]
+        except KeyError:
+            raise ValueError("Unknown reducer: " + str(name))
+        summary.update(reducer(block, **args) if isinstance(args, dict) else reducer(block, args))
+
+    return summary
+
+def summary_columns(reducers, dtypes):
+    '''
+    This method gives the names of the summary columns of the reducers, in
+    the order they are written.
+    Inputs:
+        reducers : see reduce_block
+        dtypes : dictionary, recorded variable -> dtype
+    '''
+    block = {name:np.zeros((1, 1), dtype=dtype) for name, dtype in dtypes.items()}
+
+    return list(reduce_block(block, reducers))
@@ -1,3 +1,5 @@
+import numpy as np
+
 ### Relative Agreement interaction - Takes in two opinion-uncertainty <tuples> 
 # and returns respective modified op-unc return tuples
 # opunc is in the range ([0,1],(0,0.27])
@@ -53,3 +55,88 @@ def interact(opunc0, opunc1, gain):
     # Return modified opinion value, uncertainty tuples
     return opunc0_mod, opunc1_mod
 
+
+### Batched Relative Agreement interaction - Takes in opinion and uncertainty
+# <arrays> plus the agent indices of many interacting pairs and modifies the
+# arrays in place, as if the pairs interacted one after the other
+
+def interact_pairs(opinion, uncertainty, idx0, idx1, gain):
+    '''
+    This method applies the interaction of interact() to many pairs of agents
+    at once.
+    Inputs:
+        opinion : array, opinion value of every agent (modified in place)
+        uncertainty : array, uncertainty of every agent (modified in place)
+                      Both arrays may have leading dimensions, in which case
+                      the pairs index their last axis and the interactions
+                      are applied along all leading dimensions at once
+        idx0 : integer array, index of agent 0 of every pair
+        idx1 : integer array, index of agent 1 of every pair
+        gain : float, controls speed of opinion dynamic
+    Outputs:
+        n_rounds : integer, number of conflict-free rounds applied
+
+    The pairs are split into conflict-free rounds in which no agent appears
+    twice. Every agent still goes through its interactions in the order in
+    which they are listed, so the result equals calling interact() for each
+    pair sequentially.
+    '''
+    idx0 = np.asarray(idx0)
+    idx1 = np.asarray(idx1)
+
+    n_rounds = 0
+    for pairs in conflict_free_rounds(idx0, idx1):
+        i = idx0[pairs]
+        j = idx1[pairs]
+        x_i, u_i = opinion[..., i], uncertainty[..., i]
+        x_j, u_j = opinion[..., j], uncertainty[..., j]
+
+        # Overlap of opinions (Eq. 1) and relative agreement (Eq. 4 and 5)
+        overlap = np.minimum(x_i + u_i, x_j + u_j) - np.maximum(x_i - u_i, x_j - u_j)
+        beta0 = gain*np.maximum(0, overlap/u_j - 1)
+        beta1 = gain*np.maximum(0, overlap/u_i - 1)
+
+        # Modified opinion and uncertainty (Eq. 5 and 6), with safety bound
+        opinion[..., i] = x_i + beta0*(x_j - x_i)
+        opinion[..., j] = x_j + beta1*(x_i - x_j)
+        uncertainty[..., i] = np.maximum(u_i + beta0*(u_j - u_i), 0.02)
+        uncertainty[..., j] = np.maximum(u_j + beta1*(u_i - u_j), 0.02)
+
+        n_rounds += 1
+
+    return n_rounds
+
+def conflict_free_rounds(idx0, idx1):
+    '''
+    Generator that splits a sequence of pairs into rounds of disjoint pairs.
+    Inputs:
+        idx0 : integer array, index of agent 0 of every pair
+        idx1 : integer array, index of agent 1 of every pair
+    Outputs:
+        (yields) integer array with the positions of the pairs of each round
+
+    A pair goes into the current round when it is the first pending pair of
+    both of its agents, which keeps the order of interactions of every agent.
+    '''
+    pending = np.arange(len(idx0))
+
+    while len(pending) > 0:
+        n = len(pending)
+
+        # Sort the agents of the pending pairs, and their pair positions
+        agents = np.concatenate((idx0[pending], idx1[pending]))
+        position = np.concatenate((np.arange(n), np.arange(n)))
+        order = np.lexsort((position, agents))
+
+        # Position of the first pending pair of every agent
+        group_start = np.ones(2*n, dtype=bool)
+        group_start[1:] = agents[order][1:] != agents[order][:-1]
+        starts = np.flatnonzero(group_start)
+        first_of_agent = np.empty(2*n, dtype=np.int64)
+        first_of_agent[order] = np.repeat(position[order][starts], np.diff(np.append(starts, 2*n)))
+
+        # A pair is ready if it comes first for both of its agents
+        ready = (first_of_agent[:n] == np.arange(n)) & (first_of_agent[n:] == np.arange(n))
+
+        yield pending[ready]
+        pending = pending[~ready]
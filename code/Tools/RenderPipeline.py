@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel rendering of figures.
+
+Instead of drawing every figure as soon as it is requested, the plotting
+functions of VisualizationFunctions can be deferred: each call is stored
+as a declarative job (function name, arguments) and all jobs are rendered
+at the end by a pool of processes with the Agg backend. The arrays of the
+jobs are written once to memory-mapped .npy files in a temporary
+directory, so the workers read the slices they plot without pickling
+them.
+
+    figures = FigureQueue()
+    MultiLinePlot = figures.deferred(MultiLinePlot)
+    ...
+    figures.render()
+"""
+
+import numpy as np
+import inspect, multiprocessing, os, shutil, tempfile, uuid
+
+from Tools import VisualizationFunctions
+
+class MappedArray():
+    '''
+    Reference to an array of a job, stored in a .npy file.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+
+    def load(self):
+        return np.load(self.filename, mmap_mode='r')
+
+def pack(value, scratch_dir):
+    '''
+    This method replaces the arrays of a job argument (also inside lists
+    and tuples) by MappedArray references to .npy files.
+    '''
+    if isinstance(value, np.ndarray):
+        filename = os.path.join(scratch_dir, uuid.uuid4().hex + ".npy")
+        np.save(filename, value)
+        return MappedArray(filename)
+    elif isinstance(value, (list, tuple)):
+        return type(value)(pack(item, scratch_dir) for item in value)
+    return value
+
+def unpack(value):
+    '''
+    Inverse of pack, with the arrays memory-mapped read-only.
+    '''
+    if isinstance(value, MappedArray):
+        return value.load()
+    elif isinstance(value, (list, tuple)):
+        return type(value)(unpack(item) for item in value)
+    return value
+
+def init_worker():
+    '''
+    Workers render to files only.
+    '''
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+
+def render_job(job):
+    '''
+    This method renders a figure job in a worker.
+    Inputs:
+        job : (function name, args, kwargs) with packed arguments
+    Outputs:
+        filename : string, file written by the job (None if not saved)
+    '''
+    import matplotlib.pyplot as plt
+
+    name, args, kwargs = job
+    getattr(VisualizationFunctions, name)(*unpack(args), **unpack(kwargs))
+    plt.close('all')
+
+    return kwargs.get("filename")
+
+class FigureQueue():
+    '''
+    Queue of figure jobs rendered in parallel.
+    Inputs:
+        workers : integer, number of worker processes (None -> one per core)
+    '''
+    def __init__(self, workers=None):
+        self.workers = workers
+        self.jobs = []
+        self.scratch_dir = tempfile.mkdtemp(prefix="figures_")
+
+    def add(self, function, *args, **kwargs):
+        '''
+        This method adds a job calling function(*args, **kwargs). Jobs of
+        figures that would be neither saved nor shown are dropped.
+        '''
+        parameters = inspect.signature(function).parameters
+        if "save" in parameters:
+            save = kwargs.get("save", parameters["save"].default)
+            if not save:
+                return
+
+        kwargs["show"] = 0      # Rendered off screen
+        if "show" not in parameters:
+            del kwargs["show"]
+
+        self.jobs.append((function.__name__, pack(args, self.scratch_dir), pack(kwargs, self.scratch_dir)))
+
+    def deferred(self, function):
+        '''
+        This method gives a function with the signature of function that
+        adds a job instead of drawing the figure.
+        '''
+        def add_job(*args, **kwargs):
+            self.add(function, *args, **kwargs)
+        add_job.__name__ = function.__name__
+        add_job.__doc__ = function.__doc__
+
+        return add_job
+
+    def render(self):
+        '''
+        This method renders all jobs and deletes their data. Animations are
+        started first, since they take the longest. Workers are forked, so
+        without fork (Windows) the jobs are rendered one after another.
+        '''
+        jobs = sorted(self.jobs, key=lambda job: job[0] != "AnimateColourMap")
+        self.jobs = []
+
+        try:
+            if "fork" in multiprocessing.get_all_start_methods() and self.workers != 1:
+                with multiprocessing.get_context("fork").Pool(self.workers, initializer=init_worker) as pool:
+                    pool.map(render_job, jobs, chunksize=1)
+            else:
+                init_worker()
+                for job in jobs:
+                    render_job(job)
+        finally:
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
+            self.scratch_dir = tempfile.mkdtemp(prefix="figures_")
+
+    def __del__(self):
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of simulated runs.
+
+The logs of a run only depend on its inputs: the merged data_dict of the
+profile, the seed, the number of steps, the run number written in its rows,
+the settings of the logs and the code of the model. The hash of all of them
+is the key of the run, so a run that was already simulated with the same
+inputs, by any experiment, is read from the cache instead of simulated.
+
+An entry is a set of files named after the key in RUN_CACHE_DIR: the log
+parts of the run (<key>_HF.csv, <key>_MF_pv_alone.npy, ...) and a manifest
+<key>.json with their names, written last. Runs without a seed are random
+and never cached.
+"""
+
+import numpy as np
+import hashlib, json, os, shutil
+
+from Tools import CacheFiles
+
+# Directory and size cap (in bytes) of the cache of runs
+RUN_CACHE_DIR = "Datalogs/Cache/Runs"
+RUN_CACHE_MAX_BYTES = 2**33
+
+# Version of the layout of the entries, part of every key
+RUN_CACHE_VERSION = 1
+
+# Code that the logs of a run depend on (relative to the code directory);
+# changing any of these files invalidates every cached run. main.py sets up
+# the model, the profit tables and the price scenarios, and writes the logs
+MODEL_SOURCES = ["main.py",
+                 "Agent/BuildingAgent.py",
+                 "Model/BuildingModel.py",
+                 "Model/VectorModel.py",
+                 "Tools/DataloggingFunctions.py",
+                 "Tools/PriceScenarios.py",
+                 "Tools/RandomStreams.py",
+                 "Tools/Reducers.py",
+                 "Tools/RelativeAgreement.py",
+                 "Tools/SimplePayback.py",
+                 "Tools/SmallWorld.py"]
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def files_hash(filenames):
+    '''
+    Hash of the contents of a list of files.
+    '''
+    digest = hashlib.sha1()
+    for filename in filenames:
+        with open(filename, 'rb') as in_file:
+            for chunk in iter(lambda: in_file.read(2**20), b''):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+def model_version(data_files=()):
+    '''
+    This method gives the version of the model: the hash of its sources
+    (MODEL_SOURCES) and of the data files it reads, e.g. the buildings.
+    '''
+    return files_hash([os.path.join(CODE_DIR, source) for source in MODEL_SOURCES] + list(data_files))
+
+def run_key(inputs, version):
+    '''
+    This method gives the key of a run.
+    Inputs:
+        inputs : JSON serializable inputs of the run (data_dict, seed, ...)
+        version : string, version of the model (see model_version)
+    Outputs:
+        key : string, hex digest
+    '''
+    text = json.dumps([RUN_CACHE_VERSION, version, inputs], sort_keys=True)
+
+    return hashlib.sha1(text.encode()).hexdigest()
+
+def fetch(key, cache_dir=RUN_CACHE_DIR):
+    '''
+    This method looks for a run in the cache.
+    Inputs:
+        key : string, key of the run (None -> not cached)
+        cache_dir : string, directory of the cache
+    Outputs:
+        entry : dictionary, part name -> file of the entry, None on a miss
+                (also if any of its files was evicted)
+    '''
+    if key is None:
+        return None
+
+    manifest = os.path.join(cache_dir, key + ".json")
+    try:
+        with open(manifest) as myjson:
+            entry = {name:os.path.join(cache_dir, filename) for name, filename in json.loads(myjson.read()).items()}
+    except (OSError, ValueError):
+        return None
+
+    if not all(os.path.exists(filename) for filename in entry.values()):
+        return None
+
+    # Mark the run as recently used
+    for filename in list(entry.values()) + [manifest]:
+        os.utime(filename)
+
+    return entry
+
+def store(key, files=None, arrays=None, cache_dir=RUN_CACHE_DIR, max_bytes=RUN_CACHE_MAX_BYTES):
+    '''
+    This method adds a run to the cache.
+    Inputs:
+        key : string, key of the run (None -> not cached)
+        files : dictionary, part name -> CSV file to copy (e.g. a log part)
+        arrays : dictionary, part name -> array, saved as .npy
+        cache_dir : string, directory of the cache
+        max_bytes : integer, size cap of the cache, the least recently used
+                    files are deleted beyond it
+    '''
+    if key is None:
+        return
+
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = {}
+
+    # Every file is written atomically, and the manifest last, so that
+    # processes running in parallel never read a partially written entry
+    for name, filename in (files or {}).items():
+        entry[name] = key + "_" + name + ".csv"
+        with open(filename, 'rb') as in_file:
+            CacheFiles.save_atomic(os.path.join(cache_dir, entry[name]), lambda out_file: shutil.copyfileobj(in_file, out_file))
+
+    for name, array in (arrays or {}).items():
+        entry[name] = key + "_" + name + ".npy"
+        CacheFiles.save_atomic(os.path.join(cache_dir, entry[name]), lambda out_file: np.save(out_file, array))
+
+    CacheFiles.save_atomic(os.path.join(cache_dir, key + ".json"), lambda out_file: out_file.write(json.dumps(entry).encode()))
+
+    CacheFiles.evict(cache_dir, max_bytes, suffixes=(".csv", ".npy", ".json"))
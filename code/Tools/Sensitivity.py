@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Global sensitivity analysis of parameter sweeps.
+
+The results table of a "morris" or "saltelli" sweep (see
+Tools/ParameterSweep.py) is reduced to one value of every output per point,
+the mean over the runs of the point, and the indices of every parameter are
+estimated from them:
+
+    morris   : mean (mu), mean of the absolute value (mu_star) and standard
+               deviation (sigma) of the elementary effects, the change of the
+               output over the change of the parameter in the unit interval
+    saltelli : first order (S1) and total (ST) Sobol indices, the shares of
+               the variance of the output explained by the parameter alone
+               and with all its interactions
+
+The confidence intervals (suffixes _low and _high) are percentiles of the
+indices over bootstrap resamples of the trajectories (morris) or of the base
+samples (saltelli).
+"""
+
+import numpy as np
+import pandas as pd
+
+from Tools import ParameterSweep
+
+def bootstrap_interval(estimates, confidence):
+    '''
+    Percentile interval of the bootstrap estimates (n_bootstrap, ...).
+    '''
+    alpha = (1 - confidence) / 2
+
+    return np.percentile(estimates, 100 * alpha, axis=0), np.percentile(estimates, 100 * (1 - alpha), axis=0)
+
+def morris_indices(u, y, n_bootstrap=1000, confidence=0.95, seed=None):
+    '''
+    This method estimates the Morris indices of a design.
+    Inputs:
+        u : array (n_trajectories * (n_params + 1), n_params), unit samples
+            of the trajectories (ParameterSweep.morris_samples)
+        y : array (n_trajectories * (n_params + 1),), output at every sample
+        n_bootstrap : integer, resamples of the trajectories
+        confidence : float, level of the confidence intervals
+        seed : seed of the resamples
+    Outputs:
+        indices : dictionary, index -> array (n_params,)
+    '''
+    n_params = u.shape[1]
+    u = u.reshape(-1, n_params + 1, n_params)
+    y = np.asarray(y, dtype=float).reshape(-1, n_params + 1)
+
+    # Every step of a trajectory changes one parameter
+    du = np.diff(u, axis=1)
+    changed = np.argmax(np.abs(du), axis=2)
+    steps = np.take_along_axis(du, changed[:, :, None], axis=2)[:, :, 0]
+
+    effects = np.empty((u.shape[0], n_params))
+    np.put_along_axis(effects, changed, np.diff(y, axis=1) / steps, axis=1)
+
+    indices = {"mu": effects.mean(axis=0),
+               "mu_star": np.abs(effects).mean(axis=0),
+               "sigma": effects.std(axis=0, ddof=1) if len(effects) > 1 else np.full(n_params, np.nan)}
+
+    rng = np.random.default_rng(seed)
+    resamples = rng.integers(0, len(effects), (n_bootstrap, len(effects)))
+    indices["mu_star_low"], indices["mu_star_high"] = bootstrap_interval(np.abs(effects)[resamples].mean(axis=1), confidence)
+
+    return indices
+
+def sobol_estimates(f):
+    '''
+    Sobol indices of the outputs f (..., n_base, n_params + 2) of blocks
+    A, B, AB_1, ..., AB_n_params: S1 after Saltelli et al. (2010) and ST
+    after Jansen (1999).
+    '''
+    fA, fB, fAB = f[..., 0], f[..., 1], f[..., 2:]
+    variance = np.var(np.concatenate([fA, fB], axis=-1), axis=-1)[..., None]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        S1 = np.mean(fB[..., None] * (fAB - fA[..., None]), axis=-2) / variance
+        ST = 0.5 * np.mean((fA[..., None] - fAB) ** 2, axis=-2) / variance
+
+    return S1, ST
+
+def sobol_indices(y, n_params, n_bootstrap=1000, confidence=0.95, seed=None):
+    '''
+    This method estimates the Sobol indices of a design.
+    Inputs:
+        y : array (n_base * (n_params + 2),), output at every sample of a
+            Saltelli design (ParameterSweep.saltelli_samples)
+        n_params : integer, number of parameters
+        n_bootstrap : integer, resamples of the base samples
+        confidence : float, level of the confidence intervals
+        seed : seed of the resamples
+    Outputs:
+        indices : dictionary, index -> array (n_params,)
+    '''
+    f = np.asarray(y, dtype=float).reshape(-1, n_params + 2)
+
+    indices = dict(zip(["S1", "ST"], sobol_estimates(f)))
+
+    rng = np.random.default_rng(seed)
+    resamples = rng.integers(0, len(f), (n_bootstrap, len(f)))
+    for name, estimates in zip(["S1", "ST"], sobol_estimates(f[resamples])):
+        indices[name+"_low"], indices[name+"_high"] = bootstrap_interval(estimates, confidence)
+
+    return indices
+
+def analyze(sweep, results, outputs, n_bootstrap=1000, confidence=0.95, seed=None):
+    '''
+    This method computes the sensitivity indices of a sweep.
+    Inputs:
+        sweep : dictionary, the "sweep" key of the experiment JSON
+        results : dataframe, results table of the sweep (index Point, Run)
+        outputs : list, columns of the results to analyze
+        n_bootstrap : integer, bootstrap resamples
+        confidence : float, level of the confidence intervals
+        seed : seed of the resamples
+    Outputs:
+        indices : dataframe, one row per output and parameter
+    '''
+    method = sweep.get("method", "grid")
+    if method not in ("morris", "saltelli"):
+        raise ValueError("Sensitivity analysis needs a morris or saltelli sweep, not " + str(method))
+
+    names = list(sweep["parameters"])
+    u = ParameterSweep.unit_design(sweep)
+
+    # Mean over the runs of every point
+    means = results.groupby(level='Point')[outputs].mean()
+    if not means.index.equals(pd.RangeIndex(len(u))):
+        raise ValueError("The results do not cover the " + str(len(u)) + " points of the sweep")
+
+    tables = []
+    for output in outputs:
+        if method == "morris":
+            indices = morris_indices(u, means[output].values, n_bootstrap, confidence, seed)
+        else:
+            indices = sobol_indices(means[output].values, len(names), n_bootstrap, confidence, seed)
+
+        table = pd.DataFrame(indices, index=pd.Index(names, name='Parameter'))
+        table.insert(0, 'Output', output)
+        tables.append(table)
+
+    return pd.concat(tables).reset_index().set_index(['Output', 'Parameter'])
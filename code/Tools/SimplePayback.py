@@ -5,6 +5,36 @@ Created on Wed Nov 20 12:48:13 2019
 @author: anunezji
 """
 
+import numpy as np
+
+#==========================================================================
+### Data simplifications and assumptions
+# For simplicity and data availability reasons, we use the following values
+# for all agents:
+
+# Operation and maintenance cost of solar PV system, as fraction
+# of investment cost
+OM = 0.015
+# Source: Peters et al (2011)
+# https://doi.org/10.1016/j.enpol.2011.07.045
+
+# Solar photovoltaic yield in Switzerland in kWh per kW
+SY = 980
+# IEA PVPS 2019 National Survey Report for Switzerland
+
+# Remuneration for solar electricity fed to the grid in CHF/kWh
+PV_FG = 0.08
+# Source: EWZ 2016-2020 tariff
+# www.ewz.ch/webportal/de/privatkunden/
+# solaranlagen/solarstrom-fuer-eigentuemer/solaranlage.html
+
+# Assumptions:
+# 1. Agents size solar PV systems to meet annual demand or to maximum
+# rooftop area available
+# 2. Solar electricity generation is direclty proportional to system size
+# 3. Solar PV system price independent of system size
+#==========================================================================
+
 def compute_pbp(self, pv_sf, pv_sc, pv_potential):
     '''
     This mehtod calculates the payback period of an individual solar PV
@@ -16,73 +46,144 @@ def compute_pbp(self, pv_sf, pv_sc, pv_potential):
         pv_sc : float, solar electricity self-consumed by agent [-]
     Outputs:
         pbp : integer, number of years to recoup investment
-        
+
     Note: this method is based on the simple payback period calculation for
     an investment. It has the following simplifactions and assumptions:
         1. Cashflows are assumed to stay constant over the years
         2. Investment cost is paid upfront
     '''
-    #==========================================================================
-    ### Data simplifications and assumptions
-    # For simplicity and data availability reasons, we use the following values
-    # for all agents:
-    
-    # Operation and maintenance cost of solar PV system, as fraction 
-    # of investment cost
-    om = 0.015
-    # Source: Peters et al (2011)
-    # https://doi.org/10.1016/j.enpol.2011.07.045
-    
-    # Solar photovoltaic yield in Switzerland in kWh per kW
-    sy = 980
-    # IEA PVPS 2019 National Survey Report for Switzerland
-    
-    # Remuneration for solar electricity fed to the grid in CHF/kWh
-    pv_fg = 0.08
-    # Source: EWZ 2016-2020 tariff
-    # www.ewz.ch/webportal/de/privatkunden/
-    # solaranlagen/solarstrom-fuer-eigentuemer/solaranlage.html
-        
-    # Assumptions:
-    # 1. Agents size solar PV systems to meet annual demand or to maximum
-    # rooftop area available
-    # 2. Solar electricity generation is direclty proportional to system size
-    # 3. Solar PV system price independent of system size
-    #==========================================================================
-    
     # Compute the size of the solar PV system in kW
-    pv_size = pv_sf * pv_potential / sy    
-    
+    pv_size = pv_sf * pv_potential / SY
+
     ### Determine the invesment cost in CHF
     pv_inv = pv_size * self.model.pv_price
-    
+
     ### Determine annual cashflows
-    
+
     # Avoided costs from reduced consumption of electricity from the grid CHF
     cf_ac = self.model.el_price * (pv_sc * pv_sf * pv_potential)
-    
+
     # Remuneration for solar electricity fed to grid CHF
-    cf_fg = pv_sf * pv_potential * (1 - pv_sc) * pv_fg
-    
+    cf_fg = pv_sf * pv_potential * (1 - pv_sc) * PV_FG
+
     # Operation and maintenance annual cost in CHF
-    cf_om = - om * pv_inv
-    
+    cf_om = - OM * pv_inv
+
     # Annual cashflow of the project in CHF
     cf_pv = cf_ac + cf_fg + cf_om
-    
+
     ### Determine number of years required to payback investment
-    
+
     if cf_pv > 0:
-        
+
         # If cashflows are positive, the number of years to pay back is given:
         pbp = pv_inv / cf_pv
     else:
-        
+
         # If annual cashflows are negative, the agent will never be able to
         # recoup the investment costs
-        pbp = self.model.max_pbp 
+        pbp = self.model.max_pbp
 
     # Condition the return before exiting
     pbp = min(pbp, self.model.max_pbp)
-    
+
     return pbp
+
+def compute_pbp_array(pv_sf, pv_sc, pv_potential, pv_price, el_price, max_pbp):
+    '''
+    Array version of compute_pbp for a whole population of agents at once.
+    Inputs:
+        pv_sf : array, scaling factor of solar PV system size [-]
+        pv_sc : array, solar electricity self-consumed by agent [-]
+        pv_potential : array, annual max solar generation [kWh]
+        pv_price : float or array, price of solar PV system [CHF/kW]
+        el_price : float or array, price of electricity [CHF/kWh]
+        max_pbp : float, maximum payback period considered [years]
+    Outputs:
+        pbp : array, number of years to recoup investment
+
+    All inputs are broadcast against each other, and every operation is done
+    in the same order as in compute_pbp so both return identical values.
+    '''
+    # Compute the size of the solar PV system in kW
+    pv_size = pv_sf * pv_potential / SY
+
+    # Investment cost and annual cashflows in CHF (see compute_pbp)
+    pv_inv = pv_size * pv_price
+    cf_ac = el_price * (pv_sc * pv_sf * pv_potential)
+    cf_fg = pv_sf * pv_potential * (1 - pv_sc) * PV_FG
+    cf_om = - OM * pv_inv
+    cf_pv = cf_ac + cf_fg + cf_om
+
+    # Agents with non-positive cashflows never recoup the investment
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pbp = np.where(cf_pv > 0, pv_inv / cf_pv, max_pbp)
+
+    # Condition the return before exiting
+    return np.minimum(pbp, max_pbp)
+
+def pv_system_parameters(b_data):
+    '''
+    This method derives the solar PV parameters of every building used by
+    compute_pbp from the building data.
+    Inputs:
+        b_data : dataframe, building data (one row per agent)
+    Outputs:
+        pv_sf : array, scaling factor of solar PV system size [-]
+        pv_sc : array, solar electricity self-consumed by agent [-]
+        pv_potential : array, annual max solar generation [kWh]
+    '''
+    el_demand = b_data["demand_kwh"].to_numpy(dtype=float)
+    pv_potential = b_data["max_pv_gen_kwh"].to_numpy(dtype=float)
+    pv_sc = b_data["self_consumption"].to_numpy(dtype=float)
+
+    # PV systems meet the annual demand if the rooftop potential is larger,
+    # otherwise they are as large as possible (see BuildingModel)
+    pv_sf = np.ones(len(el_demand))
+    np.divide(el_demand, pv_potential, out=pv_sf, where=el_demand < pv_potential)
+
+    return pv_sf, pv_sc, pv_potential
+
+def price_paths(data_dict, n_steps):
+    '''
+    This method computes the prices seen by the agents at every step, as
+    produced by BuildingModel.update_global_prices.
+    Inputs:
+        data_dict : dictionary, profile data (pv_price, el_price, *_yoy)
+        n_steps : integer, number of steps of a run
+    Outputs:
+        pv_prices : array, price of solar PV system at every step [CHF/kW]
+        el_prices : array, price of electricity at every step [CHF/kWh]
+    '''
+    # Change of prices every month [as fraction of prior]
+    pv_price_mom = (1 + data_dict["pv_price_yoy"])**(1/12) - 1
+    el_price_mom = (1 + data_dict["el_price_yoy"])**(1/12) - 1
+
+    # Cumulative product multiplies in the same order as the model does
+    pv_prices = np.cumprod(np.append(data_dict["pv_price"], np.full(n_steps - 1, 1 - pv_price_mom)))
+    el_prices = np.cumprod(np.append(data_dict["el_price"], np.full(n_steps - 1, 1 - el_price_mom)))
+
+    return pv_prices, el_prices
+
+def profit_table(pv_sf, pv_sc, pv_potential, pv_prices, el_prices, max_pbp):
+    '''
+    This method computes the profit perception of every agent at every step.
+    Inputs:
+        pv_sf, pv_sc, pv_potential : arrays, per agent (see compute_pbp)
+        pv_prices : array, price of solar PV system at every step [CHF/kW]
+        el_prices : array, price of electricity at every step [CHF/kWh]
+        max_pbp : float, maximum payback period considered [years]
+    Outputs:
+        profit : array (n_steps, n_agents), profit of agents at every step
+
+    Since profits only depend on building constants and on the deterministic
+    price paths, the table is the same for every run of a profile and can be
+    computed once and looked up by all of them.
+    '''
+    pbp = compute_pbp_array(pv_sf, pv_sc, pv_potential,
+                            np.asarray(pv_prices)[..., np.newaxis],
+                            np.asarray(el_prices)[..., np.newaxis],
+                            max_pbp)
+
+    # Profitability perception, see BuildingAgent.update_profit
+    return 1 - (pbp / max_pbp)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Array based small world networks.
+
+The social network of the agents is a Watts-Strogatz graph stored as CSR
+arrays: the connections of agent i are indices[indptr[i]:indptr[i+1]].
+Building it with whole-array operations instead of a networkx dict-of-dicts
+keeps build time and memory proportional to the number of edges, which
+scales to millions of buildings.
+"""
+
+import numpy as np
+import hashlib, os
+
+from Tools import CacheFiles
+
+# Directory and size cap (in bytes) of the on-disk cache of networks
+CACHE_DIR = "Datalogs/Cache/Networks"
+CACHE_MAX_BYTES = 2**30
+
+# Version of the generator, part of the cache key so that cached networks
+# are not reused if the generation algorithm changes
+GENERATOR_VERSION = 2
+
+def edge_keys(u, v, n):
+    '''
+    Integer key of the undirected edges (u, v) of a graph with n nodes.
+    '''
+    return np.minimum(u, v) * n + np.maximum(u, v)
+
+def contains(sorted_keys, keys):
+    '''
+    Boolean array, True for the keys present in the sorted array of keys.
+    '''
+    if len(sorted_keys) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return sorted_keys[pos] == keys
+
+def watts_strogatz(n, k, p, rng):
+    '''
+    This method creates a Watts-Strogatz small world network.
+    Inputs:
+        n : integer, number of nodes (agents)
+        k : integer, every node is joined with its k nearest neighbors in a
+            ring topology (k // 2 on each side)
+        p : float, probability of rewiring each edge
+        rng : numpy Generator (or seed) used for the rewiring
+    Outputs:
+        indptr : array (n+1), offsets of the connections of every node
+        indices : array, connections of every node, sorted
+
+    Follows networkx.watts_strogatz_graph: the edges of the ring lattice are
+    rewired one ring distance at a time, each one with probability p, to a
+    uniformly drawn node that is neither the node itself nor one of its
+    connections. All edges of a ring distance are rewired at once, and draws
+    that would give a self loop or a multiple edge are redrawn.
+    '''
+    rng = np.random.default_rng(rng)
+    nodes = np.arange(n, dtype=np.int64)
+
+    if k > n:
+        raise ValueError("k>n, choose smaller k or larger n")
+    elif k == n:
+        # Complete graph, as networkx
+        u, v = np.triu_indices(n, 1)
+    else:
+        # Ring lattice: every node joined with its k // 2 next nodes
+        half = k // 2
+        u = np.tile(nodes, half)
+        v = (u + np.repeat(np.arange(1, half + 1), n)) % n
+        keys = edge_keys(u, v, n)
+
+        for j in range(half):
+
+            # Edges of ring distance j+1 that are rewired
+            rewire = j*n + np.flatnonzero(rng.random(n) < p)
+            src = u[rewire]
+            new = v[rewire]
+
+            # Draw new ends until there are no self loops or multiple edges,
+            # checked against the current edges: the edges present, without
+            # the ones already rewired away and with the new ones accepted
+            present = np.sort(keys)
+            removed = np.empty(0, dtype=np.int64)
+            accepted = np.empty(0, dtype=np.int64)
+            degree = np.bincount(np.concatenate((u, v)), minlength=n)
+            todo = np.arange(len(rewire))
+            while len(todo) > 0:
+
+                # Nodes already connected to all others keep their edge
+                todo = todo[degree[src[todo]] < n - 1]
+
+                w = rng.integers(n, size=len(todo))
+                cand = edge_keys(src[todo], w, n)
+                valid = (w != src[todo]) & ~(contains(present, cand) & ~contains(removed, cand)) & ~contains(accepted, cand)
+
+                # Two draws giving the same edge: only the first one is kept
+                first = np.zeros(len(todo), dtype=bool)
+                first[np.unique(np.where(valid, cand, -1), return_index=True)[1]] = True
+                valid &= first
+
+                # The edge moves from its old end to the new one, the degree
+                # of the source node is unchanged
+                new[todo[valid]] = w[valid]
+                accepted = np.sort(np.concatenate((accepted, cand[valid])))
+                removed = np.sort(np.concatenate((removed, keys[rewire[todo[valid]]])))
+                np.add.at(degree, v[rewire[todo[valid]]], -1)
+                np.add.at(degree, w[valid], 1)
+                todo = todo[~valid]
+
+            v[rewire] = new
+            keys[rewire] = edge_keys(src, new, n)
+
+    # CSR arrays with both directions of every edge, sorted by (node, connection)
+    directed = np.sort(np.concatenate((u * n + v, v * n + u)))
+
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(directed // n, minlength=n))
+    indices = (directed % n).astype(np.int32 if n < 2**31 else np.int64)
+
+    return indptr, indices
+
+def cached_watts_strogatz(n, k, p, seed, rng, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    '''
+    This method returns the small world network of a run from the on-disk
+    cache, generating and storing it on a miss.
+    Inputs:
+        n, k, p : see watts_strogatz
+        seed : integer, seed of the run (None -> not cached)
+        rng : numpy Generator of the network stream of the run, derived
+              from the seed, used on a cache miss
+        cache_dir : string, directory of the cache
+        max_bytes : integer, size cap of the cache, the least recently used
+                    networks are deleted beyond it
+    Outputs:
+        indptr, indices : CSR arrays (see watts_strogatz), memory-mapped
+                          read-only if they come from the cache
+
+    The network of a run is fully determined by (n, k, p, seed), so every
+    run with the same parameters and seed reuses the same files.
+    '''
+    if seed is None:
+        return watts_strogatz(n, k, p, rng)
+
+    key = hashlib.sha1(repr((GENERATOR_VERSION, int(n), int(k), float(p), int(seed))).encode()).hexdigest()
+    files = [os.path.join(cache_dir, key + "_" + name + ".npy") for name in ("indptr", "indices")]
+
+    try:
+        arrays = tuple(np.load(f, mmap_mode='r') for f in files)
+
+        # Mark the network as recently used
+        for f in files:
+            os.utime(f)
+
+        return arrays
+    except (FileNotFoundError, ValueError):
+        pass
+
+    arrays = watts_strogatz(n, k, p, rng)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for f, array in zip(files, arrays):
+        CacheFiles.save_atomic(f, lambda out_file: np.save(out_file, array))
+
+    CacheFiles.evict(cache_dir, max_bytes)
+
+    return arrays
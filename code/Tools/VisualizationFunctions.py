@@ -3,10 +3,17 @@
 import matplotlib.pyplot as plt
 from matplotlib import cm
 from matplotlib.lines import Line2D
+from matplotlib.collections import LineCollection
 import matplotlib.animation as animation
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import numpy as np
 import math
 
+try:
+    from PIL import Image
+except ImportError:     # GIFs are then written by imagemagick
+    Image = None
+
 #%%
 
 # MATPLOTLIB-BASED VISUALIZATION FUNCTIONS
@@ -109,8 +116,18 @@ def HistogramPlot(data, n_bins=20, show=1, x_label="X_label", x_ax_lim = [], y_l
 # -save        -> 1 if the image must be saved into a .svg file
 # -filename    -> Name that will be given to the image file
 #
+# -simplify    -> 1 to drop the points that do not change the shape of the lines (repeated values
+#                 of a Step Plot, aligned points of a Line Plot)
+# -tolerance   -> if >0 (and simplify=1), points of a Line Plot are also dropped as long as the
+#                 plotted line stays within this vertical distance (in y units) of all of them
+# -max_lines   -> if >0, maximum number of lines to plot. The lines closest to evenly spaced
+#                 quantiles of the mean value of all lines are kept, with their original colors
+#
+# All lines are drawn as a single LineCollection, so the .svg file has one element per panel
+# instead of one per line.
+#
 
-def MultiLinePlot(data, n_lines, x_axis=[], stepshape=0, show=1, subplot=0, ax= 0, x_label="X_label", x_ax_lim = [], y_label="Y_label", y_ax_lim = [], legend=1, legendlabel='Agent', legendpos='lower right',custom_labels=[], cmap='RdYlGn', alpha=0.5, title="Title", size=(15,10), save=0, filename="test.svg"):
+def MultiLinePlot(data, n_lines, x_axis=[], stepshape=0, show=1, subplot=0, ax= 0, x_label="X_label", x_ax_lim = [], y_label="Y_label", y_ax_lim = [], legend=1, legendlabel='Agent', legendpos='lower right',custom_labels=[], cmap='RdYlGn', alpha=0.5, title="Title", size=(15,10), save=0, filename="test.svg", simplify=1, tolerance=0, max_lines=0):
 
     #Close all open figures
     if(subplot==0):
@@ -133,56 +150,66 @@ def MultiLinePlot(data, n_lines, x_axis=[], stepshape=0, show=1, subplot=0, ax=
     viridis = cm.get_cmap(cmap, n_lines)
     legend_elements = []
 
-    #For every line to plot
-    for i in range(0,n_lines):
+    #If the input data is a List:
+    if (type(data)==type([])):
 
-        #If the input data is a List:
-        if (type(data)==type([])):
+        y_arrays = [np.asarray(data[i]) for i in range(0,n_lines)]
 
-            y_array = data[i]
+        #If both x and y axes are inputs
+        if(len(x_axis)>0 and sum(np.size(x) for x in x_axis)==sum(np.size(y) for y in data)):
+            x_arrays = [np.asarray(x_axis[i]) for i in range(0,n_lines)]
 
-            #If both x and y axes are inputs
-            if(np.size(x_axis)==np.size(data)):
-                x_array = x_axis[i]
+        #Otherwise generate linear x axis
+        else:
+            x_arrays = [np.arange(0,len(y)) for y in y_arrays]
 
-            #Otherwise generate linear x axis
-            else:
-                x_array = range(0,len(data[:,i]))
+    #Otherwise we assume it is a Matrix:
+    else:
 
-        #Otherwise we assume it is a Matrix:
-        else:
+        y_arrays = [data[:,i] for i in range(0,n_lines)]
 
-            y_array = data[:,i]
+        #If both x and y axes are inputs
+        if(np.size(x_axis)==np.size(data)):
+            x_arrays = [x_axis[:,i] for i in range(0,n_lines)]
 
-            #If both x and y axes are inputs
-            if(np.size(x_axis)==np.size(data)):
-                x_array = x_axis[:,i]
+        #Otherwise generate linear x axis
+        else:
+            x_arrays = [np.arange(0,len(data[:,i])) for i in range(0,n_lines)]
 
-            #Otherwise generate linear x axis
-            else:
-                x_array = range(0,len(data[:,i]))
+    #Lines to plot
+    lines = range(0,n_lines)
+    if(max_lines>0 and n_lines>max_lines):
+        lines = RepresentativeLines(y_arrays, max_lines)
 
-        #If a Step splot is requested
-        if(stepshape==1):
-            if(subplot==0):
-                plt.step(x_array,y_array,color=viridis(i),where='post',alpha=alpha)
-            else:
-                ax.step(x_array,y_array,color=viridis(i),where='post',alpha=alpha)
+    x_arrays = [np.asarray(x_arrays[i], dtype=float) for i in lines]
+    y_arrays = [np.asarray(y_arrays[i], dtype=float) for i in lines]
 
-        #Otherwise it's a Line plot
+    #Drop the points that do not change the shape of the lines (all lines at once if possible)
+    if(simplify==1):
+        if(len(set(len(y) for y in y_arrays))==1):
+            keep = KeptPoints(np.column_stack(x_arrays), np.column_stack(y_arrays), stepshape, tolerance).T
         else:
-            if(subplot==0):
-                plt.plot(x_array,y_array,color=viridis(i),alpha=alpha)
-            else:
-                ax.plot(x_array,y_array,color=viridis(i),alpha=alpha)
+            keep = [KeptPoints(x[:,None], y[:,None], stepshape, tolerance)[:,0] for x, y in zip(x_arrays, y_arrays)]
+        x_arrays = [x[k] for x, k in zip(x_arrays, keep)]
+        y_arrays = [y[k] for y, k in zip(y_arrays, keep)]
+
+    #Create all Lines or Steps at once
+    segments = [LineVertices(x, y, stepshape) for x, y in zip(x_arrays, y_arrays)]
+    collection = LineCollection(segments, colors=[viridis(i) for i in lines], alpha=alpha, linewidths=plt.rcParams['lines.linewidth'], capstyle='projecting', joinstyle='round')
 
-        #If legend is requested, append element with label
-        if(legend==1 and subplot==0):
+    if(subplot==0):
+        ax = plt.gca()
+    ax.add_collection(collection)
+    ax.autoscale_view()
+
+    #If legend is requested, append element with label
+    if(legend==1 and subplot==0):
+        for i in lines:
             if(len(custom_labels)>1):
                 legend_elements.append(Line2D([0],[0], marker='s', color='w', label=custom_labels[i], markerfacecolor=viridis(i), markersize=15))
             else:
                 legend_elements.append(Line2D([0],[0], marker='s', color='w', label=legendlabel+" "+str(i), markerfacecolor=viridis(i), markersize=15))
-    
+
     #Only if not a subplot
     if(subplot==0):
 
@@ -198,6 +225,67 @@ def MultiLinePlot(data, n_lines, x_axis=[], stepshape=0, show=1, subplot=0, ax=
         if(show==1):
             plt.show()
 
+# Auxiliary function to get the points (T,n) of the lines (columns) of MultiLinePlot that are
+# needed to draw them. For a Step Plot, those are the points where the value changes. For a Line
+# Plot, a point is dropped when the line from the last point kept to the next one stays within
+# tolerance of it and of the points dropped before (the slopes that do so are kept as a range).
+def KeptPoints(x_matrix, y_matrix, stepshape, tolerance=0):
+    x_matrix, y_matrix = np.broadcast_arrays(x_matrix, y_matrix)
+    n_points, n_lines = y_matrix.shape
+
+    keep = np.ones((n_points, n_lines), dtype=bool)
+    if(n_points<3):
+        return keep
+
+    #Step Plot: only the points where the value changes, and the last one
+    if(stepshape==1):
+        keep[1:-1] = y_matrix[1:-1]!=y_matrix[:-2]
+        return keep
+
+    keep[1:-1] = False
+    x_last, y_last = x_matrix[0].copy(), y_matrix[0].copy()
+    lower, upper = np.full(n_lines, -np.inf), np.full(n_lines, np.inf)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for t in range(1, n_points):
+            dx = x_matrix[t] - x_last
+            slope = (y_matrix[t] - y_last)/dx
+
+            #The line to this point misses a dropped one: keep the previous point
+            missed = ~((slope>=lower) & (slope<=upper))
+            missed &= ~keep[t-1]
+            keep[t-1] |= missed
+            x_last[missed], y_last[missed] = x_matrix[t-1, missed], y_matrix[t-1, missed]
+            lower[missed], upper[missed] = -np.inf, np.inf
+
+            #Slopes from the last point kept that pass within tolerance of this point
+            dx = x_matrix[t] - x_last
+            lower = np.fmax(lower, (y_matrix[t] - tolerance - y_last)/dx)
+            upper = np.fmin(upper, (y_matrix[t] + tolerance - y_last)/dx)
+
+    #Lines with missing values are kept whole
+    keep[:, ~np.isfinite(y_matrix).all(axis=0)] = True
+
+    return keep
+
+# Auxiliary function to get the vertices (k,2) of a line of MultiLinePlot
+def LineVertices(x_array, y_array, stepshape):
+
+    #Steps change at every x (where='post')
+    if(stepshape==1 and len(y_array)>1):
+        x_array = np.repeat(x_array, 2)[1:]
+        y_array = np.repeat(y_array, 2)[:-1]
+
+    return np.column_stack([x_array, y_array])
+
+# Auxiliary function to choose the lines of MultiLinePlot that represent evenly spaced
+# quantiles of the mean value of all lines
+def RepresentativeLines(y_arrays, max_lines):
+    means = np.array([np.nanmean(y) if len(y)>0 else np.nan for y in y_arrays])
+    order = np.argsort(means, kind='stable')
+
+    return np.sort(order[np.round(np.linspace(0, len(order)-1, max_lines)).astype(int)])
+
 #%%
 
 # --------------------------
@@ -227,8 +315,12 @@ def MultiLinePlot(data, n_lines, x_axis=[], stepshape=0, show=1, subplot=0, ax=
 # -save        -> 1 if the image must be saved into a .svg file
 # -filename    -> Name that will be given to the image file
 #
+# -simplify    -> see MultiLinePlot
+# -tolerance   -> see MultiLinePlot
+# -max_lines   -> see MultiLinePlot (applied to every subplot)
+#
 
-def MultipleSubplot(data, n_lines, testvar=0, x_axis=[], stepshape=0, show=1, subtitles=[], x_label="X_label", x_ax_lim = [], y_label="Y_label", y_ax_lim = [], cmap='RdYlGn', title="Title", alpha=0.5, size=(15,10), save=0, filename="test.svg"):
+def MultipleSubplot(data, n_lines, testvar=0, x_axis=[], stepshape=0, show=1, subtitles=[], x_label="X_label", x_ax_lim = [], y_label="Y_label", y_ax_lim = [], cmap='RdYlGn', title="Title", alpha=0.5, size=(15,10), save=0, filename="test.svg", simplify=1, tolerance=0, max_lines=0):
 
     #Close all open figures
     plt.close('all')
@@ -280,13 +372,13 @@ def MultipleSubplot(data, n_lines, testvar=0, x_axis=[], stepshape=0, show=1, su
 
         if(len(x_axis)>1):
             if(n==1):
-                MultiLinePlot(data[splot], n_lines, x_axis=x_axis[splot], stepshape=0, show=0, subplot=1, ax=axs[int(splot/n)], x_label="", x_ax_lim = [], y_label="", y_ax_lim = [], legend=0, alpha=alpha, cmap='RdYlGn', save=0)
+                MultiLinePlot(data[splot], n_lines, x_axis=x_axis[splot], stepshape=0, show=0, subplot=1, ax=axs[int(splot/n)], x_label="", x_ax_lim = [], y_label="", y_ax_lim = [], legend=0, alpha=alpha, cmap='RdYlGn', save=0, simplify=simplify, tolerance=tolerance, max_lines=max_lines)
                 if(sub_insert):
                     axs[int(splot/n)].set_title(subtitles[splot])
                 else:
                     axs[int(splot/n)].set_title("Profile "+str(splot))
             else:
-                MultiLinePlot(data[splot], n_lines, x_axis=x_axis[splot], stepshape=0, show=0, subplot=1, ax=axs[int(splot/n),int(splot%n)], x_label="", x_ax_lim = [], y_label="", y_ax_lim = [], legend=0, alpha=alpha, cmap='RdYlGn', save=0)
+                MultiLinePlot(data[splot], n_lines, x_axis=x_axis[splot], stepshape=0, show=0, subplot=1, ax=axs[int(splot/n),int(splot%n)], x_label="", x_ax_lim = [], y_label="", y_ax_lim = [], legend=0, alpha=alpha, cmap='RdYlGn', save=0, simplify=simplify, tolerance=tolerance, max_lines=max_lines)
                 if(sub_insert):
                     axs[int(splot/n),int(splot%n)].set_title(subtitles[splot])
                 else:
@@ -294,13 +386,13 @@ def MultipleSubplot(data, n_lines, testvar=0, x_axis=[], stepshape=0, show=1, su
 
         else:
             if(n==1):
-                MultiLinePlot(data[splot], n_lines, x_axis=[], stepshape=0, show=0, subplot=1, ax=axs[int(splot/n)], x_label="", x_ax_lim = [], y_label="", y_ax_lim = [], legend=0, alpha=alpha, cmap='RdYlGn', save=0)
+                MultiLinePlot(data[splot], n_lines, x_axis=[], stepshape=0, show=0, subplot=1, ax=axs[int(splot/n)], x_label="", x_ax_lim = [], y_label="", y_ax_lim = [], legend=0, alpha=alpha, cmap='RdYlGn', save=0, simplify=simplify, tolerance=tolerance, max_lines=max_lines)
                 if(sub_insert):
                     axs[int(splot/n)].set_title(subtitles[splot])
                 else:
                     axs[int(splot/n)].set_title("Profile "+str(splot))
             else:
-                MultiLinePlot(data[splot], n_lines, x_axis=[], stepshape=0, show=0, subplot=1, ax=axs[int(splot/n),int(splot%n)], x_label="", x_ax_lim = [], y_label="", y_ax_lim = [], legend=0, alpha=alpha, cmap='RdYlGn', save=0)
+                MultiLinePlot(data[splot], n_lines, x_axis=[], stepshape=0, show=0, subplot=1, ax=axs[int(splot/n),int(splot%n)], x_label="", x_ax_lim = [], y_label="", y_ax_lim = [], legend=0, alpha=alpha, cmap='RdYlGn', save=0, simplify=simplify, tolerance=tolerance, max_lines=max_lines)
                 if(sub_insert):
                     axs[int(splot/n),int(splot%n)].set_title(subtitles[splot])
                 else:
@@ -320,6 +412,114 @@ def MultipleSubplot(data, n_lines, testvar=0, x_axis=[], stepshape=0, show=1, su
 
 #%%
 
+# --------------------------
+# DENSITY PLOT FUNCTION
+# --------------------------
+#
+# DESCRIPTION: it creates an image of the evolution of a variable over a population, as an
+#              alternative to a MultiLinePlot with one line per agent. The image has a fixed
+#              number of pixels, so drawing it does not depend on the number of agents.
+#
+# INPUT ARGUMENTS
+#
+# -data        -> matrix (steps, agents) with the data values to plot
+#
+# -mode        -> 'histogram': the color of every (step, value bin) is the fraction of agents
+#                              with a value in the bin on that step
+#                 'sorted'   : the values of every step are sorted, and the color of every
+#                              (step, quantile) is the value of the agent at that quantile
+# -n_bins      -> number of value bins ('histogram') or of quantiles ('sorted')
+#
+# -show        -> 1 if the image must be shown in screen
+#
+# -subplot     -> 1 if used as a subplot
+# -ax          -> If subplot==1, ax corresponding to the subplot
+#
+# -x_label     -> label that will appear on the x-axis
+# -y_label     -> label that will appear on the y-axis
+# -y_ax_lim    -> list with the range of values (min,max), from the data if empty
+#
+# -colorbar    -> 1 if a colorbar is wanted
+# -color_label -> label of the colorbar
+#
+# -title       -> Title that will appear on the graph
+# -size        -> Size of the graph (x,y)
+# -cmap        -> Color map being used
+# -save        -> 1 if the image must be saved into a .svg file
+# -filename    -> Name that will be given to the image file
+#
+
+def DensityPlot(data, mode='histogram', n_bins=100, show=1, subplot=0, ax=0, x_label="X_label", y_label="Y_label", y_ax_lim=[], colorbar=1, color_label="", cmap='viridis', title="Title", size=(15,10), save=0, filename="test.svg"):
+
+    #Close all open figures
+    if(subplot==0):
+        plt.close('all')
+
+    #Configure Plot (only if it's not a subplot)
+    if(subplot==0):
+        plt.figure(figsize=size)
+        plt.title(title, fontsize=16)
+        plt.xlabel(x_label, fontsize=12)
+        plt.ylabel(y_label, fontsize=12)
+        ax = plt.gca()
+
+    data = np.asarray(data)
+    n_steps, n_agents = data.shape
+
+    if(len(y_ax_lim)==2):
+        lower, upper = y_ax_lim
+    else:
+        lower, upper = np.nanmin(data), np.nanmax(data)
+        if(upper==lower):
+            upper = lower+1
+
+    #Fraction of agents of every step in every value bin
+    if(mode=='histogram'):
+        image = np.zeros((n_bins, n_steps))
+        block_steps = max(1, 2**24//max(n_agents,1))     # Steps binned at once (bounded memory)
+        for start in range(0, n_steps, block_steps):
+            block = data[start:start+block_steps]
+            idx = np.clip(np.floor((block - lower)/(upper - lower)*n_bins), 0, n_bins-1)
+            steps = np.broadcast_to(np.arange(len(block))[:,np.newaxis], block.shape)
+            valid = np.isfinite(idx)
+            counts = np.bincount((steps[valid]*n_bins + idx[valid].astype(np.int64)), minlength=len(block)*n_bins)
+            image[:, start:start+len(block)] = counts.reshape(len(block), n_bins).T/n_agents
+        extent = [-0.5, n_steps-0.5, lower, upper]
+        norm = None
+        y_label_image = y_label
+
+    #Value of the agents at every quantile of every step
+    elif(mode=='sorted'):
+        ranks = np.round(np.linspace(0, n_agents-1, min(n_bins, n_agents))).astype(np.int64)
+        image = np.sort(data, axis=1)[:, ranks].T
+        extent = [-0.5, n_steps-0.5, 0, 1]
+        norm = plt.Normalize(lower, upper)
+        y_label_image = "Quantile of the agents"
+
+    else:
+        raise ValueError("Unknown density mode: " + str(mode))
+
+    #Create image
+    img = ax.imshow(image, origin='lower', aspect='auto', extent=extent, cmap=cmap, norm=norm, interpolation='nearest')
+
+    if(subplot==0):
+        plt.ylabel(y_label_image, fontsize=12)
+
+        #Setup Colorbar if requested
+        if(colorbar==1):
+            cbar = plt.colorbar(img)
+            cbar.set_label(color_label if len(color_label)>0 else ("Fraction of agents" if mode=='histogram' else y_label))
+
+        #Save image if requested
+        if(save==1):
+            plt.savefig(filename, format='svg')
+
+        #Show image if requested
+        if(show==1):
+            plt.show()
+
+#%%
+
 # --------------------------
 # COLOURED MAP PLOT FUNCTION
 # --------------------------
@@ -410,6 +610,9 @@ def ColourMap(x_axis, y_axis, col_axis, col_range=(0,1), x_label="X_label", y_la
 # DESCRIPTION: it generates a .gif file from a series of coloured maps.
 #              NOTE: it does not display the animation, but the .gif is correctly created.
 #              Look at the file to see the output, not at the image displayed.
+#              With Pillow installed, the figure is drawn only once and the .gif is encoded
+#              in memory (see SaveColourMapGIF). Other formats (e.g. .mp4) are written
+#              frame by frame by the default matplotlib writer.
 #
 # INPUT ARGUMENTS
 #
@@ -444,12 +647,91 @@ def AnimateColourMap(numframes, x_axis, y_axis, col_matrix, dlyfactor=1, col_ran
     #Implement the initial figure
     fig, scatter = ColourMap(x_axis, y_axis, col_matrix[0], col_range=col_range, x_label=x_label, y_label=y_label, colorbar=colorbar, Nlegend=Nlegend, color_label=color_label, title=title, size=size, cmap=cmap, markersize=markersize, save=0, internal=True)
         
-    #Create animation and save .gif
-    ani = animation.FuncAnimation(fig, update_plot, frames=range(int(numframes*dlyfactor)),fargs=(col_matrix, scatter, dlyfactor),blit=True)
-    ani.save(filename, writer='imagemagick')
+    #Iteration shown in every frame
+    frames = (np.arange(int(numframes*dlyfactor))/dlyfactor).astype(int)
+
+    #Save .gif from the pixels of the figure
+    if filename.endswith(".gif") and Image is not None:
+        SaveColourMapGIF(fig, scatter, col_matrix, frames, filename)
+        plt.close(fig)
+        return
+
+    #Otherwise, create animation and save it
+    ani = animation.FuncAnimation(fig, update_plot, frames=range(len(frames)),fargs=(col_matrix, scatter, dlyfactor),blit=True)
+    ani.save(filename, writer='imagemagick' if filename.endswith(".gif") else None)
 
 # Auxiliary function to create the Animation
 def update_plot(i, data, scat, dlyfactor):
     k = int(i/dlyfactor)
     scat.set_array(data[k])
     return scat,
+
+# Auxiliary function to write the .gif of AnimateColourMap without redrawing the figure.
+# The figure is drawn once without the scatter plot (static background), and then with only
+# the markers, coloured with the index of their agent, so that every pixel is known to belong
+# to the background or to an agent. Pixels of artists drawn on top of the markers (e.g. the
+# legend) are kept from the background. Every frame is then a copy of the background with the
+# palette index of the colour of each agent written in its pixels, and consecutive equal frames
+# are merged into a longer one.
+def SaveColourMapGIF(fig, scatter, col_matrix, frames, filename, interval=200, max_levels=64):
+
+    canvas = FigureCanvasAgg(fig)
+    values = np.asarray(col_matrix)[frames]
+    n_agents = values.shape[1]
+
+    artists = [fig.patch] + [artist for ax in fig.axes for artist in (ax.get_children() if ax is scatter.axes else [ax]) if artist.get_visible()]
+    above = [artist for artist in artists if artist.axes is scatter.axes and artist.get_zorder() > scatter.get_zorder()]
+
+    def draw(shown):
+        for artist in artists:
+            artist.set_visible(any(artist is other for other in shown))
+        canvas.draw()
+        return np.asarray(canvas.buffer_rgba()).astype(np.int64)
+
+    #Static background
+    background = draw([artist for artist in artists if artist is not scatter])[:, :, :3].astype(np.uint8)
+
+    #Agent of every pixel (-1 for the background)
+    labels = np.arange(1, n_agents+1)
+    scatter.set_array(None)
+    scatter.set_facecolor(np.column_stack([labels & 255, (labels >> 8) & 255, (labels >> 16) & 255, np.full(n_agents, 255)])/255)
+    scatter.set_antialiased(False)
+    pixels = draw([scatter])
+    agent = np.where(pixels[:, :, 3] == 255, pixels[:, :, 0] + (pixels[:, :, 1] << 8) + (pixels[:, :, 2] << 16), 0) - 1
+
+    #Pixels at least half covered by a marker, and not hidden by other artists
+    scatter.set_antialiased(True)
+    marker = (agent >= 0) & (draw([scatter])[:, :, 3] >= 128) & (draw(above)[:, :, 3] == 0)
+    agent = agent[marker]
+
+    for artist in artists:
+        artist.set_visible(True)
+
+    #Colour levels of the agents (quantized if the values are continuous)
+    levels, codes = np.unique(values, return_inverse=True)
+    if len(levels) > max_levels:
+        codes = np.round(np.clip(scatter.norm(values), 0, 1)*(max_levels-1)).astype(int)
+        levels = scatter.norm.inverse(np.linspace(0, 1, max_levels))
+    codes = codes.reshape(values.shape)
+    colours = scatter.to_rgba(np.asarray(levels), bytes=True)[:, :3]
+
+    #Palette: background colours, followed by the colour levels
+    background = Image.fromarray(background).quantize(colors=256-len(colours), dither=0)
+    n_background = int(np.asarray(background).max())+1
+    palette = background.getpalette()[:3*n_background] + colours.reshape(-1).tolist()
+    background = np.asarray(background)
+
+    #Frames, merging the consecutive equal ones
+    images, durations = [], []
+    for i in range(len(frames)):
+        if i > 0 and np.array_equal(codes[i], codes[i-1]):
+            durations[-1] += interval
+            continue
+        frame = background.copy()
+        frame[marker] = n_background + codes[i][agent]
+        image = Image.fromarray(frame)
+        image.putpalette(palette)
+        images.append(image)
+        durations.append(interval)
+
+    images[0].save(filename, save_all=True, append_images=images[1:], duration=durations, loop=0)
@@ -10,11 +10,12 @@
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import json, time, multiprocessing, sys, os
+import json, time, multiprocessing, argparse, os, shutil, collections, itertools
 
 # Importing the Agent and Model Classes
 from Agent.BuildingAgent import BuildingAgent
 from Model.BuildingModel import BuildingModel
+from Model.VectorModel import VectorModel, ScenarioRecorder
 
 # Import Visualization Functions
 from Tools.VisualizationFunctions import ColourMap
@@ -23,18 +24,36 @@ from Tools.VisualizationFunctions import AnimateColourMap
 # Import Datalogging Functions
 from Tools.DataloggingFunctions import InitializeCSV
 from Tools.DataloggingFunctions import Write2CSV
+from Tools.DataloggingFunctions import InitializeNPY
+from Tools.DataloggingFunctions import Write2NPY
+from Tools.DataloggingFunctions import AgentRecorder
+from Tools.DataloggingFunctions import StreamingRecorder
+from Tools.DataloggingFunctions import CSVLogWriter
+from Tools.DataloggingFunctions import NPYLogWriter
+from Tools.DataloggingFunctions import WriteMFEvents
+from Tools.DataloggingFunctions import SummaryLogWriter
+from Tools.DataloggingFunctions import SummaryCollector
+from Tools.Reducers import summary_columns
 
 # Import Analysis Functions
 from Tools.AnalysisFunctions import AverageHFDataframe
 
+# Import Payback Functions
+from Tools import SimplePayback, PriceScenarios, ParameterSweep, RunCache
+
 ###############################################################################################
 
-# Read the expt name from command line arguments (mandatory!)
-try:
-    expt_name = sys.argv[1]
-except:
+# Read the expt name and the number of worker processes from command line arguments
+parser = argparse.ArgumentParser(description="Run the simulations of an experiment")
+parser.add_argument("expt_name", nargs="?", default=None, help="name of the experiment in Data/Experiments")
+parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all cores)")
+args = parser.parse_args()
+
+if args.expt_name is None:
     print("Running Default Experiment - uni_extremism")
     expt_name = "uni_extremism"
+else:
+    expt_name = args.expt_name
 
 # Read experiment data
 expt_file = "Data/Experiments/" + expt_name + ".json"
@@ -59,24 +78,88 @@ n_steps = expt_data["n_time_steps"]
 # Defining csv keys
 HF_data_columns = ['Run','Utility','Opinion','Uncertainty','Neighbor','Profit']
 MF_data_columns = ['Run','PV_alone_cnt','PV_alone_chg','PV_com_cnt','PV_com_chg','Com_Idea_cnt','Com_Idea_chg','Seed']
+SC_data_columns = ['Run','PV_alone_cnt','PV_com_cnt','Com_Idea_cnt','Utility','Opinion','Profit']
+
+# Columns of the binary HF logs and state variables of the binary MF logs -> names of the recorded agent variables
+HF_npy_columns = ['Utility','Opinion','Uncertainty','Neighbor','Profit']
+MF_npy_states = ['pv_alone','pv_community','community']
 
 # Read building data from the CSV %%file
 b_data = pd.read_csv(b_data_file, nrows=n_agents)
 
+# Simulation engine: "mesa" (BuildingModel) or "vector" (VectorModel)
+try:
+    engine = expt_data["engine"]
+except KeyError:
+    engine = "mesa"
+
+# Batched runs: all seeds of a profile advance together in one vector model
+try:
+    batched = expt_data["batched_runs"]
+except KeyError:
+    batched = False
+
+# Format of the HF and MF logs: "csv" (default) or "npy" (binary columns)
+try:
+    log_format = expt_data["log_format"]
+except KeyError:
+    log_format = "csv"
+
+# Number of steps buffered in memory before they are written to the logs
+try:
+    log_buffer_steps = expt_data["log_buffer_steps"]
+except KeyError:
+    log_buffer_steps = 16
+
+# Full HF logs of every agent can be skipped (e.g. for sweeps), keeping the MF and Summary logs
+try:
+    log_hf = expt_data["log_hf"]
+except KeyError:
+    log_hf = True
+
+# Reducers computed while the model runs, written to the Summary log (see Tools/Reducers.py)
+try:
+    reducers = expt_data["reducers"]
+except KeyError:
+    reducers = {}
+
+# Parameter sweep replacing the profiles of the experiment (see Tools/ParameterSweep.py)
+try:
+    sweep = expt_data["sweep"]
+except KeyError:
+    sweep = None
+
+# Final summaries of every point of a sweep
+sweep_reducers = reducers if reducers else ParameterSweep.SWEEP_REDUCERS
+
+# Runs already simulated with the same inputs are read from the cache of runs (see Tools/RunCache.py)
+try:
+    run_cache = expt_data["run_cache"]
+except KeyError:
+    run_cache = True
+
+# Version of the model and of the buildings, part of the key of every cached run
+model_version = RunCache.model_version([b_data_file]) if run_cache else None
+
 ################################################################################################
 
-# Function for running each profile - to be called from multiprocessing
-def run_profile(expt_data, profile_id):
+# Function for creating a model with the selected simulation engine
+def make_model(data_dict, seed=None, profit_table=None, recorder=None):
 
-    start_time = time.time()
-    print("****************************************")
-    print(" RUNNING PROFILE " + str(profile_id) + " OF " + expt_data["experiment_name"])
-    print("****************************************")
+    if engine == "vector":
+        return VectorModel(b_data, n_agents, data_dict, seed = seed, profit_table = profit_table, n_steps = n_steps, recorder = recorder)
+    elif engine == "mesa":
+        return BuildingModel(BuildingAgent, b_data, n_agents, data_dict, seed = seed, profit_table = profit_table, n_steps = n_steps, recorder = recorder)
+    else:
+        raise ValueError("Unknown simulation engine: " + str(engine))
+
+################################################################################################
+
+# Function for reading the input data of a profile
+def load_profile(expt_data, profile_id):
 
-    # Systematical naming for input and output files                                 
-    curr_profile_name = "profile_"+str(profile_id)    # Current Profile name
-    m_prof_file = "Data/Experiments/" + expt_data["rel_profile_dir"] + "/" + curr_profile_name+".json"     
     # Current input profile
+    m_prof_file = "Data/Experiments/" + expt_data["rel_profile_dir"] + "/profile_" + str(profile_id) + ".json"
 
     # Read building meta data off JSON file
     with open(m_data_file) as myjson:
@@ -86,19 +169,210 @@ def run_profile(expt_data, profile_id):
     with open(m_prof_file) as myjson:
         data_dict.update(json.loads(myjson.read()))
 
-    # Initialize model
-    model = BuildingModel(BuildingAgent, b_data, n_agents, data_dict)
+    return data_dict
+
+# Profit tables of the last price inputs simulated by this process
+profit_tables = collections.OrderedDict()
+PROFIT_TABLES_SIZE = 8
+
+# Keys of a profile the profit table depends on
+PRICE_KEYS = ("pv_price", "el_price", "pv_price_yoy", "el_price_yoy", "max_pbp", "price_scenarios")
+
+# Function for computing (once per process) the profit table of a profile
+# Profiles and sweep points with the same prices share it
+def profile_profit_table(data_dict):
+
+    key = json.dumps([data_dict.get(price_key) for price_key in PRICE_KEYS], sort_keys=True)
+    if key in profit_tables:
+        profit_tables.move_to_end(key)
+    else:
+
+        # Profits only depend on the buildings and on the price paths of the
+        # profile, so they are computed once and shared by every run
+        pv_sf, pv_sc, pv_potential = SimplePayback.pv_system_parameters(b_data)
+        pv_prices, el_prices = PriceScenarios.load_price_scenarios(data_dict, n_steps)
+        profit_table = SimplePayback.profit_table(pv_sf, pv_sc, pv_potential, pv_prices, el_prices, data_dict["max_pbp"])
+
+        # Price ensemble: all scenarios are simulated at once by the vector engine
+        # and only population aggregates per scenario are logged
+        profit_tables[key] = profit_table if "price_scenarios" in data_dict else profit_table[0]
+        if len(profit_tables) > PROFIT_TABLES_SIZE:
+            profit_tables.popitem(last=False)
+
+    return profit_tables[key]
+
+################################################################################################
+
+# Seed of every run, if defined in expt file
+def run_seeds(expt_data):
+
+    try:
+        myseeds = expt_data["batch_seeds"]
+    except:
+        myseeds = None
+
+    return [myseeds[run] if myseeds != None else None for run in range(expt_data["n_batches"])]
+
+# Temporary CSV file with the logs of one run, merged into the profile logs in run order
+def part_file(filename, run):
+    return filename + ".run" + str(run) + ".part"
+
+# Key of a run in the cache of runs, None if it is not cached (no cache or no seed)
+# The run number is part of the key since it is written in the rows of the logs
+def run_cache_key(data_dict, seed, run):
+
+    if not run_cache or seed is None:
+        return None
+
+    inputs = {"data_dict": data_dict, "seed": seed, "run": run, "n_steps": n_steps, "engine": engine,
+              "log_format": log_format, "log_hf": log_hf, "reducers": reducers,
+              "columns": [HF_data_columns, MF_data_columns, SC_data_columns, HF_npy_columns, MF_npy_states]}
+
+    # Prices read from a file are part of the inputs
+    scenarios = data_dict.get("price_scenarios")
+    if isinstance(scenarios, dict) and scenarios.get("type") == "file":
+        inputs["price_file"] = RunCache.files_hash([scenarios["file"]])
+
+    return RunCache.run_key(inputs, model_version)
+
+# Function for adding the logs of a finished run to the cache of runs
+# CSV parts are copied, binary logs are stored as the HF arrays and MF events of the run
+def cache_run(key, out_files, run, parts):
+
+    if key is None:
+        return
+
+    files = {df_type:part for df_type, part in parts.items() if df_type != 'MF' or log_format != "npy"}
+    arrays = {}
+    if 'MF' in parts and log_format == "npy":
+        arrays.update({'MF_'+state:events for state, events in parts['MF'].items()})
+        if log_hf:
+            arrays.update({'HF_'+col:np.load(out_files['HF'] + "/" + col + ".npy", mmap_mode='r')[run] for col in HF_npy_columns})
+
+    RunCache.store(key, files, arrays)
+
+# Function for reading a run from the cache of runs, as the results of a task would give it
+def fetch_run(entry, out_files, run):
+
+    parts = {}
+    for df_type in ('HF','MF','Summary','SC'):
+        if df_type in entry:
+            parts[df_type] = part_file(out_files[df_type],run)
+            shutil.copyfile(entry[df_type], parts[df_type])
+
+    if 'MF_'+MF_npy_states[0] in entry:
+        if log_hf:
+            Write2NPY(out_files['HF'],HF_npy_columns,{col:np.load(entry['HF_'+col]) for col in HF_npy_columns},run)
+        parts['MF'] = {state:np.load(entry['MF_'+state]) for state in MF_npy_states}
+
+    return parts
+
+# Function for simulating a task, i.e. some runs of a profile - to be called from the worker pool
+# CSV logs of every run go to part files, appended to the logs by the main process
+# Binary HF logs are written by the worker itself, each run in its own slice, and the
+# MF change events of every run are returned to the main process
+# Points of a sweep (no out_files) write no logs, only the final summaries are returned
+def run_task(task):
+
+    profile_id, data_dict, runs, seeds, out_files = task
+
+    profit_table = profile_profit_table(data_dict)
+    ensemble = "price_scenarios" in data_dict
+
+    # Price ensembles record the aggregates of every scenario, otherwise the agent
+    # variables of every run are streamed to its logs while the model runs
+    if ensemble:
+        recorder = ScenarioRecorder((len(profit_table), len(runs)) if batched else len(profit_table), n_steps)
+    else:
+        writers = []
+        log_writers = {}
+        for i, run in enumerate(runs):
+
+            # Position of the run in the agent arrays of the model
+            index = (0, i) if batched else ((0,) if engine == "vector" else ())
+
+            if out_files is None:
+                writer = SummaryCollector(sweep_reducers)
+                writers.append((index, writer))
+                log_writers[run] = writer
+                continue
+
+            if log_format == "npy":
+                writer = NPYLogWriter(out_files['HF'] if log_hf else None,HF_npy_columns,MF_npy_states,run)
+            else:
+                writer = CSVLogWriter(part_file(out_files['HF'],run) if log_hf else None,part_file(out_files['MF'],run),HF_data_columns,run)
+            writers.append((index, writer))
+            log_writers[run] = writer
+
+            if reducers:
+                writers.append((index, SummaryLogWriter(part_file(out_files['Summary'],run),reducers,run)))
+
+        recorder = StreamingRecorder(writers, log_buffer_steps)
+
+    # Re-Initialize model, a single batched model for several runs
+    cur_seed = seeds if batched else seeds[0]
+    model = make_model(data_dict, seed = cur_seed, profit_table = profit_table, recorder = recorder)
+
+    # Run n_steps
+    for timestep in range(n_steps):
+        model.step()
+
+    if not ensemble:
+        recorder.close()
+
+        if out_files is None:
+            return profile_id, [(run, {'Sweep': log_writers[run].final}) for run in runs]
+
+        # Part files of every run to append to the logs, and MF events of binary logs
+        df_types = ['Summary'] if reducers else []
+        if log_format != "npy":
+            df_types += ['MF','HF'] if log_hf else ['MF']
+        results = [(run, {df_type:part_file(out_files[df_type],run) for df_type in df_types}) for run in runs]
+        if log_format == "npy":
+            for run, parts in results:
+                parts['MF'] = log_writers[run].events()
+        for seed, (run, parts) in zip(seeds, results):
+            cache_run(run_cache_key(data_dict, seed, run), out_files, run, parts)
+        return profile_id, results
+
+    # Write the aggregates of every price scenario, sliced out of the batch - Once per run
+    results = []
+    for i, run in enumerate(runs):
+        SC_part_file = part_file(out_files['SC'],run)
+        open(SC_part_file, 'w').close()
+        Write2CSV(SC_part_file,SC_data_columns,recorder.view((slice(None), i)) if batched else recorder,run,n_steps,n_agents,df_type='SC')
+        results.append((run, {'SC': SC_part_file}))
+        cache_run(run_cache_key(data_dict, seeds[i], run), out_files, run, results[-1][1])
+
+    return profile_id, results
+
+# Function for preparing the output files of a profile and splitting it into tasks
+def setup_profile(expt_data, profile_id):
+
+    print("****************************************")
+    print(" RUNNING PROFILE " + str(profile_id) + " OF " + expt_data["experiment_name"] + " (" + engine + " engine)")
+    print("****************************************")
+
+    data_dict = load_profile(expt_data, profile_id)
+    curr_profile_name = "profile_"+str(profile_id)    # Current Profile name
+
+    ensemble = "price_scenarios" in data_dict
+    if (ensemble or batched) and engine != "vector":
+        raise ValueError("Price scenarios and batched runs need the vector engine")
 
     # Get coordinates
-    x_coord = model.x_coord
-    y_coord = model.y_coord
+    x_coord = b_data["building_coord_x"].to_numpy()
+    y_coord = b_data["building_coord_y"].to_numpy()
 
     # Datalogging files
     log_dir = "Datalogs/Logs/"+expt_data["experiment_name"]
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
-    HF_out_file = log_dir + "/" + curr_profile_name + "_HF.csv"
-    MF_out_file = log_dir + "/" + curr_profile_name + "_MF.csv"
+    suffix = "" if log_format == "npy" else ".csv"     # Binary logs are directories of columns
+    out_files = {'HF': log_dir + "/" + curr_profile_name + "_HF" + suffix,
+                 'MF': log_dir + "/" + curr_profile_name + "_MF" + suffix,
+                 'SC': log_dir + "/" + curr_profile_name + "_Scenarios.csv",
+                 'Summary': log_dir + "/" + curr_profile_name + "_Summary.csv"}
     Building_Coord_file = log_dir + "/" + curr_profile_name + "_Coordinates.csv"
 
     # Create dataframe and write coordinates to csv file
@@ -106,41 +380,184 @@ def run_profile(expt_data, profile_id):
     coord_dataframe.index.name = 'AgentID'                                         
     coord_dataframe.to_csv(Building_Coord_file, sep=';', mode='w', header=True) 
 
-    # Initialize CSV Outputs - Once per batch
-    InitializeCSV(HF_out_file,HF_data_columns,['Step','AgentID'])
-    InitializeCSV(MF_out_file,MF_data_columns,['Step'])
-
     batch_size = expt_data["n_batches"]
 
-    try:
-        myseeds = expt_data["batch_seeds"]
-    except:
-        myseeds = None
+    seeds = run_seeds(expt_data)
+
+    # Initialize CSV or binary Outputs - Once per batch
+    if ensemble:
+        InitializeCSV(out_files['SC'],SC_data_columns,['Scenario','Step'])
+    elif log_format == "npy":
+        dtypes = AgentRecorder.reporters
+        if log_hf:
+            InitializeNPY(out_files['HF'],{col:dtypes[col][1] for col in HF_npy_columns},batch_size,n_steps,n_agents,seeds)
+        else:
+            shutil.rmtree(out_files['HF'], ignore_errors=True)
+
+        # MF events are written when all runs are finished
+        shutil.rmtree(out_files['MF'], ignore_errors=True)
+    else:
+        if log_hf:
+            InitializeCSV(out_files['HF'],HF_data_columns,['Step','AgentID'])
+        elif os.path.exists(out_files['HF']):
+            os.remove(out_files['HF'])
+        InitializeCSV(out_files['MF'],MF_data_columns,['Step'])
+
+        # Binary logs of a previous simulation would be read instead of the CSV files
+        for df_type in ('HF','MF'):
+            shutil.rmtree(log_dir + "/" + curr_profile_name + "_" + df_type, ignore_errors=True)
+
+    # Summary log with the per-step columns of the reducers
+    if reducers and not ensemble:
+        columns = summary_columns(reducers,{col:dtype for col, (attr, dtype) in AgentRecorder.reporters.items()})
+        InitializeCSV(out_files['Summary'],['Run']+columns,['Step'])
+
+    # Runs read from the cache of runs, and runs left to simulate
+    cached = []
+    runs = []
+    for run in range(batch_size):
+        entry = RunCache.fetch(run_cache_key(data_dict, seeds[run], run))
+        if entry is None:
+            runs.append(run)
+        else:
+            cached.append((run, fetch_run(entry, out_files, run)))
 
-    # Batch of batch_size runs
+    if cached:
+        print("Reading "+str(len(cached))+" of "+str(batch_size)+" runs from the cache.")
 
-    for run in range(batch_size):
+    # Batch of the runs to simulate, either one task per run or a single batched task
+    run_groups = ([runs] if runs else []) if batched else [[run] for run in runs]
+    tasks = [(profile_id, data_dict, group, [seeds[run] for run in group], out_files) for group in run_groups]
+
+    return tasks, out_files, cached
 
-        # Seed if defined in expt file
-        cur_seed = myseeds[run] if myseeds != None else None
+##########################################################################################################
+
+# Function for running all the profiles of an experiment on a pool of worker processes
+def run_experiment(expt_data, workers=None):
 
-        # Re-Initialize model
-        model = BuildingModel(BuildingAgent, b_data, n_agents, data_dict, seed = cur_seed)
+    tasks = []
+    out_files = {}
+    cached = []
+    for profile_id in expt_data["run_profiles"]:
+        profile_tasks, out_files[profile_id], profile_cached = setup_profile(expt_data, profile_id)
+        tasks += profile_tasks
+        cached.append((profile_id, profile_cached))
+
+    # Results arrive in any order; every profile buffers them until the
+    # next run to write is available, so the logs are always in run order
+    start_times = {profile_id:time.time() for profile_id in expt_data["run_profiles"]}
+    next_run = {profile_id:0 for profile_id in expt_data["run_profiles"]}
+    pending = {profile_id:{} for profile_id in expt_data["run_profiles"]}
+    MF_events = {profile_id:{state:[] for state in MF_npy_states} for profile_id in expt_data["run_profiles"]}
+
+    # Idle workers pick the next task, one at a time (dynamic load balancing)
+    with multiprocessing.Pool(workers) as pool:
+        # The cached runs of every profile come first
+        for profile_id, results in itertools.chain(cached, pool.imap_unordered(run_task, tasks, chunksize=1)):
+
+            pending[profile_id].update(results)
+            while next_run[profile_id] in pending[profile_id]:
+                parts = pending[profile_id].pop(next_run[profile_id])
+                if log_format == "npy" and 'MF' in parts:
+                    for state, events in parts.pop('MF').items():
+                        MF_events[profile_id][state].append(events)
+                for df_type, part in parts.items():
+                    with open(part) as part_data, open(out_files[profile_id][df_type], 'a') as out_file:
+                        shutil.copyfileobj(part_data, out_file)
+                    os.remove(part)
+                next_run[profile_id] += 1
+
+            if next_run[profile_id] == expt_data["n_batches"]:
+                # Binary MF log of the agent runs (price ensembles have none)
+                if log_format == "npy" and len(MF_events[profile_id][MF_npy_states[0]]) > 0:
+                    WriteMFEvents(out_files[profile_id]['MF'],MF_events[profile_id],n_steps,n_agents,run_seeds(expt_data))
+                elapsed_time = time.time() - start_times[profile_id]
+                print("Profile "+str(profile_id)+" took "+str(elapsed_time)+" seconds.")
 
-        # Run n_steps
-        for timestep in range(n_steps):
-            model.step()
+##########################################################################################################
 
-        # Get Data Collector Data - Once per run
-        dataframe = model.datacollector.get_agent_vars_dataframe()
+# Function for running the points of a parameter sweep on a pool of worker processes
+# Every point is a profile built in memory, and the final summaries of its runs are
+# written to a single results table, in point and run order
+def run_sweep(expt_data, workers=None):
 
-        # Write data of interest to MF csv files - Once per run
-        Write2CSV(MF_out_file,MF_data_columns,dataframe,run,n_steps,n_agents,df_type='MF')
-        Write2CSV(HF_out_file,HF_data_columns,dataframe,run,n_steps,n_agents,df_type='HF')
+    base_dict = load_profile(expt_data, sweep.get("base_profile", 0))
+    names, points = ParameterSweep.sweep_points(sweep)
 
-    elapsed_time = time.time() - start_time
+    if "price_scenarios" in base_dict:
+        raise ValueError("Parameter sweeps do not support price scenarios")
+    if batched and engine != "vector":
+        raise ValueError("Batched runs need the vector engine")
 
-    print("Profile "+str(profile_id)+" took "+str(elapsed_time)+" seconds.")
+    print("****************************************")
+    print(" SWEEPING " + str(len(points)) + " POINTS OF " + expt_data["experiment_name"] + " (" + engine + " engine)")
+    print("****************************************")
+
+    # Results table, one row per point and run
+    log_dir = "Datalogs/Logs/"+expt_data["experiment_name"]
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    results_file = log_dir + "/Sweep.csv"
+    part_file = results_file + ".part"
+    meta_file = log_dir + "/Sweep.json"
+    columns = summary_columns(sweep_reducers,{col:dtype for col, (attr, dtype) in AgentRecorder.reporters.items()})
+
+    batch_size = expt_data["n_batches"]
+    seeds = run_seeds(expt_data)
+
+    # Evaluations of previous sweeps with the same settings and model code (the last complete table,
+    # and the partial one of an interrupted sweep) are reused, so an extended study only simulates its new points
+    meta = {"base_profile": base_dict, "n_time_steps": n_steps, "engine": engine, "reducers": sweep_reducers,
+            "model": RunCache.model_version([b_data_file])}
+    evaluations = ParameterSweep.load_evaluations([(results_file, meta_file), (part_file, meta_file + ".part")], meta, names, columns)
+
+    # The table is written next to the previous one, which it only replaces when complete
+    InitializeCSV(part_file,['Seed']+names+columns,['Point','Run'])
+    ParameterSweep.write_meta(meta_file + ".part", meta)
+
+    # Runs of every point still to simulate, split like a profile in one task per run or a single batched task
+    pending = collections.defaultdict(dict)
+    tasks = []
+    for point_id, point in enumerate(points):
+        runs = []
+        for run in range(batch_size):
+            key = ParameterSweep.evaluation_key(point, seeds[run])
+            if seeds[run] is not None and key in evaluations:
+                pending[point_id][run] = {'Sweep': evaluations[key]}
+            else:
+                runs.append(run)
+
+        run_groups = ([runs] if runs else []) if batched else [[run] for run in runs]
+        tasks += [(point_id, ParameterSweep.point_profile(base_dict, point), group, [seeds[run] for run in group], None) for group in run_groups]
+
+    print("Reusing "+str(len(points)*batch_size - sum(len(task[2]) for task in tasks))+" of "+str(len(points)*batch_size)+" evaluations.")
+
+    start_time = time.time()
+    next_point = 0
+
+    with multiprocessing.Pool(workers) as pool:
+        done = pool.imap_unordered(run_task, tasks, chunksize=1)
+        while next_point < len(points):
+
+            # Wait for the next task until the next point to write is complete
+            if len(pending[next_point]) < batch_size:
+                point_id, results = next(done)
+                pending[point_id].update(results)
+                continue
+
+            finals = pending.pop(next_point)
+            rows = pd.DataFrame([dict(Point=next_point, Run=run, Seed=seeds[run], **points[next_point], **finals[run]['Sweep']) for run in range(batch_size)])
+            rows.set_index(['Point','Run'])[['Seed']+names+columns].to_csv(part_file, sep=';', mode='a', header=False)
+            next_point += 1
+
+            if next_point % max(1, len(points)//20) == 0:
+                print("Point "+str(next_point)+" of "+str(len(points))+" after "+str(time.time() - start_time)+" seconds.")
+
+    # The settings hold the hash of the new table, so the previous one is never reused with them
+    ParameterSweep.write_meta(meta_file, meta, part_file)
+    os.replace(part_file, results_file)
+    os.remove(meta_file + ".part")
 
 ##########################################################################################################
 
@@ -151,16 +568,11 @@ if __name__ == '__main__':
     # Start profiling time
     model_start_time = time.time()
 
-    processes = []
-
-    for profile_id in expt_data["run_profiles"]:
-        p = multiprocessing.Process(target=run_profile, args=(expt_data,profile_id,))
-        processes.append(p)
-        p.start()
-        
-    for process in processes:
-        process.join()
+    if sweep is None:
+        run_experiment(expt_data, args.workers)
+    else:
+        run_sweep(expt_data, args.workers)
 
     # Profiling Ends and Delta reported
     model_elapsed_time = time.time() - model_start_time
-    print("Experiment simulated in "+str(model_elapsed_time)+" seconds.")
\ No newline at end of file
+    print("Experiment simulated in "+str(model_elapsed_time)+" seconds.")